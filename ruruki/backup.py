@@ -0,0 +1,291 @@
+"""
+Point-in-time backups of :class:`~.PersistentGraph`, streamed to a tar
+archive holding the same layout as the graph path.
+"""
+import io
+import json
+import posixpath
+import tarfile
+import time
+from ruruki import interfaces
+
+
+def persisted_properties(entity):
+    """
+    Return a copy of the properties of a entity as they are written to
+    disk.
+
+    :param entity: Vertex or edge.
+    :type entity: :class:`~.IEntity`
+    :returns: Copy of the properties.
+    :rtype: :class:`dict`
+    """
+    return dict(
+        (key, value)
+        for key, value in entity.properties.items()
+        if key != "_path"
+    )
+
+
+class Snapshot(object):
+    """
+    Point-in-time view of a persistent graph used while writing a backup.
+
+    The vertices, edges and constraints are captured straight away, and the
+    properties are read when they are written to the backup, unless the
+    vertex or edge is changed first, in which case its properties are
+    captured before the change.
+
+    :param graph: Graph to snapshot. Must be called with the graph
+        mutation lock held.
+    :type graph: :class:`~.PersistentGraph`
+    :param ids: Identity number counters and free lists of the graph, see
+        :meth:`~.IDGenerator.get_state`.
+    :type ids: :class:`dict`
+    """
+
+    def __init__(self, graph, ids):
+        self.vertices = list(graph.vertices)
+        self.edges = list(graph.edges)
+        self.constraints = [
+            {"label": label, "key": key}
+            for label, key in graph.get_vertex_constraints()
+        ]
+        self.state = dict(ids, clean=True)
+        self._members = set(self.vertices)
+        self._members.update(self.edges)
+        self._captured = {}
+
+    def capture(self, entity):
+        """
+        Keep the current properties of a vertex or edge that is about to
+        be changed. Must be called with the graph mutation lock held.
+
+        :param entity: Vertex or edge about to be changed.
+        :type entity: :class:`~.IEntity`
+        """
+        if entity in self._members and entity not in self._captured:
+            self._captured[entity] = persisted_properties(entity)
+
+    def properties(self, entity):
+        """
+        Return the properties of a vertex or edge as they were when the
+        snapshot was taken. Must be called with the graph mutation lock
+        held.
+
+        :param entity: Vertex or edge in the snapshot.
+        :type entity: :class:`~.IEntity`
+        :returns: The properties.
+        :rtype: :class:`dict`
+        """
+        if entity in self._captured:
+            return self._captured.pop(entity)
+        return persisted_properties(entity)
+
+
+def _tar_info(name, entry_type, mode):
+    """
+    Internal helper function to create a tar archive entry.
+
+    :param name: Entry name.
+    :type name: :class:`str`
+    :param entry_type: Tar entry type.
+    :type entry_type: :class:`bytes`
+    :param mode: Permission bits.
+    :type mode: :class:`int`
+    :returns: The entry, without a modification time.
+    :rtype: :class:`tarfile.TarInfo`
+    """
+    info = tarfile.TarInfo(name)
+    info.type = entry_type
+    info.mode = mode
+    return info
+
+
+class ArchiveWriter(object):
+    """
+    Helper adding directories, JSON files and symlinks to a tar archive,
+    adding the parent directories which are not in the archive yet.
+
+    :param archive: Archive opened for writing.
+    :type archive: :class:`tarfile.TarFile`
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.mtime = time.time()
+        self._directories = set()
+
+    def _add(self, info, fileobj=None):
+        """
+        Add an entry to the archive.
+
+        :param info: Entry, see :func:`_tar_info`.
+        :type info: :class:`tarfile.TarInfo`
+        :param fileobj: Content of a file entry.
+        :type fileobj: file or :obj:`None`
+        """
+        info.mtime = self.mtime
+        self.archive.addfile(info, fileobj)
+
+    def add_directory(self, name):
+        """
+        Add a directory and its missing parent directories.
+
+        :param name: Directory name.
+        :type name: :class:`str`
+        """
+        if not name or name in self._directories:
+            return
+        self.add_directory(posixpath.dirname(name))
+        self._directories.add(name)
+        self._add(_tar_info(name, tarfile.DIRTYPE, 0o755))
+
+    def add_json(self, name, data):
+        """
+        Add a JSON encoded file.
+
+        :param name: File name.
+        :type name: :class:`str`
+        :param data: Data to JSON encode.
+        :type data: :class:`dict` or :class:`list`
+        """
+        self.add_file(name, json.dumps(data).encode("utf-8"))
+
+    def add_file(self, name, content):
+        """
+        Add a file.
+
+        :param name: File name.
+        :type name: :class:`str`
+        :param content: File content.
+        :type content: :class:`bytes`
+        """
+        self.add_directory(posixpath.dirname(name))
+        info = _tar_info(name, tarfile.REGTYPE, 0o644)
+        info.size = len(content)
+        self._add(info, io.BytesIO(content))
+
+    def add_symlink(self, name, target):
+        """
+        Add a symlink.
+
+        :param name: Symlink name.
+        :type name: :class:`str`
+        :param target: Path the symlink points to.
+        :type target: :class:`str`
+        """
+        self.add_directory(posixpath.dirname(name))
+        info = _tar_info(name, tarfile.SYMTYPE, 0o777)
+        info.linkname = target
+        self._add(info)
+
+
+def _entity_path(entity):
+    """
+    Internal helper function to build the path of a vertex or edge in the
+    archive.
+
+    :param entity: Vertex or edge.
+    :type entity: :class:`~.IEntity`
+    :returns: The path, relative to the root of the archive.
+    :rtype: :class:`str`
+    """
+    if isinstance(entity, interfaces.IVertex):
+        return "vertices/{0}/{1}".format(entity.label, entity.ident)
+    return "edges/{0}/{1}".format(entity.label, entity.ident)
+
+
+def _add_vertex(writer, codec, vertex, properties):
+    """
+    Internal helper function to add a vertex directory to the archive.
+
+    :param writer: Archive writer.
+    :type writer: :class:`ArchiveWriter`
+    :param codec: Codec to encode the properties file with.
+    :type codec: :class:`~.PropertyCodec`
+    :param vertex: Vertex to add.
+    :type vertex: :class:`~.IVertex`
+    :param properties: Properties of the vertex in the snapshot.
+    :type properties: :class:`dict`
+    """
+    vertex_path = _entity_path(vertex)
+    writer.add_directory(vertex_path + "/in-edges")
+    writer.add_directory(vertex_path + "/out-edges")
+    writer.add_file(
+        vertex_path + "/properties.json",
+        codec.encode("vertices/" + vertex.label, properties, learn=False),
+    )
+
+
+def _add_edge(writer, codec, edge, properties):
+    """
+    Internal helper function to add a edge directory, and the relative
+    symlinks between the edge and its head and tail, to the archive.
+
+    :param writer: Archive writer.
+    :type writer: :class:`ArchiveWriter`
+    :param codec: Codec to encode the properties file with.
+    :type codec: :class:`~.PropertyCodec`
+    :param edge: Edge to add.
+    :type edge: :class:`~.IEdge`
+    :param properties: Properties of the edge in the snapshot.
+    :type properties: :class:`dict`
+    """
+    edge_path = _entity_path(edge)
+    head_path = _entity_path(edge.head)
+    tail_path = _entity_path(edge.tail)
+    writer.add_file(
+        edge_path + "/properties.json",
+        codec.encode("edges/" + edge.label, properties, learn=False),
+    )
+    for name, target in [
+            ("{0}/head/{1}".format(edge_path, edge.head.ident), head_path),
+            ("{0}/tail/{1}".format(edge_path, edge.tail.ident), tail_path),
+            ("{0}/out-edges/{1}".format(head_path, edge.ident), edge_path),
+            ("{0}/in-edges/{1}".format(tail_path, edge.ident), edge_path),
+    ]:
+        writer.add_symlink(name, "../../../../" + target)
+
+
+def write_archive(snapshot, dest_fh, codec, lock, compress=True):
+    """
+    Stream a backup archive of a snapshot.
+
+    :param snapshot: Snapshot to write.
+    :type snapshot: :class:`Snapshot`
+    :param dest_fh: Binary file object to write the archive to.
+    :type dest_fh: file
+    :param codec: Codec to encode the properties files with.
+    :type codec: :class:`~.PropertyCodec`
+    :param lock: Mutation lock of the graph, held while the properties of
+        a vertex or edge are read from the snapshot.
+    :type lock: :class:`threading.RLock`
+    :param compress: If True, compress the archive with gzip.
+    :type compress: :class:`bool`
+    :returns: Number of vertices and edges in the backup.
+    :rtype: :class:`int`
+    """
+    mode = "w|gz" if compress is True else "w|"
+    archive = tarfile.open(fileobj=dest_fh, mode=mode)
+    try:
+        writer = ArchiveWriter(archive)
+        writer.add_directory("vertices")
+        writer.add_directory("edges")
+        writer.add_json("vertices/constraints.json", snapshot.constraints)
+        writer.add_json("state.json", snapshot.state)
+
+        for add, entities in [(_add_vertex, snapshot.vertices),
+                              (_add_edge, snapshot.edges)]:
+            for entity in entities:
+                with lock:
+                    properties = snapshot.properties(entity)
+                add(writer, codec, entity, properties)
+
+        # added last, to include any dictionary used by the properties.
+        for name, content in codec.dictionaries():
+            writer.add_file("dictionaries/" + name, content)
+    finally:
+        archive.close()
+
+    return len(snapshot.vertices) + len(snapshot.edges)
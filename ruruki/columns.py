@@ -0,0 +1,296 @@
+"""
+Columnar storage for the properties of the vertices or edges sharing a
+label, see :meth:`~.Graph.add_column_store`.
+"""
+from collections import MutableMapping
+from ruruki.entities import NUMBER_TYPES, OPERATORS
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+# placeholder for a missing value in a column.
+MISSING = object()
+
+# comparisons of numeric columns which are evaluated with numpy.
+VECTORIZED_OPERATORS = {
+    None: lambda array, value: array == value,
+    "eq": lambda array, value: array == value,
+    "ne": lambda array, value: array != value,
+    "le": lambda array, value: array <= value,
+    "lt": lambda array, value: array < value,
+    "ge": lambda array, value: array >= value,
+    "gt": lambda array, value: array > value,
+}
+
+
+class ColumnStore(object):
+    """
+    Columnar storage for the properties of all the vertices or edges with
+    the same label, holding one list of values per property key indexed by
+    a dense row number, instead of one dictionary per entity.
+
+    The entities present their properties as a :class:`ColumnProperties`
+    mapping view onto their row, see :meth:`~.Graph.add_column_store`.
+    Rows of removed entities are reused.
+
+    When :mod:`numpy` is installed, comparisons of columns holding only
+    numbers are evaluated on a typed array of the column, built on the
+    first scan and kept until the column changes.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self._entities = []
+        self._free = []
+        self._arrays = {}
+
+    def __len__(self):
+        return len(self._entities) - len(self._free)
+
+    def allocate(self, entity, properties):
+        """
+        Allocate a row for an entity.
+
+        :param entity: Entity owning the row.
+        :type entity: :class:`~.IEntity`
+        :param properties: Initial properties of the entity.
+        :type properties: :class:`dict`
+        :returns: Mapping view onto the row.
+        :rtype: :class:`ColumnProperties`
+        """
+        if self._free:
+            row = self._free.pop()
+            self._entities[row] = entity
+        else:
+            row = len(self._entities)
+            self._entities.append(entity)
+            for column in self.columns.values():
+                column.append(MISSING)
+            self._arrays.clear()
+
+        for key, value in properties.items():
+            self.set(row, key, value)
+        return ColumnProperties(self, row)
+
+    def release(self, row):
+        """
+        Release the row of a removed entity, to be reused.
+
+        :param row: Row number.
+        :type row: :class:`int`
+        """
+        for column in self.columns.values():
+            column[row] = MISSING
+        self._entities[row] = None
+        self._free.append(row)
+        self._arrays.clear()
+
+    def set(self, row, key, value):
+        """
+        Set the value of a property of a row.
+
+        :param row: Row number.
+        :type row: :class:`int`
+        :param key: Property key.
+        :type key: :class:`str`
+        :param value: Property value.
+        :type value: :class:`object`
+        """
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = [MISSING] * len(self._entities)
+        column[row] = value
+        self._arrays.pop(key, None)
+
+    def discard(self, row, key):
+        """
+        Remove a property from a row.
+
+        :param row: Row number.
+        :type row: :class:`int`
+        :param key: Property key.
+        :type key: :class:`str`
+        :raises KeyError: If the row does not have the property.
+        """
+        column = self.columns.get(key)
+        if column is None or column[row] is MISSING:
+            raise KeyError(key)
+        column[row] = MISSING
+        self._arrays.pop(key, None)
+
+    def array(self, key):
+        """
+        Return the typed array of a column holding only numbers.
+
+        :param key: Property key.
+        :type key: :class:`str`
+        :returns: The values, and a mask of the rows holding a value, or
+            :obj:`None` if :mod:`numpy` is not installed or the column
+            holds other values than numbers.
+        :rtype: :class:`tuple` of :class:`numpy.ndarray` or :obj:`None`
+        """
+        if numpy is None or key not in self.columns:
+            return None
+
+        if key not in self._arrays:
+            column = self.columns[key]
+            present = numpy.fromiter(
+                (each is not MISSING and each is not None for each in column),
+                dtype=bool,
+                count=len(column),
+            )
+            values = [
+                each for each, flag in zip(column, present) if flag
+            ]
+            types = set(type(each) for each in values)
+            array = None
+            # only columns of a single number type, so bool columns and
+            # ints mixed with floats keep their exact comparisons.
+            if len(types) == 1 and types.pop() in NUMBER_TYPES:
+                dtype = numpy.array(values).dtype
+                # integers too large for a machine integer are objects.
+                if dtype.kind in "if":
+                    array = numpy.zeros(len(column), dtype=dtype)
+                    array[present] = values
+            self._arrays[key] = None if array is None else (array, present)
+        return self._arrays[key]
+
+    def scan(self, key, verb, value):
+        """
+        Scan a column for the rows matching a filter.
+
+        :param key: Property key.
+        :type key: :class:`str`
+        :param verb: Filter operator, see :data:`~.OPERATORS`, or :obj:`None`
+            for equality.
+        :type verb: :class:`str` or :obj:`None`
+        :param value: Value compared against.
+        :type value: :class:`object`
+        :returns: The entities of the rows that match.
+        :rtype: :class:`set` of :class:`~.IEntity`
+        """
+        column = self.columns.get(key)
+        if column is None:
+            return set()
+
+        entities = self._entities
+        vectorized = VECTORIZED_OPERATORS.get(verb)
+        if (vectorized is not None and
+                type(value) in NUMBER_TYPES):  # pylint: disable=unidiomatic-typecheck
+            arrays = self.array(key)
+            if arrays is not None:
+                array, present = arrays
+                try:
+                    mask = present & vectorized(array, value)
+                except (OverflowError, TypeError):
+                    mask = None
+                if mask is not None:
+                    return set(
+                        entities[row] for row in numpy.flatnonzero(mask)
+                    )
+
+        func = OPERATORS.get(verb)
+        if func is None:
+            return set(
+                entities[row] for row, prop in enumerate(column)
+                if prop is not MISSING and prop is not None and prop == value
+            )
+
+        icase = verb[0] == "i"
+        return set(
+            entities[row] for row, prop in enumerate(column)
+            if prop is not MISSING and prop is not None and
+            func(prop, value, icase)
+        )
+
+
+class ColumnProperties(MutableMapping):
+    """
+    Mapping view onto the row of an entity in a :class:`ColumnStore`, which
+    behaves like the properties dictionary of the entity.
+
+    :param store: Column store holding the row.
+    :type store: :class:`ColumnStore`
+    :param row: Row number.
+    :type row: :class:`int`
+    """
+    __slots__ = ["store", "row"]
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, key):
+        column = self.store.columns.get(key)
+        if column is None:
+            raise KeyError(key)
+        value = column[self.row]
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.set(self.row, key, value)
+
+    def __delitem__(self, key):
+        self.store.discard(self.row, key)
+
+    def __contains__(self, key):
+        column = self.store.columns.get(key)
+        return column is not None and column[self.row] is not MISSING
+
+    def __iter__(self):
+        row = self.row
+        for key, column in list(self.store.columns.items()):
+            if column[row] is not MISSING:
+                yield key
+
+    def __len__(self):
+        row = self.row
+        return sum(
+            1 for column in self.store.columns.values()
+            if column[row] is not MISSING
+        )
+
+    def copy(self):
+        """
+        Return a copy of the properties.
+
+        :returns: Copy of the properties.
+        :rtype: :class:`dict`
+        """
+        return dict(self.items())
+
+    def __repr__(self):  # pragma: no cover
+        return repr(self.copy())
+
+
+def columnize(entity, store):
+    """
+    Move the properties of a vertex or edge into a column store.
+
+    :param entity: Vertex or edge.
+    :type entity: :class:`~.IEntity`
+    :param store: Column store of the label of the entity.
+    :type store: :class:`ColumnStore`
+    """
+    if hasattr(entity, "pin_properties"):
+        entity.pin_properties()
+    entity.properties = store.allocate(entity, entity.properties)
+
+
+def decolumnize(entity):
+    """
+    Move the properties of a removed vertex or edge out of its column
+    store, if it has one.
+
+    :param entity: Vertex or edge.
+    :type entity: :class:`~.IEntity`
+    """
+    properties = entity.properties
+    if isinstance(properties, ColumnProperties):
+        entity.properties = properties.copy()
+        properties.store.release(properties.row)
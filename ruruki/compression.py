@@ -0,0 +1,457 @@
+"""
+Compression of the properties files written by :class:`~.PersistentGraph`,
+and interning of repeated property values, labels and property keys.
+
+Compressed properties files start with a small header naming the codec and
+the shared dictionary used, followed by the compressed JSON encoded
+properties. Files without the header are plain JSON, so graphs can switch
+compression on or off at any time and hold a mix of both.
+
+With ``zlib`` the properties of each vertex and edge label are compressed
+against a dictionary shared by the label, built from the first properties
+written for the label. The small properties files of a label repeat the
+same keys and often the same values, which a dictionary lets zlib remove
+even from a single file. The dictionaries are kept in the ``dictionaries``
+directory of the graph path, and never change once written::
+
+    path
+       |_ dictionaries
+             |_ labels.json (file)
+             |_ 1f2e3d4c (file)
+"""
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import zlib
+from ruruki.journal import SYNC_DIRECTORIES, fsync_path
+
+try:
+    import lzma
+except ImportError:  # pragma: no cover
+    lzma = None
+
+try:
+    STRING_TYPES = (str, unicode)  # pylint: disable=undefined-variable
+except NameError:
+    STRING_TYPES = (str,)
+
+try:
+    _intern = intern  # pylint: disable=undefined-variable
+except NameError:
+    _intern = sys.intern
+
+
+MAGIC = b"\x00RZ"
+
+HEADER = struct.Struct(">3scI")
+
+CODECS = {"zlib": b"z", "lzma": b"x"}
+
+CODEC_ERRORS = (zlib.error,) if lzma is None else (zlib.error, lzma.LZMAError)
+
+# zlib only accepts a preset dictionary from Python 3.3.
+ZDICT_SUPPORTED = sys.version_info >= (3, 3)
+
+
+class MissingDictionary(ValueError):
+    """
+    Raised when properties were compressed with a shared dictionary which
+    does not exist.
+    """
+
+
+def available_codecs():
+    """
+    Return the compression codecs supported by this Python.
+
+    :returns: Codec names.
+    :rtype: :class:`list` of :class:`str`
+    """
+    codecs = ["zlib"]
+    if lzma is not None:
+        codecs.append("lzma")
+    return codecs
+
+
+def has_header(data):
+    """
+    Check whether the content of a properties file starts with a valid
+    compression header.
+
+    :param data: Content of a properties file.
+    :type data: :class:`bytes`
+    :returns: True if the content has a header naming a known codec.
+    :rtype: :class:`bool`
+    """
+    if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+        return False
+    _, codec, _ = HEADER.unpack_from(data)
+    return codec in CODECS.values()
+
+
+def _write_file(filename, data):
+    """
+    Atomically and durably replace a file by writing a temporary file and
+    renaming it over the file.
+
+    :param filename: File to write.
+    :type filename: :class:`str`
+    :param data: Content to write.
+    :type data: :class:`bytes`
+    """
+    with open(filename + ".tmp", "wb") as data_fh:
+        data_fh.write(data)
+        data_fh.flush()
+        os.fsync(data_fh.fileno())
+    os.rename(filename + ".tmp", filename)
+    if SYNC_DIRECTORIES:
+        fsync_path(os.path.dirname(filename))
+
+
+class PropertyCodec(object):
+    """
+    Encoder and decoder of properties files.
+
+    Properties are always decoded, whatever codec they were written with,
+    and only encoded with ``compression`` if it is set.
+
+    .. note::
+
+        The ``lzma`` codec does not support shared dictionaries, and
+        neither does ``zlib`` before Python 3.3.
+
+    :param path: Directory holding the shared dictionaries.
+    :type path: :class:`str`
+    :param compression: Codec used to encode properties, ``zlib`` or
+        ``lzma``, or :obj:`None` to write plain JSON.
+    :type compression: :class:`str` or :obj:`None`
+    :param sample_size: Number of properties written for a label which are
+        used to build its dictionary.
+    :type sample_size: :class:`int`
+    :param dictionary_size: Maximum size of a dictionary in bytes.
+    :type dictionary_size: :class:`int`
+    :raises ValueError: If the compression codec is not available.
+    """
+
+    def __init__(self, path, compression=None, sample_size=64,
+                 dictionary_size=32 * 1024):
+        if compression is not None and compression not in available_codecs():
+            raise ValueError(
+                "Unsupported compression {0!r}, use one of {1!r}.".format(
+                    compression, available_codecs()
+                )
+            )
+        self.path = path
+        self.compression = compression
+        self.sample_size = sample_size
+        self.dictionary_size = dictionary_size
+        self._lock = threading.Lock()
+        self._dictionaries = {}
+        self._samples = {}
+        self._labels = self._read_labels()
+
+    @property
+    def labels_path(self):
+        """
+        Path of the file mapping the labels to their dictionaries.
+        """
+        return os.path.join(self.path, "labels.json")
+
+    def _read_labels(self):
+        """
+        Read the dictionary ids of the labels.
+
+        :returns: Dictionary id keyed by kind and label.
+        :rtype: :class:`dict`
+        """
+        try:
+            with open(self.labels_path) as labels_fh:
+                return json.load(labels_fh)
+        except (IOError, ValueError):
+            return {}
+
+    def dictionary(self, ident):
+        """
+        Return a shared dictionary.
+
+        :param ident: Dictionary id.
+        :type ident: :class:`int`
+        :returns: The dictionary.
+        :rtype: :class:`bytes`
+        :raises MissingDictionary: If the dictionary does not exist.
+        """
+        dictionary = self._dictionaries.get(ident)
+        if dictionary is None:
+            try:
+                with open(os.path.join(self.path, "{0:08x}".format(ident)),
+                          "rb") as dict_fh:
+                    dictionary = dict_fh.read()
+            except IOError:
+                raise MissingDictionary(
+                    "Missing compression dictionary {0:08x}".format(ident)
+                )
+            self._dictionaries[ident] = dictionary
+        return dictionary
+
+    def dictionaries(self):
+        """
+        Return the shared dictionaries, including the labels file.
+
+        :returns: File names and contents.
+        :rtype: :class:`list` of :class:`tuple`
+        """
+        files = []
+        with self._lock:
+            labels = dict(self._labels)
+        for ident in sorted(set(labels.values())):
+            files.append(("{0:08x}".format(ident), self.dictionary(ident)))
+        if labels:
+            files.append(
+                ("labels.json", json.dumps(labels, sort_keys=True).encode())
+            )
+        return files
+
+    def _dictionary_id(self, dictionary):
+        """
+        Pick the id of a new dictionary, which is its checksum unless a
+        different dictionary already has that id.
+
+        :param dictionary: The new dictionary.
+        :type dictionary: :class:`bytes`
+        :returns: Dictionary id.
+        :rtype: :class:`int`
+        """
+        ident = zlib.adler32(dictionary) & 0xffffffff or 1
+        while True:
+            try:
+                existing = self.dictionary(ident)
+            except MissingDictionary:
+                return ident
+            if existing == dictionary:
+                return ident
+            ident = (ident + 1) & 0xffffffff or 1
+
+    def _learn(self, name, data):
+        """
+        Keep the properties written for a label without a dictionary, and
+        build its dictionary once enough have been written.
+
+        :param name: Kind and label, for example ``vertices/person``.
+        :type name: :class:`str`
+        :param data: JSON encoded properties.
+        :type data: :class:`bytes`
+        """
+        samples = self._samples.setdefault(name, [])
+        samples.append(data)
+        if len(samples) < self.sample_size:
+            return
+
+        # zlib prefers the strings used most at the end of the dictionary.
+        dictionary = b"".join(samples)[-self.dictionary_size:]
+        ident = self._dictionary_id(dictionary)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        _write_file(os.path.join(self.path, "{0:08x}".format(ident)),
+                    dictionary)
+
+        labels = dict(self._labels)
+        labels[name] = ident
+        _write_file(
+            self.labels_path,
+            json.dumps(labels, sort_keys=True).encode("utf-8"),
+        )
+        self._dictionaries[ident] = dictionary
+        self._labels = labels
+        del self._samples[name]
+        logging.info("Built compression dictionary for %r", name)
+
+    def encode(self, name, properties, learn=True):
+        """
+        Encode properties to be written to a properties file.
+
+        :param name: Kind and label of the vertex or edge, for example
+            ``vertices/person``.
+        :type name: :class:`str`
+        :param properties: Properties to encode.
+        :type properties: :class:`dict`
+        :param learn: If True, use the properties to build the dictionary of
+            the label if it does not have one yet.
+        :type learn: :class:`bool`
+        :returns: Encoded properties.
+        :rtype: :class:`bytes`
+        """
+        data = json.dumps(properties, sort_keys=True).encode("utf-8")
+        if self.compression is None:
+            return data
+
+        if self.compression == "lzma":
+            return HEADER.pack(MAGIC, CODECS["lzma"], 0) + lzma.compress(data)
+
+        ident = 0
+        compressor = zlib.compressobj(9)
+        if ZDICT_SUPPORTED:
+            with self._lock:
+                ident = self._labels.get(name, 0)
+                if ident == 0 and learn is True:
+                    self._learn(name, data)
+            if ident != 0:
+                compressor = zlib.compressobj(
+                    9, zdict=self.dictionary(ident)
+                )
+
+        return (
+            HEADER.pack(MAGIC, CODECS["zlib"], ident) +
+            compressor.compress(data) +
+            compressor.flush()
+        )
+
+    def decode(self, data):
+        """
+        Decode the content of a properties file.
+
+        :param data: Content of a properties file.
+        :type data: :class:`bytes`
+        :returns: The properties.
+        :rtype: :class:`dict`
+        :raises ValueError: If the properties can not be decoded.
+        """
+        if data[:len(MAGIC)] == MAGIC:
+            try:
+                _, codec, ident = HEADER.unpack_from(data)
+            except struct.error as error:
+                raise ValueError(str(error))
+            payload = data[HEADER.size:]
+
+            try:
+                if codec == CODECS["zlib"]:
+                    if ident == 0:
+                        data = zlib.decompress(payload)
+                    elif not ZDICT_SUPPORTED:
+                        raise ValueError(
+                            "Properties compressed with a dictionary need "
+                            "Python 3.3 or later."
+                        )
+                    else:
+                        decompressor = zlib.decompressobj(
+                            zdict=self.dictionary(ident)
+                        )
+                        data = (
+                            decompressor.decompress(payload) +
+                            decompressor.flush()
+                        )
+                elif codec == CODECS["lzma"] and lzma is not None:
+                    data = lzma.decompress(payload)
+                else:
+                    raise ValueError(
+                        "Unsupported properties codec {0!r}".format(codec)
+                    )
+            except CODEC_ERRORS as error:
+                raise ValueError(str(error))
+
+        properties = json.loads(data.decode("utf-8"))
+        if not isinstance(properties, dict):
+            raise ValueError("Properties are not a mapping")
+        return properties
+
+
+class Interner(object):
+    """
+    Table of string values shared by all the properties loaded, so that
+    repeated values are only held in memory once.
+
+    :param max_length: Only strings up to this length are interned, longer
+        strings are seldom repeated.
+    :type max_length: :class:`int`
+    """
+
+    def __init__(self, max_length=64):
+        self.max_length = max_length
+        self._strings = {}
+
+    def __len__(self):
+        return len(self._strings)
+
+    def intern(self, value):
+        """
+        Return the shared copy of a value.
+
+        :param value: Value to intern.
+        :type value: :class:`object`
+        :returns: The shared copy of the value if it is a string, otherwise
+            the value.
+        :rtype: :class:`object`
+        """
+        if (isinstance(value, STRING_TYPES) and
+                len(value) <= self.max_length):
+            return self._strings.setdefault(value, value)
+        return value
+
+    def intern_properties(self, properties):
+        """
+        Intern the string values of properties in place.
+
+        :param properties: Properties to intern.
+        :type properties: :class:`dict`
+        :returns: The properties.
+        :rtype: :class:`dict`
+        """
+        for key, value in properties.items():
+            properties[key] = self.intern(value)
+        return properties
+
+
+class SymbolTable(object):
+    """
+    Table of the labels and property keys of a graph, so that each of them
+    is held in memory once however many vertices and edges use it.
+
+    The symbols are also interned by the interpreter, which makes them the
+    same objects as the identifiers and keyword arguments used in code, so
+    that dictionary lookups keyed on them are identity matches.
+    """
+
+    def __init__(self):
+        self._symbols = {}
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def intern(self, value):
+        """
+        Return the shared copy of a label or property key.
+
+        :param value: Label or property key.
+        :type value: :class:`str` or :obj:`None`
+        :returns: The shared copy of the value if it is a string, otherwise
+            the value.
+        :rtype: :class:`str` or :obj:`None`
+        """
+        if not isinstance(value, STRING_TYPES):
+            return value
+
+        symbol = self._symbols.get(value)
+        if symbol is None:
+            try:
+                symbol = _intern(value)
+            except TypeError:
+                # Python 2 only interns byte strings.
+                symbol = value
+            symbol = self._symbols.setdefault(symbol, symbol)
+        return symbol
+
+    def intern_keys(self, properties):
+        """
+        Return a copy of properties keyed by the shared property keys.
+
+        :param properties: Properties to intern.
+        :type properties: :class:`dict`
+        :returns: The properties with interned keys.
+        :rtype: :class:`dict`
+        """
+        intern = self.intern
+        return dict(
+            (intern(key), value) for key, value in properties.items()
+        )
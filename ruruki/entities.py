@@ -3,6 +3,11 @@ Entities
 """
 from ruruki import interfaces
 
+try:
+    NUMBER_TYPES = (int, long, float)  # pylint: disable=undefined-variable
+except NameError:
+    NUMBER_TYPES = (int, float)
+
 
 class Entity(interfaces.IEntity):
     """
@@ -40,6 +45,16 @@ class Entity(interfaces.IEntity):
     def is_bound(self):
         return self.graph is not None
 
+    def is_loaded(self):
+        """
+        Return True if the entity properties are resident in memory.
+
+        :returns: True if accessing the properties will not need to read
+            them from a backing store first.
+        :rtype: :class:`bool`
+        """
+        return True
+
     def remove_property(self, key):
         if key in self.properties:
             del self.properties[key]
@@ -59,7 +74,7 @@ class Entity(interfaces.IEntity):
 
     def as_dict(self, include_privates=False):
         if include_privates is True:
-            properties = self.properties
+            properties = dict(self.properties)
         else:
             properties = {
                 key: value
@@ -211,14 +226,92 @@ class Vertex(interfaces.IVertex, Entity):
         return as_dict
 
 
-class PersistentVertex(Vertex):
+class DeferredPropertiesMixin(object):
+    """
+    Mixin for persistent entities which allows the properties to be read
+    from disk on first access instead of when the entity is loaded.
+
+    Deferred properties are loaded through a property cache which bounds
+    the number of entities with resident properties. See
+    :class:`~.PropertyCache`.
+
+    .. note::
+
+        Classes using this mixin need to provide ``_properties`` and
+        ``_property_cache`` slots.
+    """
+    # the slots are declared by the subclasses, as declaring them here as
+    # well would conflict with the layout of the entity classes, so pylint
+    # can not see them.
+    # pylint: disable=assigning-non-slot
+    __slots__ = []
+
+    @property
+    def properties(self):
+        """
+        Entity properties, read from the property cache if they are not
+        resident in memory.
+        """
+        properties = self._properties
+        if properties is None:
+            properties = self._properties = self._property_cache.load(self)
+        elif self._property_cache is not None:
+            self._property_cache.touch(self)
+        return properties
+
+    @properties.setter
+    def properties(self, value):
+        self._properties = value
+
+    def is_loaded(self):
+        """
+        Return True if the properties are resident in memory.
+
+        :returns: True if the properties do not need to be read.
+        :rtype: :class:`bool`
+        """
+        return self._properties is not None
+
+    def defer_properties(self, cache):
+        """
+        Drop the resident properties and read them through the given cache
+        on the next access.
+
+        :param cache: Cache used to load and bound the properties.
+        :type cache: :class:`~.PropertyCache`
+        """
+        self._properties = None
+        self._property_cache = cache
+
+    def evict_properties(self):
+        """
+        Drop the resident properties, they will be read again on the next
+        access.
+        """
+        self._properties = None
+
+    def pin_properties(self):
+        """
+        Load the properties and stop tracking them in the property cache
+        so that they are never evicted.
+        """
+        cache = self._property_cache
+        if cache is not None:
+            if self._properties is None:
+                self._properties = cache.load(self)
+            cache.discard(self)
+            self._property_cache = None
+
+
+class PersistentVertex(DeferredPropertiesMixin, Vertex):
     """
     Persistent Vertex behaves exactly the same as a :class:`~.Vertex` but has
     an additional path attribute which is the disk location.
     """
-    __slots__ = ["path"]
+    __slots__ = ["path", "_properties", "_property_cache"]
 
     def __init__(self, *args, **kwargs):
+        self._property_cache = None
         super(PersistentVertex, self).__init__(*args, **kwargs)
         self.path = None
 
@@ -289,14 +382,15 @@ class Edge(interfaces.IEdge, Entity):
         )
 
 
-class PersistentEdge(Edge):
+class PersistentEdge(DeferredPropertiesMixin, Edge):
     """
     Persistent Edge behaves exactly the same as a :class:`~.Edge` but has an
     additional path attribute which is the disk location.
     """
-    __slots__ = ["path"]
+    __slots__ = ["path", "_properties", "_property_cache"]
 
     def __init__(self, *args, **kwargs):
+        self._property_cache = None
         super(PersistentEdge, self).__init__(*args, **kwargs)
         self.path = None
 
@@ -325,6 +419,34 @@ def _split_key_into_noun_verb(key):
     return key, None
 
 
+def _matches(entity, filters):
+    """
+    Internal helper function that checks the properties of a entity
+    against filters.
+
+    :param entity: Entity being filtered.
+    :type entity: :class:`~.IEntity`
+    :param filters: Property key, operator and value of each filter, see
+        :func:`_split_key_into_noun_verb`.
+    :type filters: Iterable of :class:`tuple`
+    :returns: True if the entity matches every filter.
+    :rtype: :class:`bool`
+    """
+    properties = entity.properties
+    for key, verb, value in filters:
+        prop_value = properties.get(key)
+        if prop_value is None:
+            return False
+        func = OPERATORS.get(verb)
+        if func is None:
+            matched = prop_value == value
+        else:
+            matched = func(prop_value, value, verb[0] == "i")
+        if not matched:
+            return False
+    return True
+
+
 def _contains(prop_value, cmp_value, ignore_case=False):
     """
     Helper function that take two arguments and checks if :param cmp_value:
@@ -464,6 +586,7 @@ class EntitySet(interfaces.IEntitySet):
         super(EntitySet, self).__init__()
         self._prop_reference = {}
         self._id_reference = {}
+        self._column_stores = {}
 
         if entities is not None:
             for entity in entities:
@@ -484,6 +607,40 @@ class EntitySet(interfaces.IEntitySet):
                 if not key.startswith("_all"):
                     yield label, key
 
+    def count(self, label=None, key=None):
+        if label is None:
+            if key is None:
+                return len(self)
+            return sum(self.count(each, key) for each in self._prop_reference)
+
+        collection = self._prop_reference.get(label)
+        if collection is None:
+            return 0
+        if key is None:
+            return len(collection["_all"])
+        return (
+            len(collection.get(key, ())) +
+            len(collection.get("_all_deferred", ()))
+        )
+
+    def add_column_store(self, label, store):
+        """
+        Filter the entities with the given label by scanning the columns of
+        a column store instead of checking every entity.
+
+        .. note::
+
+            Every entity with the label in the set must have its properties
+            in the column store, and every entity in the column store must
+            be in the set.
+
+        :param label: Label of the entities in the column store.
+        :type label: :class:`str`
+        :param store: Column store of the label.
+        :type store: :class:`~.ColumnStore`
+        """
+        self._column_stores[label] = store
+
     def get(self, ident):
         entity = self._id_reference.get(ident)
         if entity is None:
@@ -501,6 +658,28 @@ class EntitySet(interfaces.IEntitySet):
         for key in kwargs:
             collection.setdefault(key, set()).add(entity)
 
+    def index_deferred(self, entity, properties):
+        """
+        Index the properties of a entity added before its properties were
+        read, so that it is no longer a candidate for every filter.
+
+        :param entity: Entity which had its properties read.
+        :type entity: :class:`~.IEntity`
+        :param properties: Properties read.
+        :type properties: :class:`dict`
+        """
+        collection = self._prop_reference.get(entity.label)
+        if collection is None:
+            return
+        deferred = collection.get("_all_deferred")
+        if deferred is None or entity not in deferred:
+            return
+        self.update_index(entity, **properties)
+        deferred.discard(entity)
+        if not deferred:
+            # the column stores can be scanned again.
+            del collection["_all_deferred"]
+
     def add(self, entity):
         if entity.ident in self._id_reference:
             if entity != self._id_reference[entity.ident]:
@@ -512,7 +691,17 @@ class EntitySet(interfaces.IEntitySet):
 
         # Add in a reference for fast id search.
         self._id_reference[entity.ident] = entity
-        self.update_index(entity, **entity.properties)
+        if entity.is_loaded():
+            self.update_index(entity, **entity.properties)
+        else:
+            # The properties have not been read yet, so only index the
+            # label and treat the entity as a candidate for every filter.
+            collection = self._prop_reference.setdefault(
+                entity.label,
+                {"_all": set()},
+            )
+            collection["_all"].add(entity)
+            collection.setdefault("_all_deferred", set()).add(entity)
 
         super(EntitySet, self).add(entity)
 
@@ -529,13 +718,18 @@ class EntitySet(interfaces.IEntitySet):
         self._prop_reference[entity.label]["_all"].discard(entity)
 
         collection = self._prop_reference[entity.label]
-        for key in entity.properties:
+        collection.get("_all_deferred", set()).discard(entity)
+        if entity.is_loaded():
+            keys = entity.properties
+        else:
+            keys = list(collection)
+        for key in keys:
             if key in collection:
                 collection[key].discard(entity)
 
         super(EntitySet, self).remove(entity)
 
-    def filter(self, label=None, **kwargs):  # pylint: disable=too-many-locals,too-many-branches
+    def filter(self, label=None, **kwargs):
         if label is None and not kwargs:
             return self
 
@@ -543,46 +737,58 @@ class EntitySet(interfaces.IEntitySet):
             if label in self._prop_reference:
                 return EntitySet(entities=self._prop_reference[label]["_all"])
 
-        keys_values = kwargs.items()
-        get_func = OPERATORS.get
-        noun_verb_cache = {
-            key: _split_key_into_noun_verb(key)
-            for key, value in keys_values
-        }
-
-        elements = set()
+        return EntitySet(self.iter_filter(label, **kwargs))
+
+    def _candidates(self, label, filters):
+        """
+        Select the entities which can match the filters, from the label and
+        property indexes, or from a scan of the column store of the label.
+
+        :param label: Label of the entities, or :obj:`None` for entities
+            with any label.
+        :type label: :class:`str` or :obj:`None`
+        :param filters: Property key, operator and value of each filter.
+        :type filters: :class:`list` of :class:`tuple`
+        :returns: The candidates, and True if they are already known to
+            match the filters.
+        :rtype: :class:`tuple` (:class:`list`, :class:`bool`)
+        """
+        # the entities are copied to a list, so that entities added or
+        # removed while iterating do not stop the iteration.
         if label is None:
-            elements = set(self._id_reference.values())
-        elif label in self._prop_reference:
-            for key, value in keys_values:
-                key, verb = noun_verb_cache[key]
-                if key not in self._prop_reference[label]:
-                    return EntitySet()
-                elements = elements | self._prop_reference[label][key]
-
-        container = EntitySet()
-        for entity in elements:
-            mismatch = False
-            for key, value in keys_values:
-                key, verb = noun_verb_cache[key]
-                icase = verb[0] == "i" if verb else False
-                func = get_func(verb)
-                if key not in entity.properties:
-                    mismatch = True
-                    break
-                prop_value = entity.properties[key]
-                if prop_value is None:
-                    mismatch = True
+            return list(self._id_reference.values()), False
+
+        collection = self._prop_reference.get(label)
+        if collection is None:
+            return [], True
+        if not filters:
+            return list(collection["_all"]), True
+
+        deferred = collection.get("_all_deferred", set())
+        store = self._column_stores.get(label)
+        if store is not None and not deferred:
+            # scan whole columns instead of each entity's properties.
+            matched = collection["_all"]
+            for key, verb, value in filters:
+                matched = store.scan(key, verb, value) & matched
+                if not matched:
                     break
-                if not func:
-                    if prop_value != value:
-                        mismatch = True
-                        break
-                elif not func(prop_value, value, icase):
-                    mismatch = True
-                    break
-
-            if not mismatch:
-                container.add(entity)
-
-        return container
+            return list(matched), True
+
+        candidates = set(deferred)
+        for key, _, _ in filters:
+            if key not in collection:
+                # only entities with unread properties can still match.
+                return list(deferred), False
+            candidates |= collection[key]
+        return list(candidates), False
+
+    def iter_filter(self, label=None, **kwargs):
+        filters = [
+            _split_key_into_noun_verb(key) + (value,)
+            for key, value in kwargs.items()
+        ]
+        candidates, matched = self._candidates(label, filters)
+        for entity in candidates:
+            if matched or _matches(entity, filters):
+                yield entity
@@ -0,0 +1,451 @@
+"""
+Integrity checker and repair tool for the directory layout written by
+:class:`~.PersistentGraph`.
+
+The vertices and edges are checked in parallel, and with ``repair`` enabled
+the problems found are fixed in place. It can also be run from the command
+line while the graph is not open::
+
+    python -m ruruki.fsck [--repair] [--jobs 4] path
+"""
+from collections import namedtuple
+import argparse
+import errno
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+import shutil
+import sys
+from ruruki import interfaces
+from ruruki.compression import MissingDictionary, PropertyCodec, has_header
+from ruruki.locks import DirectoryLock
+
+
+TEMP_PREFIX = ".tmp-"
+
+# number of vertices or edges below which they are checked in the calling
+# thread, because starting the thread pool costs more than it saves.
+PARALLEL_THRESHOLD = 256
+
+
+class Problem(namedtuple("Problem", ["path", "description", "repaired"])):
+    """
+    Problem found while checking a graph path.
+
+    :param path: Path of the file or directory with the problem.
+    :type path: :class:`str`
+    :param description: Description of the problem.
+    :type description: :class:`str`
+    :param repaired: True if the problem has been repaired.
+    :type repaired: :class:`bool`
+    """
+    __slots__ = ()
+
+
+def _remove(path):
+    """
+    Remove a file, symlink or directory tree.
+
+    :param path: Path to remove.
+    :type path: :class:`str`
+    """
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def _entity_paths(path):
+    """
+    List the entity directories of a vertices or edges path.
+
+    :param path: Vertices or edges path.
+    :type path: :class:`str`
+    :returns: Entity directories, including left over temporary ones.
+    :rtype: :class:`list` of :class:`str`
+    """
+    paths = []
+    for label in os.listdir(path):
+        label_path = os.path.join(path, label)
+        if os.path.isdir(label_path):
+            paths.extend(
+                os.path.join(label_path, each)
+                for each in os.listdir(label_path)
+            )
+    return paths
+
+
+def _read_link_id(path):
+    """
+    Return the identity number and target of the single symlink in the
+    head or tail directory of a edge.
+
+    :param path: Head or tail directory of a edge.
+    :type path: :class:`str`
+    :returns: The identity number and target, or :obj:`None` if the
+        directory does not hold a single symlink to a vertex.
+    :rtype: :class:`tuple` (:class:`int`, :class:`str`) or :obj:`None`
+    """
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return None
+
+    if len(names) != 1:
+        return None
+
+    link = os.path.join(path, names[0])
+    try:
+        ident = int(names[0])
+        # restored backups use relative symlinks.
+        target = os.path.join(path, os.readlink(link))
+    except (OSError, ValueError):
+        return None
+
+    if not os.path.isdir(target):
+        return None
+    return ident, target
+
+
+def _codec_for(path):
+    """
+    Create the codec reading the properties files of a vertex or edge.
+
+    :param path: Vertex or edge path.
+    :type path: :class:`str`
+    :returns: Codec using the dictionaries of the graph.
+    :rtype: :class:`~.PropertyCodec`
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(path)))
+    return PropertyCodec(os.path.join(root, "dictionaries"))
+
+
+def _check_properties(path, repair, codec=None):
+    """
+    Check that the properties file of a vertex or edge can be read.
+
+    :param path: Vertex or edge path.
+    :type path: :class:`str`
+    :param repair: If True, replace an unreadable properties file with
+        empty properties.
+    :type repair: :class:`bool`
+    :param codec: Codec reading the properties files.
+    :type codec: :class:`~.PropertyCodec`
+    :returns: Problems found.
+    :rtype: :class:`list` of :class:`~.Problem`
+    """
+    problems = []
+    prop_path = os.path.join(path, "properties.json")
+    if codec is None:
+        codec = _codec_for(path)
+    data = b""
+    try:
+        with open(prop_path, "rb") as prop_fh:
+            data = prop_fh.read()
+        codec.decode(data)
+    except (IOError, ValueError) as error:
+        if isinstance(error, MissingDictionary) or has_header(data):
+            # compressed properties can be recovered once the dictionary or
+            # codec is found, so they are never thrown away.
+            problems.append(Problem(prop_path, str(error), False))
+        else:
+            if repair:
+                with open(prop_path, "w") as prop_fh:
+                    json.dump({}, prop_fh)
+            problems.append(
+                Problem(
+                    prop_path,
+                    "unreadable properties replaced with empty properties: "
+                    "{0}".format(error),
+                    repair,
+                )
+            )
+
+    if os.path.exists(prop_path + ".tmp"):
+        if repair:
+            os.remove(prop_path + ".tmp")
+        problems.append(
+            Problem(prop_path + ".tmp", "left over temporary file", repair)
+        )
+    return problems
+
+
+def _check_leftover(path, repair):
+    """
+    Check for a left over temporary or unknown entry in a label directory.
+
+    :param path: Entry in a label directory.
+    :type path: :class:`str`
+    :param repair: If True, remove left over temporary entries.
+    :type repair: :class:`bool`
+    :returns: Problems found, or :obj:`None` if the entry is a entity.
+    :rtype: :class:`list` of :class:`~.Problem` or :obj:`None`
+    """
+    name = os.path.basename(path)
+    if name.startswith(TEMP_PREFIX):
+        if repair:
+            _remove(path)
+        return [Problem(path, "left over temporary entity", repair)]
+
+    try:
+        int(name)
+    except ValueError:
+        return [Problem(path, "unexpected entry", False)]
+
+    if not os.path.isdir(path):
+        return [Problem(path, "unexpected entry", False)]
+    return None
+
+
+def check_edge(path, repair=False, codec=None):
+    """
+    Check a edge directory.
+
+    A edge without a valid head or tail vertex is removed when repairing,
+    and missing links from the head and tail vertices back to the edge are
+    recreated.
+
+    :param path: Edge path.
+    :type path: :class:`str`
+    :param repair: If True, repair the problems found.
+    :type repair: :class:`bool`
+    :param codec: Codec reading the properties files, created from the
+        graph path if not given.
+    :type codec: :class:`~.PropertyCodec`
+    :returns: Problems found.
+    :rtype: :class:`list` of :class:`~.Problem`
+    """
+    problems = _check_leftover(path, repair)
+    if problems is not None:
+        return problems
+
+    head = _read_link_id(os.path.join(path, "head"))
+    tail = _read_link_id(os.path.join(path, "tail"))
+    if head is None or tail is None:
+        if repair:
+            shutil.rmtree(path)
+        return [Problem(path, "edge without a valid head or tail", repair)]
+
+    problems = _check_properties(path, repair, codec)
+    name = os.path.basename(path)
+    for (_, vertex_path), direction in [(head, "out-edges"),
+                                        (tail, "in-edges")]:
+        link = os.path.join(vertex_path, direction, name)
+        if os.path.realpath(link) == os.path.realpath(path):
+            continue
+
+        if repair:
+            if os.path.lexists(link):
+                os.remove(link)
+            try:
+                os.makedirs(os.path.dirname(link))
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+            os.symlink(path, link)
+        problems.append(Problem(link, "missing link to edge", repair))
+    return problems
+
+
+def check_vertex(path, repair=False, codec=None):
+    """
+    Check a vertex directory.
+
+    Missing edge directories are recreated and links to edges which no
+    longer exist are removed when repairing.
+
+    :param path: Vertex path.
+    :type path: :class:`str`
+    :param repair: If True, repair the problems found.
+    :type repair: :class:`bool`
+    :param codec: Codec reading the properties files, created from the
+        graph path if not given.
+    :type codec: :class:`~.PropertyCodec`
+    :returns: Problems found.
+    :rtype: :class:`list` of :class:`~.Problem`
+    """
+    problems = _check_leftover(path, repair)
+    if problems is not None:
+        return problems
+
+    problems = _check_properties(path, repair, codec)
+    for direction in ["in-edges", "out-edges"]:
+        edges_path = os.path.join(path, direction)
+        if not os.path.isdir(edges_path):
+            if repair:
+                os.makedirs(edges_path)
+            problems.append(
+                Problem(edges_path, "missing edges directory", repair)
+            )
+            continue
+
+        for name in os.listdir(edges_path):
+            link = os.path.join(edges_path, name)
+            if not os.path.isdir(link):
+                if repair:
+                    os.remove(link)
+                problems.append(
+                    Problem(link, "link to a missing edge", repair)
+                )
+    return problems
+
+
+def _run_check(args):
+    """
+    Run a check in the thread pool.
+
+    :param args: Check function, entity path, repair flag and codec.
+    :type args: :class:`tuple`
+    :returns: Problems found.
+    :rtype: :class:`list` of :class:`~.Problem`
+    """
+    check, path, repair, codec = args
+    return check(path, repair, codec)
+
+
+def _check_constraints(path):
+    """
+    Check that the vertices constraints file can be read.
+
+    :param path: Vertices constraints file.
+    :type path: :class:`str`
+    :returns: Problems found.
+    :rtype: :class:`list` of :class:`~.Problem`
+    """
+    try:
+        with open(path) as constraints_fh:
+            json.load(constraints_fh)
+    except (IOError, ValueError) as error:
+        # constraints are never guessed, so this is left to be fixed by hand.
+        return [
+            Problem(path, "unreadable constraints: {0}".format(error), False)
+        ]
+    return []
+
+
+def _check_entities(check, path, repair, codec, jobs):
+    """
+    Check every vertex or edge in a directory, in parallel once there are
+    more than :data:`PARALLEL_THRESHOLD` of them.
+
+    :param check: Check function, :func:`check_vertex` or
+        :func:`check_edge`.
+    :type check: callable
+    :param path: Vertices or edges directory.
+    :type path: :class:`str`
+    :param repair: If True, repair the problems found.
+    :type repair: :class:`bool`
+    :param codec: Codec reading the properties files.
+    :type codec: :class:`~.PropertyCodec`
+    :param jobs: Number of vertices or edges checked in parallel.
+    :type jobs: :class:`int`
+    :returns: Problems found.
+    :rtype: :class:`list` of :class:`~.Problem`
+    """
+    work = [
+        (check, entity_path, repair, codec)
+        for entity_path in _entity_paths(path)
+    ]
+    if jobs <= 1 or len(work) <= PARALLEL_THRESHOLD:
+        results = [_run_check(each) for each in work]
+    else:
+        pool = ThreadPool(jobs)
+        try:
+            results = pool.map(_run_check, work, chunksize=64)
+        finally:
+            pool.close()
+            pool.join()
+    return [problem for each in results for problem in each]
+
+
+def fsck(path, repair=False, jobs=4):
+    """
+    Check, and optionally repair, the integrity of a persistent graph path.
+
+    .. note::
+
+        The graph must not be open while it is being checked.
+
+    :param path: Path of the persistent graph.
+    :type path: :class:`str`
+    :param repair: If True, repair the problems found.
+    :type repair: :class:`bool`
+    :param jobs: Number of vertices and edges checked in parallel.
+    :type jobs: :class:`int`
+    :returns: Problems found, sorted by path.
+    :rtype: :class:`list` of :class:`~.Problem`
+    """
+    vertices_path = os.path.join(path, "vertices")
+    edges_path = os.path.join(path, "edges")
+    for each in [vertices_path, edges_path]:
+        if not os.path.isdir(each):
+            return [Problem(each, "missing directory", False)]
+
+    problems = _check_constraints(
+        os.path.join(vertices_path, "constraints.json")
+    )
+    codec = PropertyCodec(os.path.join(path, "dictionaries"))
+    # the edges are checked first so that the links to the edges which are
+    # removed are also removed from the vertices.
+    for check, entities_path in [(check_edge, edges_path),
+                                 (check_vertex, vertices_path)]:
+        problems.extend(
+            _check_entities(check, entities_path, repair, codec, jobs)
+        )
+
+    return sorted(problems)
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+
+    :param argv: Command line arguments, defaults to :data:`sys.argv`.
+    :type argv: :class:`list` of :class:`str`
+    :returns: Exit status, 0 if no problems were left unrepaired.
+    :rtype: :class:`int`
+    """
+    parser = argparse.ArgumentParser(
+        description="Check the integrity of a ruruki persistent graph path."
+    )
+    parser.add_argument("path", help="Persistent graph path.")
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="Repair the problems found.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Number of vertices and edges checked in parallel.",
+    )
+    args = parser.parse_args(argv)
+
+    lock = DirectoryLock(args.path)
+    try:
+        lock.acquire()
+    except interfaces.AcquireError:
+        sys.stderr.write("{0} is open by another graph.\n".format(args.path))
+        return 2
+
+    try:
+        problems = fsck(args.path, repair=args.repair, jobs=args.jobs)
+    finally:
+        lock.release()
+
+    for problem in problems:
+        sys.stdout.write(
+            "{0}: {1}{2}\n".format(
+                problem.path,
+                problem.description,
+                " (repaired)" if problem.repaired else "",
+            )
+        )
+    return 1 if any(not each.repaired for each in problems) else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
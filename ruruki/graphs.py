@@ -2,149 +2,43 @@
 Graph implementations
 """
 from collections import defaultdict
+import heapq
+import itertools
 import json
 import logging
 import os
-import shutil
+import threading
 from ruruki import interfaces
+from ruruki.backup import Snapshot, persisted_properties, write_archive
+from ruruki.columns import ColumnStore, columnize, decolumnize
+from ruruki.compression import Interner, SymbolTable
+from ruruki.fsck import fsck
 from ruruki.locks import DirectoryLock
 from ruruki.entities import Vertex, Edge, PersistentVertex, PersistentEdge
 from ruruki.entities import EntitySet
-
-
-def _search_for_edge_ids(path):
-    """
-    Internal helper function to search for edges identity numbers
-    based in the directories and the head and tail vertices identity
-    numbers.
-
-    :param path: Edges Path to find number directories.
-    :type path: :class:`str`
-    :return: Yields the integer number, head id, label, tail id and the
-        properties file path if found.
-    :rtype: Iterator of :class:`tuple`
-        (
-            :class:`int`, :class:`int`, :class:`str`,
-            :class:`int`, :class:`str` or :obj:`None`
-        )
-    """
-    for label in os.listdir(path):
-
-        label_path = os.path.join(path, label)
-
-        # skip over files because we are only looking for directories.
-        if os.path.isfile(label_path):
-            continue
-
-        # run over all the edge id's that we can find
-        # and loading the properties if found.
-        for each in os.listdir(label_path):
-            try:
-                ident = int(each)
-            except ValueError:
-                logging.error(
-                    "%r is not a expected edge id number, skipping edge import",
-                    each
-                )
-                continue
-
-            propfile = os.path.join(
-                label_path,
-                each,
-                "properties.json"
-            )
-
-            try:
-                head_id = int(
-                    os.listdir(
-                        os.path.join(
-                            label_path,
-                            each,
-                            "head"
-                        )
-                    )[0]
-                )
-            except ValueError:
-                logging.error(
-                    "%r is not a expected head id number, skipping edge import",
-                    each
-                )
-                continue
-
-            try:
-                tail_id = int(
-                    os.listdir(
-                        os.path.join(
-                            label_path,
-                            each,
-                            "tail"
-                        )
-                    )[0]
-                )
-            except ValueError:
-                logging.error(
-                    "%r is not a expected tail id number, skipping edge import",
-                    each
-                )
-                continue
-
-            yield (
-                ident,
-                head_id,
-                label,
-                tail_id,
-                propfile if os.path.isfile(propfile) else None
-            )
-
-
-def _search_for_vertex_id(path):
-    """
-    Internal helper function to search for vertices identity numbers
-    based in the directories.
-
-    :param path: Vertice path to find number directories.
-    :type path: :class:`str`
-    :return: Yields the integer number, label and the properties file path
-        if found.
-    :rtype: Iterator of :class:`tuple`
-        (:class:`int`, :class:`str`, :class:`str` or :obj:`None`)
-    """
-    for label in os.listdir(path):
-        label_path = os.path.join(path, label)
-
-        # skip over files because we are only looking for directories.
-        if os.path.isfile(label_path):
-            continue
-
-        # run over all the vertice id's that we can find
-        # and loading the properties if found.
-        for each in os.listdir(label_path):
-            try:
-                ident = int(each)
-            except ValueError:
-                logging.error(
-                    "%r is not a expected vertex id number, skipping",
-                    each
-                )
-                continue
-
-            propfile = os.path.join(
-                label_path,
-                str(ident),
-                "properties.json"
-            )
-
-            yield ident, label, propfile if os.path.isfile(propfile) else None
+from ruruki.journal import Journal, constraints_record, edge_record
+from ruruki.journal import vertex_record
+from ruruki.replication import LogShipper, snapshot_records
+from ruruki.storage import GraphStore, PersistentOptions, PropertyCache
+from ruruki.writers import WriteBehindWriter
 
 
 class IDGenerator(object):
     """
     ID generator and tracker.
+
+    :param reuse_ids: If True, the ids released by removed vertices and
+        edges are handed out again, lowest first, before any new ids. This
+        keeps the ids dense, for example for arrays indexed by id.
+    :type reuse_ids: :class:`bool`
     """
 
-    def __init__(self):
+    def __init__(self, reuse_ids=False):
         self.vid = 0
         self.eid = 0
+        self.reuse_ids = reuse_ids
+        self.free_vids = []
+        self.free_eids = []
 
     def get_edge_id(self):
         """
@@ -153,6 +47,9 @@ class IDGenerator(object):
         :returns: Edge id number.
         :rtype: :class:`int`
         """
+        if self.free_eids:
+            return heapq.heappop(self.free_eids)
+
         ident = self.eid
         self.eid += 1
         return ident
@@ -164,10 +61,51 @@ class IDGenerator(object):
         :returns: Vertex id number.
         :rtype: :class:`int`
         """
+        if self.free_vids:
+            return heapq.heappop(self.free_vids)
+
         ident = self.vid
         self.vid += 1
         return ident
 
+    def release_edge_id(self, ident):
+        """
+        Release the id of a removed edge so that it can be reused. Does
+        nothing if ``reuse_ids`` is not enabled.
+
+        :param ident: Edge id number.
+        :type ident: :class:`int`
+        """
+        if self.reuse_ids is True:
+            heapq.heappush(self.free_eids, ident)
+
+    def release_vertex_id(self, ident):
+        """
+        Release the id of a removed vertex so that it can be reused. Does
+        nothing if ``reuse_ids`` is not enabled.
+
+        :param ident: Vertex id number.
+        :type ident: :class:`int`
+        """
+        if self.reuse_ids is True:
+            heapq.heappush(self.free_vids, ident)
+
+    def get_state(self):
+        """
+        Return the identity number counters and free lists, as they are
+        persisted.
+
+        :returns: The ``vid`` and ``eid`` counters, and the sorted
+            ``free_vids`` and ``free_eids``.
+        :rtype: :class:`dict`
+        """
+        return {
+            "vid": self.vid,
+            "eid": self.eid,
+            "free_vids": sorted(self.free_vids),
+            "free_eids": sorted(self.free_eids),
+        }
+
 
 class Graph(interfaces.IGraph):
     """
@@ -182,6 +120,9 @@ class Graph(interfaces.IGraph):
         self._id_tracker = IDGenerator()
         self._vconstraints = defaultdict(dict)
         self._econstraints = defaultdict()
+        self._vcolumns = {}
+        self._ecolumns = {}
+        self._symbols = SymbolTable()
         self.vertices = EntitySet()
         self.edges = EntitySet()
 
@@ -239,8 +180,56 @@ class Graph(interfaces.IGraph):
         json.dump(data, file_handler, indent=4, sort_keys=True)
 
     def add_vertex_constraint(self, label, key):
+        label = self._symbols.intern(label)
+        key = self._symbols.intern(key)
         self._vconstraints[label][key] = set()
 
+    def _intern_symbols(self, entity):
+        """
+        Replace the label and property keys of a vertex or edge with the
+        shared copies from the symbol table of the graph.
+
+        Deferred properties are left alone, their keys are interned when
+        they are read.
+
+        :param entity: Vertex or edge being added to the graph.
+        :type entity: :class:`~.IEntity`
+        """
+        entity.label = self._symbols.intern(entity.label)
+        if getattr(entity, "is_loaded", lambda: True)():
+            entity.properties = self._symbols.intern_keys(entity.properties)
+
+    def add_column_store(self, label):
+        """
+        Store the properties of the vertices and edges with the given label
+        in columns, one list of values per property key, instead of one
+        dictionary per vertex or edge. Their ``properties`` become mapping
+        views onto the columns, which saves memory when many vertices or
+        edges share the same keys, and filtering them on properties scans
+        the columns.
+
+        The properties of the vertices and edges already in the graph are
+        moved into the columns. Vertices and edges removed from the graph
+        get their properties back as a dictionary.
+
+        .. note::
+
+            Properties stored in columns are always resident in memory, so
+            they are never deferred or evicted by a
+            :class:`~.PersistentGraph` with ``lazy_properties``.
+
+        :param label: Label of the vertices and edges.
+        :type label: :class:`str`
+        """
+        for columns, entities in [(self._vcolumns, self.vertices),
+                                  (self._ecolumns, self.edges)]:
+            if label in columns:
+                continue
+            store = columns[label] = ColumnStore()
+            for entity in entities.filter(label):
+                columnize(entity, store)
+            entities.add_column_store(label, store)
+
     def get_vertex_constraints(self):
         constraints = []
         for label in self._vconstraints:
@@ -320,9 +309,12 @@ class Graph(interfaces.IGraph):
                 "Edge {} already has it identity number set.".format(edge)
             )
 
+        self._intern_symbols(edge)
         self._edge_constraint_violated(edge)
         self._econstraints[(head, edge.label, tail)] = edge
         self.bind_to_graph(edge)
+        if edge.label in self._ecolumns:
+            columnize(edge, self._ecolumns[edge.label])
         self.edges.add(edge)
         head.out_edges.add(edge)
         tail.in_edges.add(edge)
@@ -343,7 +335,7 @@ class Graph(interfaces.IGraph):
                 "Vertex {} already has it identity number set.".format(vertex)
             )
 
-
+        self._intern_symbols(vertex)
         self._vertex_constraint_violated(vertex)
         if vertex.label in self._vconstraints:
             for key in self._vconstraints[vertex.label]:
@@ -351,6 +343,8 @@ class Graph(interfaces.IGraph):
                     self._vconstraints[vertex.label][key].add(vertex)
 
         self.bind_to_graph(vertex)
+        if vertex.label in self._vcolumns:
+            columnize(vertex, self._vcolumns[vertex.label])
         self.vertices.add(vertex)
         return vertex
 
@@ -374,6 +368,8 @@ class Graph(interfaces.IGraph):
             been found.
         """
         key_index = self._vconstraints.get(vertex.label, {})
+        if not key_index:
+            return
 
         # first check the entity properties for constraint violations
         # Then check any additional properties for constraint violations.
@@ -418,6 +414,7 @@ class Graph(interfaces.IGraph):
                 "Unknown entity {0!r}".format(entity)
             )
 
+        kwargs = self._symbols.intern_keys(kwargs)
         if isinstance(entity, interfaces.IVertex):
             self._vertex_constraint_violated(entity, **kwargs)
             self.vertices.update_index(entity, **kwargs)
@@ -460,6 +457,8 @@ class Graph(interfaces.IGraph):
         edge.head.remove_edge(edge)
         edge.tail.remove_edge(edge)
         self.edges.remove(edge)
+        decolumnize(edge)
+        self._id_tracker.release_edge_id(edge.ident)
 
         # need to remove the edge from the internal constraints too
         if (edge.head, edge.label, edge.tail) in self._econstraints:
@@ -474,6 +473,8 @@ class Graph(interfaces.IGraph):
                 "then remove it again.".format(vertex)
             )
         self.vertices.remove(vertex)
+        decolumnize(vertex)
+        self._id_tracker.release_vertex_id(vertex.ident)
 
         # need to remove the vertex from the internal constraints too
         if vertex.label in self._vconstraints:
@@ -513,311 +514,604 @@ class PersistentGraph(Graph):
         There is a performance hit due to the extra disk I/O overhead
         when doing many writing/updating operations.
 
-    .. code::
-
-        path
-           |_ vertices
-           |     |_ constraints.json (file)
-           |     |_ label
-           |     |     |_ 0
-           |     |        |_ properties.json (file)
-           |     |        |_ in-edges
-           |     |        |     |_ 0 -> ../../../../edges/label/0 (symlink)
-           |     |        |_ out-edges
-           |     |              |_
-           |     |
-           |     |_ label
-           |     |    |_ 1
-           |     |         |_ properties.json (file)
-           |     |          |_ in-edges
-           |     |          |     |_
-           |     |          |_ out-edges
-           |     |                |_ 0 -> ../../../../edges/label/0 (symlink)
-           |
-           |_ edges
-                 |_ label
-                       |
-                       |_0
-                         |_ properties.json (file)
-                         |_ head
-                         |   |_ 0 -> ../../../vertices/0 (symlink)
-                         |_ tail
-                             |_ 1 -> ../../../vertices/1 (symlink)
+    The vertices and edges are stored in a directory, see
+    :class:`~.GraphStore` for the layout.
+
+    .. note::
+
+        With ``lazy_properties`` enabled only the topology (identity
+        numbers, labels, heads and tails) is read when the path is loaded.
+        Properties are read on first access and at most
+        ``property_cache_size`` entities keep their properties resident.
+        Vertices with a label that has a constraint are always loaded
+        eagerly because the constraint index needs their property values.
+
+        The property indexes only know the keys of the properties which
+        have been read. So the first filter on properties, such as
+        ``get_vertices("person", name="marko")`` or a Cypher query on
+        properties, reads the properties of every vertex or edge with the
+        label that has not been read yet. It also reads them for every
+        label if no label is given. They are evicted again past
+        ``property_cache_size``, but their keys stay indexed, so later
+        filters on the label only read the candidates. Filtering on the
+        label alone never reads properties.
+
+    .. note::
+
+        The graph records in ``state.json`` whether it was closed cleanly,
+        together with the vertex and edge identity number high-water marks
+        and the ids free to be reused. If the graph was closed cleanly the
+        ids are restored from the state, otherwise the path is checked and
+        repaired with :func:`~.fsck` before it is loaded and the ids are
+        worked out from the loaded vertices and edges.
 
     :param path: Path to ruruki graph data on disk.
+    :type path: :class:`str`
     :param auto_create: If True, then missing ``vertices`` or ``edges``
         directories will be created.
     :type auto_create: :class:`bool`
-    :type path: :class:`str`
+    :param options: Options to open the graph with, or :obj:`None` to give
+        the options as keyword arguments instead, for example
+        ``PersistentGraph(path, lazy_properties=True)``.
+    :type options: :class:`~.PersistentOptions` or :obj:`None`
     :raises DatabasePathLocked: If the path is already locked by another
         persistence graph instance.
+    :raises DatabaseException: If the path is opened read-only but was not
+        closed cleanly and is not open for writing, in which case it has to
+        be opened for writing once to recover it.
+    :raises TypeError: If a option is not known, or options are given both
+        as keyword arguments and with ``options``.
     """
-    def __init__(self, path, auto_create=True):
+    def __init__(self, path, auto_create=True, options=None, **kwargs):
         super(PersistentGraph, self).__init__()
+        if options is None:
+            options = PersistentOptions(**kwargs)
+        elif kwargs:
+            raise TypeError(
+                "Options {0!r} given with options.".format(sorted(kwargs))
+            )
+
+        self.options = options
+        self.store = GraphStore(
+            path,
+            compression=options.compression,
+            delta_compact_size=options.delta_compact_size,
+        )
+        self._id_tracker = IDGenerator(reuse_ids=options.reuse_ids)
         self._vclass = PersistentVertex
         self._eclass = PersistentEdge
+        self._writer = None
+        self._shipper = None
+        self._mutation_lock = threading.RLock()
+        self._snapshots = []
+        self._property_cache = None
+        if options.lazy_properties is True:
+            self._property_cache = PropertyCache(
+                self._load_deferred_properties,
+                options.property_cache_size,
+            )
+        self._interner = None
+        if options.intern_values is True:
+            self._interner = Interner()
+
+        self._lock = DirectoryLock(path, timeout=options.lock_timeout)
+        if options.read_only is True:
+            self._open_read_only()
+            return
 
-        self._lock = DirectoryLock(path)
         try:
             self._lock.acquire()
-        except interfaces.AcquireError:
+        except interfaces.AcquireError as error:
             logging.exception(
                 "Path %r is already owned by another graph.",
                 path
             )
             raise interfaces.DatabasePathLocked(
-                "Path {0!r} is already locked by anotherr persistent graph "
-                "instance.".format(path)
+                "Path {0!r} is already locked by anotherr persistent "
+                "graph instance: {1}".format(path, error)
             )
+        self._open(auto_create)
 
-        self.path = path
-        self.vertices_path = os.path.join(self.path, "vertices")
-        self.edges_path = os.path.join(self.path, "edges")
-        self.vertices_constraints_path = os.path.join(
-            self.vertices_path, "constraints.json"
-        )
+    @property
+    def path(self):
+        """
+        Path to ruruki graph data on disk.
+        """
+        return self.store.path
 
-        if auto_create is True:
-            self._auto_create()
+    @property
+    def vertices_path(self):
+        """
+        Directory holding the vertices.
+        """
+        return self.store.vertices_path
 
-        self._load_from_path()
+    @property
+    def edges_path(self):
+        """
+        Directory holding the edges.
+        """
+        return self.store.edges_path
 
-    def _auto_create(self):
+    @property
+    def vertices_constraints_path(self):
         """
-        Check that ``vertices`` and ``edges`` directories exists, and if
-        not create them and all the other required files and folders.
+        File holding the vertices constraints.
         """
-        status = [
-            os.path.exists(self.vertices_path),
-            os.path.exists(self.edges_path),
-        ]
+        return self.store.vertices_constraints_path
 
-        if not all(status):
-            self._create_vertex_skel(self.path)
-            self._create_edge_skel(self.path)
+    def _open(self, auto_create):
+        """
+        Recover and load the path opened for writing, and start the
+        write-behind writer and the replication log.
 
-    def _load_from_path(self):
+        :param auto_create: If True, then missing ``vertices`` or ``edges``
+            directories will be created.
+        :type auto_create: :class:`bool`
         """
-        Scan through the given database path and load/import up all the
-        relevant vertices, vertices constraints, and edges.
+        options = self.options
+        if auto_create is True and self.store.create() is True:
+            self._write_state(clean=True)
+
+        state = self.store.read_state()
+        self.store.recover_journal()
+        if state.get("clean") is not True:
+            for problem in fsck(self.path, repair=True):
+                logging.warning(
+                    "Recovered %r: %s", problem.path, problem.description
+                )
+
+        if options.group_commit is True:
+            self._writer = WriteBehindWriter(
+                self.store.apply,
+                journal=Journal(
+                    self.store.journal_path,
+                    changed=self.store.changed,
+                ),
+                commit_interval=options.commit_interval,
+                commit_size=options.commit_size,
+            )
+        elif options.write_behind is True:
+            self._writer = WriteBehindWriter(self.store.apply)
+
+        self._load_from_path()
+        self._restore_ids(state)
+        self._write_state(clean=False)
+
+        if options.replication is True:
+            self._shipper = LogShipper(
+                os.path.join(self.path, "replication.log"),
+                max_size=options.replication_log_size,
+            )
+            self._shipper.start(snapshot_records(self))
+
+    def _open_read_only(self):
         """
-        logging.info("Loading graph data from %r", self.path)
-        self._load_vconstraints_from_path(self.vertices_constraints_path)
-        self._load_vertices_from_path(self.vertices_path)
-        self._load_edges_from_path(self.edges_path)
-        logging.info("Completed %r graph import", self.path)
+        Load the path without changing anything on disk.
 
-    def _load_vconstraints_from_path(self, path):
+        :raises DatabaseException: If the path was not closed cleanly and
+            is not open for writing.
         """
-        Open, parse and load the vertices constraints.
+        state = self.store.read_state()
+        # the state is only clean while no graph has the path open for
+        # writing.
+        if state.get("clean") is False and not self._lock.is_held():
+            raise interfaces.DatabaseException(
+                "Path {0!r} was not closed cleanly, open it for writing to "
+                "recover it before opening it read-only.".format(self.path)
+            )
+
+        self._load_from_path()
+        self._restore_ids(state)
 
-        :param path: Vertices constraints file to open, parse and import.
-        :type path: :class:`str`
+    def refresh(self):
         """
-        logging.info("Loading vertices constraints %r", path)
-        with open(path) as vconstraints_fh:
-            for each in json.load(vconstraints_fh):
-                self.add_vertex_constraint(each["label"], each["key"])
+        Load the path of a read-only graph again, to see the changes made
+        by the graph which has the path open for writing since it was
+        loaded.
+
+        .. note::
+
+            The graph is emptied before it is loaded again, so refresh it
+            from the thread reading it. Changes which are still queued by
+            a writer with write-behind or group commit are not seen until
+            they have been written. Use a :class:`~.ReplicaGraph` to follow
+            the changes of the writer as they are made.
 
-    def _load_vertices_from_path(self, path):
+        :raises DatabaseException: If the graph was not opened read-only,
+            or the path was not closed cleanly and is not open for writing.
         """
-        Scan through the given path and load/import all the vertices.
+        if self.options.read_only is False:
+            raise interfaces.DatabaseException(
+                "Only read-only graphs of {0!r} can be refreshed.".format(
+                    self.path
+                )
+            )
 
-        .. code::
+        labels = set(self._vcolumns) | set(self._ecolumns)
+        reuse_ids = self._id_tracker.reuse_ids
+        super(PersistentGraph, self).__init__()
+        self._id_tracker = IDGenerator(reuse_ids=reuse_ids)
+        self._vclass = PersistentVertex
+        self._eclass = PersistentEdge
+        if self._property_cache is not None:
+            self._property_cache = PropertyCache(
+                self._load_deferred_properties,
+                self._property_cache.size,
+            )
 
-            path
-               |_ vertices
-                    |_ constraints.json (file)
-                    |_ labelA
-                    |     |_ 0
-                    |        |_ properties.json (file)
-                    |
-                    |_ labelB
-                         |_ 1
-                            |_ properties.json (file)
+        self._open_read_only()
+        for label in sorted(labels):
+            self.add_column_store(label)
 
-        :param path: Vertices Path to walk and import.
-        :type path: :class:`str`
+    def _check_writable(self):
         """
-        logging.info("Loading vertices from %r", path)
-        sorted_to_import = sorted(
-            _search_for_vertex_id(path),
-            key=lambda x: x[0]
-        )
+        Check that the graph is allowed to be changed.
 
-        for ident, label, prop_file in sorted_to_import:
-            properties = json.load(open(prop_file)) if prop_file else {}
+        :raises DatabaseReadOnly: If the graph was opened read-only.
+        :raises DatabaseException: If the write-behind writer stopped after
+            a failure, in which case the graph has to be opened again.
+        """
+        if self.options.read_only is True:
+            raise interfaces.DatabaseReadOnly(
+                "Path {0!r} is opened read-only.".format(self.path)
+            )
+        if self._writer is not None:
+            self._writer.check()
 
-            # reset the id to the id being loaded.
-            self._id_tracker.vid = ident
-            vertex = super(PersistentGraph, self).add_vertex(
-                label, **properties
+    def _load_from_path(self):
+        """
+        Scan through the given database path and load/import up all the
+        relevant vertices, vertices constraints, and edges.
+        """
+        logging.info("Loading graph data from %r", self.path)
+        for each in self.store.read_vconstraints():
+            super(PersistentGraph, self).add_vertex_constraint(
+                each["label"], each["key"]
             )
-            # due to pylint bug https://github.com/PyCQA/pylint/issues/379, we
-            # need to disable assigning-non-slot errors
-            vertex.path = os.path.join(path, label, str(ident))  # pylint: disable=assigning-non-slot
+        self._load_vertices()
+        self._load_edges()
+        logging.info("Completed %r graph import", self.path)
 
-    def _load_edges_from_path(self, path):
+    def _load_vertices(self):
         """
-        Scan through the given path and load/import all the edges.
+        Load/import all the vertices of the store.
+        """
+        logging.info("Loading vertices from %r", self.vertices_path)
+        # the order does not matter because the id counters are restored
+        # once everything has been loaded.
+        for ident, label in self.store.iter_vertices():
+            vertex = self._vclass(label)
+            # due to pylint bug https://github.com/PyCQA/pylint/issues/379, we
+            # need to disable assigning-non-slot errors
+            vertex.path = self.store.vertex_path(label, ident)  # pylint: disable=assigning-non-slot
+            if (self._property_cache is not None and
+                    label not in self._vconstraints):
+                vertex.defer_properties(self._property_cache)
+            else:
+                vertex.properties = self._read_properties(vertex)
 
-        .. code::
+            # bind the id being loaded.
+            self._id_tracker.vid = ident
+            super(PersistentGraph, self).append_vertex(vertex)
 
-            path
-               |_ edges
-                     |_ label
-                          |_0
-                            |_ properties.json (file)
-                            |_ head
-                            |   |_ 0 -> ../../../vertices/0 (symlink)
-                            |_ tail
-                                |_ 1 -> ../../../vertices/1 (symlink)
+    def _load_edges(self):
+        """
+        Load/import all the edges of the store.
 
-        :param path: Edges Path to walk and import.
-        :type path: :class:`str`
         :raises KeyError: If the head or tail of the edge being
-            imported is unknown.
+            imported is unknown, unless the graph is read-only.
         """
-        logging.info("Loading edges from %r", path)
-        sorted_to_import = sorted(
-            _search_for_edge_ids(path),
-            key=lambda x: x[0]
-        )
+        logging.info("Loading edges from %r", self.edges_path)
+        # the order does not matter because the id counters are restored
+        # once everything has been loaded.
+        for ident, head_id, label, tail_id in self.store.iter_edges():
+            try:
+                head = self.get_vertex(head_id)
+                tail = self.get_vertex(tail_id)
+            except KeyError:
+                if self.options.read_only is False:
+                    raise
+                # the writer added the edge after the vertices were read.
+                continue
+            edge = self._eclass(head, label, tail)
 
-        for ident, head_id, label, tail_id, prop_file in sorted_to_import:
-            properties = json.load(open(prop_file)) if prop_file else {}
-            head = self.get_vertex(head_id)
-            tail = self.get_vertex(tail_id)
+            # due to pylint bug https://github.com/PyCQA/pylint/issues/379, we
+            # need to disable assigning-non-slot errors
+            edge.path = self.store.edge_path(label, ident)  # pylint: disable=assigning-non-slot
+            if self._property_cache is not None:
+                edge.defer_properties(self._property_cache)
+            else:
+                edge.properties = self._read_properties(edge)
 
-            # reset the id to the id being loaded.
+            # bind the id being loaded.
             self._id_tracker.eid = ident
-            edge = super(PersistentGraph, self).add_edge(
-                head,
-                label,
-                tail,
-                **properties
-            )
+            super(PersistentGraph, self).append_edge(edge)
 
-            # due to pylint bug https://github.com/PyCQA/pylint/issues/379, we
-            # need to disable assigning-non-slot errors
-            edge.path = os.path.join(path, label, str(ident))  # pylint: disable=assigning-non-slot
+    def _read_properties(self, entity):
+        """
+        Read the persisted properties of an entity.
+
+        :param entity: Persistent entity which has its path set.
+        :type entity: :class:`~.PersistentVertex` or
+            :class:`~.PersistentEdge`
+        :returns: The properties, or an empty :class:`dict` if the entity
+            does not have a properties file.
+        :rtype: :class:`dict`
+        """
+        pending = None
+        if self._writer is not None:
+            pending = self._writer.pending(("properties", entity.path))
+            if pending is not None and pending["op"] == "set_property":
+                return self._symbols.intern_keys(pending["properties"])
+
+        properties = self._symbols.intern_keys(
+            self.store.read_properties(entity.path)
+        )
+        if pending is not None:
+            properties.update(self._symbols.intern_keys(pending["properties"]))
+        if self._interner is not None:
+            self._interner.intern_properties(properties)
+        return properties
 
-    def _create_vertex_skel(self, path):
+    def _load_deferred_properties(self, entity):
+        """
+        Read the persisted properties of an entity which had its properties
+        deferred, and index them the first time they are read.
+
+        :param entity: Persistent entity which has its path set.
+        :type entity: :class:`~.PersistentVertex` or
+            :class:`~.PersistentEdge`
+        :returns: The properties.
+        :rtype: :class:`dict`
         """
-        Create a vertex skeleton path.
+        properties = self._read_properties(entity)
+        if entity.graph is self:
+            if isinstance(entity, interfaces.IVertex):
+                entities = self.vertices
+            else:
+                entities = self.edges
+            with self._mutation_lock:
+                entities.index_deferred(entity, properties)
+        return properties
 
-        :param path: Path to create the vertex skeleton structure in.
-        :type path: :class:`str`
+    def _submit(self, key, record):
+        """
+        Apply a mutation record to disk, or queue it on the write-behind
+        writer if write-behind is enabled. The record is also shipped to
+        the replicas if replication is enabled.
+
+        :param key: Key used to coalesce queued records, or :obj:`None`
+            if the record should never be coalesced.
+        :type key: hashable or :obj:`None`
+        :param record: Mutation record.
+        :type record: :class:`dict`
         """
-        self.vertices_path = os.path.join(path, "vertices")
-        os.makedirs(self.vertices_path)
+        if self._writer is None:
+            self.store.apply(record)
+        else:
+            self._writer.submit(key, record)
 
-        self.vertices_constraints_path = os.path.join(
-            self.vertices_path, "constraints.json"
-        )
-        with open(self.vertices_constraints_path, "w") as constraint_fh:
-            constraint_fh.write("[]")
+        if self._shipper is not None:
+            self._shipper.ship(record)
+            if self._shipper.is_full():
+                self._shipper.start(snapshot_records(self))
 
-    def _create_edge_skel(self, path):
+    def _write_state(self, clean):
         """
-        Create a edge skeleton path.
+        Write the state file with the identity number high-water marks and
+        free lists.
 
-        :param path: Path to create the edge skeleton structure in.
-        :type path: :class:`str`
+        :param clean: True if the graph is being closed cleanly.
+        :type clean: :class:`bool`
         """
-        self.edges_path = os.path.join(path, "edges")
-        os.makedirs(self.edges_path)
+        state = self._id_tracker.get_state()
+        state["clean"] = clean
+        self.store.write_state(state)
 
-    def add_vertex_constraint(self, label, key):
-        super(PersistentGraph, self).add_vertex_constraint(label, key)
-        with open(self.vertices_constraints_path, "w") as constraint_fh:
-            data = []
-            for const_label, const_key in self.get_vertex_constraints():
-                data.append({"label": const_label, "key": const_key})
-            json.dump(data, constraint_fh, indent=4)
+    def _restore_ids(self, state):
+        """
+        Restore the identity number counters and free lists after loading.
 
-    def add_vertex(self, label=None, **kwargs):
-        vertex = super(PersistentGraph, self).add_vertex(label, **kwargs)
-        # due to pylint bug https://github.com/PyCQA/pylint/issues/379, we
-        # need to disable assigning-non-slot errors
-        vertex.path = os.path.join(self.vertices_path, label, str(vertex.ident))  # pylint: disable=assigning-non-slot
-        os.makedirs(vertex.path)
-        os.makedirs(os.path.join(vertex.path, "in-edges"))
-        os.makedirs(os.path.join(vertex.path, "out-edges"))
+        :param state: State read before loading.
+        :type state: :class:`dict`
+        """
+        tracker = self._id_tracker
+        if state.get("clean") is True:
+            tracker.vid = state.get("vid", 0)
+            tracker.eid = state.get("eid", 0)
+            free_vids = state.get("free_vids", [])
+            free_eids = state.get("free_eids", [])
+        else:
+            # ids are never handed out again, even if the entities with the
+            # highest ids were removed.
+            vids = set(each.ident for each in self.vertices)
+            eids = set(each.ident for each in self.edges)
+            tracker.vid = max([state.get("vid", 0), max(vids or [-1]) + 1])
+            tracker.eid = max([state.get("eid", 0), max(eids or [-1]) + 1])
+            free_vids = set(range(tracker.vid)) - vids
+            free_eids = set(range(tracker.eid)) - eids
+
+        if tracker.reuse_ids is True:
+            tracker.free_vids = sorted(free_vids)
+            tracker.free_eids = sorted(free_eids)
 
-        with open(os.path.join(vertex.path, "properties.json"), "w") as fh:
-            json.dump(vertex.properties, fh)
+    def add_vertex_constraint(self, label, key):
+        self._check_writable()
+        with self._mutation_lock:
+            super(PersistentGraph, self).add_vertex_constraint(label, key)
+            self._submit(
+                ("constraints",),
+                constraints_record(self.get_vertex_constraints()),
+            )
 
-        return vertex
+    def add_vertex(self, label=None, **kwargs):
+        self._check_writable()
+        with self._mutation_lock:
+            vertex = super(PersistentGraph, self).add_vertex(label, **kwargs)
+            # due to pylint bug https://github.com/PyCQA/pylint/issues/379,
+            # we need to disable assigning-non-slot errors
+            vertex.path = self.store.vertex_path(label, vertex.ident)  # pylint: disable=assigning-non-slot
+            self._submit(None, vertex_record(vertex))
+            return vertex
 
     def add_edge(self, head, label, tail, **kwargs):
-        edge = super(PersistentGraph, self).add_edge(
-            head, label, tail, **kwargs
-        )
-
-        # due to pylint bug https://github.com/PyCQA/pylint/issues/379, we
-        # need to disable assigning-non-slot errors
-        edge.path = os.path.join(self.edges_path, label, str(edge.ident))  # pylint: disable=assigning-non-slot
-        head_path = os.path.join(edge.path, "head")
-        tail_path = os.path.join(edge.path, "tail")
+        self._check_writable()
+        with self._mutation_lock:
+            edge = super(PersistentGraph, self).add_edge(
+                head, label, tail, **kwargs
+            )
 
-        os.makedirs(edge.path)
-        os.makedirs(head_path)
-        os.makedirs(tail_path)
+            # due to pylint bug https://github.com/PyCQA/pylint/issues/379,
+            # we need to disable assigning-non-slot errors
+            edge.path = self.store.edge_path(label, edge.ident)  # pylint: disable=assigning-non-slot
+            self._submit(None, edge_record(edge))
+            return edge
 
-        with open(os.path.join(edge.path, "properties.json"), "w") as fh:
-            json.dump(edge.properties, fh)
+    def set_property(self, entity, **kwargs):
+        self._check_writable()
+        with self._mutation_lock:
+            # keep the properties as they were for the running backups.
+            for snapshot in self._snapshots:
+                snapshot.capture(entity)
+            super(PersistentGraph, self).set_property(entity, **kwargs)
+
+            key = ("properties", entity.path)
+            record = {
+                "op": "set_property",
+                "entity": (
+                    "vertex"
+                    if isinstance(entity, interfaces.IVertex)
+                    else "edge"
+                ),
+                "id": entity.ident,
+                "label": entity.label,
+            }
+
+            if self.options.incremental_properties is True:
+                # only record the changed keys, merged with any changed
+                # keys still waiting to be written.
+                record["op"] = "update_properties"
+                changed = {}
+                if self._writer is not None:
+                    pending = self._writer.pending(key)
+                    if pending is not None:
+                        changed.update(pending["properties"])
+                changed.update(
+                    (k, v) for k, v in kwargs.items() if k != "_path"
+                )
+                record["properties"] = changed
+            else:
+                # Update the properties to the properties file
+                record["properties"] = persisted_properties(entity)
 
-        os.symlink(head.path, os.path.join(head_path, str(head.ident)))
-        os.symlink(tail.path, os.path.join(tail_path, str(tail.ident)))
+            self._submit(key, record)
 
-        os.symlink(
-            edge.path,
-            os.path.join(
-                head.path,
-                "out-edges",
-                str(edge.ident)
+    def remove_edge(self, edge):
+        self._check_writable()
+        with self._mutation_lock:
+            super(PersistentGraph, self).remove_edge(edge)
+            edge.pin_properties()
+            if self._writer is not None:
+                self._writer.discard(("properties", edge.path))
+            self._submit(
+                None,
+                {"op": "remove_edge", "id": edge.ident, "label": edge.label},
             )
-        )
 
-        os.symlink(
-            edge.path,
-            os.path.join(
-                tail.path,
-                "in-edges",
-                str(edge.ident)
+    def remove_vertex(self, vertex):
+        self._check_writable()
+        with self._mutation_lock:
+            super(PersistentGraph, self).remove_vertex(vertex)
+            vertex.pin_properties()
+            if self._writer is not None:
+                self._writer.discard(("properties", vertex.path))
+            self._submit(
+                None,
+                {
+                    "op": "remove_vertex",
+                    "id": vertex.ident,
+                    "label": vertex.label,
+                },
             )
-        )
 
-        return edge
+    def backup(self, dest, compress=True):
+        """
+        Write a consistent point-in-time copy of the graph to a single tar
+        archive, while the graph carries on being changed.
+
+        The vertices, edges and constraints are captured in memory when the
+        backup starts, and the properties of any vertex or edge changed
+        while the backup is being written are kept as they were when the
+        backup started. The archive is streamed, holds the same layout as
+        the graph path with relative symlinks, and can be opened as a
+        :class:`PersistentGraph` once it has been extracted, for example
+        with ``tar -xzf backup.tar.gz -C path``.
+
+        :param dest: Filename or binary file object to write the archive
+            to.
+        :type dest: :class:`str` or file
+        :param compress: If True, compress the archive with gzip.
+        :type compress: :class:`bool`
+        :returns: Number of vertices and edges in the backup.
+        :rtype: :class:`int`
+        """
+        with self._mutation_lock:
+            snapshot = Snapshot(self, self._id_tracker.get_state())
+            self._snapshots.append(snapshot)
 
-    def set_property(self, entity, **kwargs):
-        super(PersistentGraph, self).set_property(entity, **kwargs)
+        try:
+            if hasattr(dest, "write"):
+                return write_archive(
+                    snapshot, dest, self.store.codec, self._mutation_lock,
+                    compress=compress,
+                )
+            with open(dest, "wb") as dest_fh:
+                return write_archive(
+                    snapshot, dest_fh, self.store.codec, self._mutation_lock,
+                    compress=compress,
+                )
+        finally:
+            with self._mutation_lock:
+                self._snapshots.remove(snapshot)
 
-        # Update the properties to the properties file
-        properties_file = os.path.join(
-            entity.path,
-            "properties.json"
-        )
+    def flush(self):
+        """
+        Block until all the queued write-behind operations have been
+        written to disk. Does nothing if write-behind is not enabled.
 
-        with open(properties_file, "w") as prop_file:
-            json.dump(
-                dict(
-                    (k, v)
-                    for k, v in entity.properties.items()
-                    if k != "_path"
-                ),
-                prop_file,
-                indent=4
-            )
+        :raises DatabaseException: If a queued write failed.
+        """
+        if self._writer is not None:
+            self._writer.flush()
 
-    def remove_edge(self, edge):
-        super(PersistentGraph, self).remove_edge(edge)
-        shutil.rmtree(edge.path)
+    def compact(self):
+        """
+        Merge the property delta files written with
+        ``incremental_properties`` into the properties files.
 
-    def remove_vertex(self, vertex):
-        super(PersistentGraph, self).remove_vertex(vertex)
-        shutil.rmtree(vertex.path)
+        :returns: Number of vertices and edges which were compacted.
+        :rtype: :class:`int`
+        :raises DatabaseException: If a queued write failed.
+        :raises DatabaseReadOnly: If the graph was opened read-only.
+        """
+        self._check_writable()
+        self.flush()
+        count = 0
+        for entity in itertools.chain(self.vertices, self.edges):
+            if self.store.compact_properties(entity.path) is True:
+                count += 1
+        return count
 
     def close(self):
-        self._lock.release()
+        try:
+            if self._writer is not None:
+                self._writer.close()
+            if self._shipper is not None:
+                self._shipper.close()
+            if self.options.read_only is False:
+                self.store.changed.sync()
+                self._write_state(clean=True)
+        finally:
+            if self._lock.locked is True:
+                self._lock.release()
@@ -67,6 +67,12 @@ class DumplicateConstraintError(EntitySetException):
     """
 
 
+class QueryError(RurukiException):
+    """
+    Raised when a query is not valid or can not be run.
+    """
+
+
 class DatabaseException(RurukiException):
     """
     Database Exception.
@@ -80,6 +86,12 @@ class DatabasePathLocked(DatabaseException):
     """
 
 
+class DatabaseReadOnly(DatabaseException):
+    """
+    Raised when trying to change a read-only graph.
+    """
+
+
 class UnknownEntityError(DatabaseException):
     """
     Raised if the entity is unknown to the database.
@@ -407,6 +419,38 @@ class IGraph(object):
         :rtype: :class:`~.IEntitySet`
         """
 
+    def query(self, query_string, parameters=None):
+        """
+        Run a Cypher read query against the graph, for example::
+
+            graph.query(
+                "MATCH (a:person)-[:knows]->(b) WHERE b.age > {age} "
+                "RETURN b.name",
+                {"age": 30},
+            )
+
+        .. note::
+
+            See :func:`~ruruki.parsers.cypher_parser.query` for the
+            supported Cypher, and :func:`~ruruki.parsers.cypher_parser.stream`
+            to iterate over the rows as they are matched instead of
+            returning them all at once.
+
+        :param query_string: Cypher query.
+        :type query_string: :class:`str`
+        :param parameters: Values of the ``{name}`` parameters used in the
+            query.
+        :type parameters: :class:`dict` or :obj:`None`
+        :returns: One row per match, keyed by the returned column names.
+        :rtype: :class:`list` of :class:`dict`
+        :raises QueryError: If the query is not valid or can not be run.
+        """
+        # the grammar is compiled when the parser is imported, which takes
+        # a few seconds, and the parser depends on this module, so it is
+        # only imported once a query is run.
+        from ruruki.parsers import cypher_parser  # pylint: disable=import-outside-toplevel
+        return cypher_parser.query(self, query_string, parameters)
+
     @abc.abstractmethod
     def remove_edge(self, edge):
         """
@@ -756,6 +800,23 @@ class IEntitySet(MutableSet):
         :rtype: Iterable of :class:`str`
         """
 
+    @abc.abstractmethod
+    def count(self, label=None, key=None):
+        """
+        Return the number of entities with a label and property key, from
+        the label and property indexes and without filtering the entities.
+
+        :param label: Count the entities with a particular label. If
+            :obj:`None`, entities with any label are counted.
+        :type label: :class:`str`
+        :param key: Count the entities with a particular property key. If
+            :obj:`None`, entities with any properties are counted.
+        :type key: :class:`str`
+        :returns: Number of entities, including the entities which have not
+            read their properties yet when counting a property key.
+        :rtype: :class:`int`
+        """
+
     @abc.abstractmethod
     def get(self, ident):
         """
@@ -825,6 +886,28 @@ class IEntitySet(MutableSet):
         :rtype: :class:`~.IEntitySet`
         """
 
+    @abc.abstractmethod
+    def iter_filter(self, label=None, **kwargs):
+        """
+        Iterate over the entities that match the given label and
+        properties, without building a new :class:`~.IEntitySet`.
+
+        The entities are checked against the properties while they are
+        iterated over, so only the entities used are checked.
+
+        .. note::
+
+            See :meth:`filter` for the property suffixes.
+
+        :param label: Filter for entities that have a particular label. If
+            :obj:`None`, all entities are returned.
+        :type label: :class:`str`
+        :param kwargs: Property key and value.
+        :type kwargs: key=value
+        :returns: The entities that matched the filter criteria.
+        :rtype: Iterator of :class:`~.IEntity`
+        """
+
     @abc.abstractmethod
     def all(self, label=None, **kwargs):
         """
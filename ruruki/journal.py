@@ -0,0 +1,280 @@
+"""
+Journal of mutation records used by the persistent graphs.
+
+Each record is a JSON encoded :class:`dict` written on its own line, with
+the ``op`` key naming the mutation, for example::
+
+    {"id": 0, "label": "person", "op": "add_vertex", "properties": {}}
+"""
+import errno
+import json
+import logging
+import os
+import threading
+
+# directories can only be opened to be flushed on POSIX platforms.
+SYNC_DIRECTORIES = os.name == "posix"
+
+
+def fsync_path(path):
+    """
+    Flush a file, or the entries of a directory, to disk.
+
+    :param path: File or directory to flush. Nothing is done if it does not
+        exist anymore.
+    :type path: :class:`str`
+    """
+    try:
+        path_fd = os.open(path, os.O_RDONLY)
+    except OSError as error:
+        if error.errno == errno.ENOENT:
+            return
+        raise
+    try:
+        os.fsync(path_fd)
+    finally:
+        os.close(path_fd)
+
+
+class ChangedPaths(object):
+    """
+    Files and directories changed since they were last flushed to disk.
+
+    Flushing only the changed paths, and the directories holding them,
+    avoids flushing every file system on the host.
+
+    :param max_size: Flush the changed paths as soon as there are more than
+        this many of them.
+    :type max_size: :class:`int`
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._paths = set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._paths)
+
+    def add(self, path, parents=1):
+        """
+        Record a changed file or directory, and the directories above it
+        whose entries were changed with it.
+
+        :param path: Changed file or directory.
+        :type path: :class:`str`
+        :param parents: Number of parent directories to record.
+        :type parents: :class:`int`
+        """
+        with self._lock:
+            self._paths.add(path)
+            for _ in range(parents):
+                path = os.path.dirname(path)
+                self._paths.add(path)
+            full = len(self._paths) > self.max_size
+
+        if full:
+            self.sync()
+
+    def sync(self):
+        """
+        Flush the changed paths to disk.
+
+        .. note::
+
+            Directories can not be flushed on platforms such as Windows, so
+            nothing is flushed and the changes are not known to be durable.
+
+        :returns: True if the changed paths were flushed.
+        :rtype: :class:`bool`
+        """
+        with self._lock:
+            paths, self._paths = self._paths, set()
+        if not SYNC_DIRECTORIES:
+            return False
+
+        try:
+            # files before the directories holding them.
+            for path in sorted(paths, key=len, reverse=True):
+                fsync_path(path)
+        except EnvironmentError:
+            with self._lock:
+                self._paths.update(paths)
+            raise
+        return True
+
+
+def constraints_record(constraints):
+    """
+    Build the record which replaces the vertex constraints.
+
+    :param constraints: Label and key pairs of the constraints.
+    :type constraints: Iterable of :class:`tuple`
+    :returns: Mutation record.
+    :rtype: :class:`dict`
+    """
+    return {
+        "op": "constraints",
+        "constraints": [
+            {"label": label, "key": key} for label, key in constraints
+        ],
+    }
+
+
+def vertex_record(vertex):
+    """
+    Build the record which adds a vertex.
+
+    :param vertex: Vertex bound to a graph.
+    :type vertex: :class:`~.IVertex`
+    :returns: Mutation record.
+    :rtype: :class:`dict`
+    """
+    return {
+        "op": "add_vertex",
+        "id": vertex.ident,
+        "label": vertex.label,
+        "properties": dict(vertex.properties),
+    }
+
+
+def edge_record(edge):
+    """
+    Build the record which adds a edge.
+
+    :param edge: Edge bound to a graph.
+    :type edge: :class:`~.IEdge`
+    :returns: Mutation record.
+    :rtype: :class:`dict`
+    """
+    return {
+        "op": "add_edge",
+        "id": edge.ident,
+        "label": edge.label,
+        "head_id": edge.head.ident,
+        "head_label": edge.head.label,
+        "tail_id": edge.tail.ident,
+        "tail_label": edge.tail.label,
+        "properties": dict(edge.properties),
+    }
+
+
+def read_records(filename):
+    """
+    Read the records from a journal file.
+
+    .. note::
+
+        Reading stops at the first incomplete or corrupt line, which is
+        what is left behind if the process died half way through a write.
+
+    :param filename: Journal file to read.
+    :type filename: :class:`str`
+    :returns: Yields the records in the order they were written.
+    :rtype: Iterator of :class:`dict`
+    """
+    with open(filename) as journal_fh:
+        for line in journal_fh:
+            try:
+                if not line.endswith("\n"):
+                    raise ValueError("Missing end of line")
+                record = json.loads(line)
+            except ValueError:
+                logging.warning(
+                    "Ignoring incomplete record at the end of %r", filename
+                )
+                return
+            yield record
+
+
+class Journal(object):
+    """
+    Append only journal of mutation records.
+
+    A batch of records is made durable with a single write and a single
+    ``fsync``, which is what allows many small mutations to share the cost
+    of one durable write.
+
+    :param filename: Journal file to append to. It is created if it does
+        not exist.
+    :type filename: :class:`str`
+    :param fsync: If False, skip the ``fsync`` after writing a batch.
+    :type fsync: :class:`bool`
+    :param changed: Paths changed by applying the records, which are flushed
+        to disk before the journal is checkpointed, or :obj:`None` if the
+        changes are made durable by the caller.
+    :type changed: :class:`ChangedPaths` or :obj:`None`
+    :param max_size: Checkpoint the journal once it grows beyond this many
+        bytes, see :meth:`is_full`.
+    :type max_size: :class:`int`
+    """
+
+    def __init__(self, filename, fsync=True, changed=None,
+                 max_size=4 * 1024 * 1024):
+        self.filename = filename
+        self.fsync = fsync
+        self.changed = changed
+        self.max_size = max_size
+        self._fh = open(filename, "a")
+
+    def size(self):
+        """
+        Return the size of the journal.
+
+        :returns: Size in bytes.
+        :rtype: :class:`int`
+        """
+        return os.fstat(self._fh.fileno()).st_size
+
+    def is_full(self):
+        """
+        Check if the journal has grown beyond :attr:`max_size`.
+
+        :returns: True if the journal should be checkpointed.
+        :rtype: :class:`bool`
+        """
+        return self.size() > self.max_size
+
+    def write(self, records):
+        """
+        Append a batch of records and make them durable.
+
+        :param records: Records to append.
+        :type records: Iterable of :class:`dict`
+        """
+        self._fh.write(
+            "".join(
+                json.dumps(record, sort_keys=True) + "\n"
+                for record in records
+            )
+        )
+        self._fh.flush()
+        if self.fsync is True:
+            os.fsync(self._fh.fileno())
+
+    def checkpoint(self):
+        """
+        Truncate the journal once the changed paths have been flushed to
+        disk.
+
+        .. note::
+
+            On platforms which can not flush directories, such as Windows,
+            the journal is never truncated, as it is the only durable copy
+            of the changes.
+
+        :returns: True if the journal was truncated.
+        :rtype: :class:`bool`
+        """
+        if self.changed is not None and not self.changed.sync():
+            return False
+        self._fh.seek(0)
+        self._fh.truncate()
+        return True
+
+    def close(self):
+        """
+        Close the journal file.
+        """
+        self._fh.close()
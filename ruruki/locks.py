@@ -1,8 +1,13 @@
 """
 Classes for handling locking and ownerships.
 """
+import errno
+import json
+import logging
 import os
 import os.path
+import socket
+import time
 from ruruki import interfaces
 
 if os.name == 'nt':
@@ -62,33 +67,186 @@ class FileLock(Lock):
     """
     File based locking.
 
+    A shared lock can be held by any number of processes at the same time,
+    but not while another process holds the exclusive lock.
+
+    The holder of the exclusive lock records its process id, host name and
+    the time it took the lock in the lock file, see :meth:`owner`, and
+    clears them when the lock is released. The lock itself is released by
+    the operating system when the holding process dies, so a crashed
+    holder never blocks the next one, and the owner it left behind is
+    reported as stale when the lock is taken over.
+
+    .. note::
+
+        Shared locks are not supported on Windows, where every lock is
+        exclusive.
+
     :param filename: Filename to create a lock on.
     :type filename: :class:`str`
+    :param shared: If True, take a shared lock instead of an exclusive one.
+    :type shared: :class:`bool`
+    :param timeout: Seconds to keep trying to acquire the lock for before
+        giving up, 0 to give up straight away, or :obj:`None` to keep
+        trying until the lock is acquired.
+    :type timeout: :class:`float` or :obj:`None`
+    :param backoff: Seconds to wait before the first retry. The wait is
+        doubled after every retry, up to :attr:`MAX_BACKOFF` seconds.
+    :type backoff: :class:`float`
     """
+    MAX_BACKOFF = 1.0
 
-    def __init__(self, filename):
+    def __init__(self, filename, shared=False, timeout=0, backoff=0.01):
         super(FileLock, self).__init__()
         self.filename = filename
+        self.shared = shared
+        self.timeout = timeout
+        self.backoff = backoff
+        self.stale_owner = None
         self._fd = None
 
-    def acquire(self):
+    def owner(self):
+        """
+        Return the owner recorded in the lock file by the holder of the
+        exclusive lock.
+
+        :returns: Dictionary with the ``pid``, ``host`` and ``time`` of the
+            owner, or :obj:`None` if no owner is recorded.
+        :rtype: :class:`dict` or :obj:`None`
+        """
         try:
-            self._fd = open(self.filename, "w")
+            with open(self.filename) as lock_fh:
+                owner = json.load(lock_fh)
+        except (IOError, ValueError):
+            return None
+        return owner if isinstance(owner, dict) else None
+
+    def _try_acquire(self):
+        """
+        Make a single attempt to acquire the lock.
+
+        :returns: True if the lock was acquired.
+        :rtype: :class:`bool`
+        """
+        try:
+            # the file is never truncated before the lock is held, so the
+            # owner recorded by the holder survives.
+            self._fd = open(self.filename, "a+")
             if os.name == 'nt':
                 msvcrt.locking(self._fd.fileno(), msvcrt.LK_NBLCK, -1)
+            elif self.shared is True:
+                fcntl.flock(self._fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
             else:
                 fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
         except IOError:
+            self._close_file()
+            return False
+
+        # the lock file could have been removed by the previous holder
+        # after it was opened, in which case a new file has to be locked.
+        if os.name != 'nt':
+            try:
+                current = os.stat(self.filename)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+                current = None
+            if (current is None or
+                    current.st_ino != os.fstat(self._fd.fileno()).st_ino):
+                self._close_file()
+                return False
+        return True
+
+    def _record_owner(self):
+        """
+        Record this process as the owner of the exclusive lock, reporting
+        the owner left behind by a holder which did not release the lock.
+        """
+        self.stale_owner = self.owner()
+        if self.stale_owner is not None:
+            logging.warning(
+                "Taking over stale lock %r left by process %s on %s.",
+                self.filename,
+                self.stale_owner.get("pid"),
+                self.stale_owner.get("host"),
+            )
+
+        self._fd.seek(0)
+        self._fd.truncate()
+        self._fd.write(
+            json.dumps(
+                {
+                    "pid": os.getpid(),
+                    "host": socket.gethostname(),
+                    "time": time.time(),
+                }
+            )
+        )
+        self._fd.flush()
+
+    def _describe_owner(self):
+        """
+        Describe the current owner of the lock for error messages.
+
+        :returns: Description of the owner.
+        :rtype: :class:`str`
+        """
+        owner = self.owner()
+        if owner is None:
+            return "an unknown owner"
+
+        description = "process {0} on {1}".format(
+            owner.get("pid"), owner.get("host")
+        )
+        if owner.get("host") == socket.gethostname():
+            try:
+                os.kill(owner.get("pid"), 0)
+            except OSError as error:
+                if error.errno == errno.ESRCH:
+                    # the lock was inherited by a child of the dead owner.
+                    description += " (dead, lock inherited by its children)"
+            except TypeError:
+                pass
+        return description
+
+    def acquire(self):
+        if self.locked is True:
             raise interfaces.AcquireError(
-                "Failed acquiring a lock on {0!r}.".format(self.filename)
+                "Failed to acquire lock."
             )
+
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        delay = self.backoff
+        while not self._try_acquire():
+            remaining = delay
+            if deadline is not None:
+                remaining = deadline - time.time()
+            if remaining <= 0:
+                raise interfaces.AcquireError(
+                    "Failed acquiring a lock on {0!r} held by {1}.".format(
+                        self.filename,
+                        self._describe_owner(),
+                    )
+                )
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.MAX_BACKOFF)
+
+        if self.shared is False:
+            self._record_owner()
         super(FileLock, self).acquire()
 
     def _close_file(self):
         if self._fd is not None:
             self._fd.close()
+            self._fd = None
 
     def release(self):
+        if self._fd is not None and self.shared is False:
+            # clear the owner while the lock is still held.
+            self._fd.seek(0)
+            self._fd.truncate()
         self._close_file()
         super(FileLock, self).release()
 
@@ -101,15 +259,31 @@ class DirectoryLock(Lock):
     """
     Directory based locking.
 
+    The lock file is removed again when the exclusive lock is released.
+    It is removed while the lock is still held, and acquiring the lock
+    checks that the file locked is still the lock file, so another process
+    can not take the lock on a removed file.
+
+    While the lock is held, the ``.active`` file is locked as well. Readers
+    of the path never take the lock, they check whether it is held with
+    :meth:`is_held`, which only holds a shared lock on the ``.active`` file
+    for a moment, and which the holder waits for. A reader can therefore
+    never keep the path from being locked.
+
     :param path: Path that you are locking.
     :type path: :class:`str`
+    :param timeout: Seconds to keep trying to acquire the lock for, see
+        :class:`~.FileLock`.
+    :type timeout: :class:`float`
     """
 
-    def __init__(self, path):
+    def __init__(self, path, timeout=0):
         super(DirectoryLock, self).__init__()
         self.path = path
         self.filename = os.path.join(path, ".lock")
-        self._filelock = FileLock(self.filename)
+        self.active_filename = os.path.join(path, ".active")
+        self._filelock = FileLock(self.filename, timeout=timeout)
+        self._active = FileLock(self.active_filename, timeout=None)
 
     @property
     def locked(self):
@@ -121,21 +295,84 @@ class DirectoryLock(Lock):
         """
         return self._filelock.locked
 
+    @property
+    def stale_owner(self):
+        """
+        Owner left behind in the lock file by a holder which did not
+        release the lock, found when the lock was last acquired.
+
+        :returns: The stale owner, see :meth:`~.FileLock.owner`.
+        :rtype: :class:`dict` or :obj:`None`
+        """
+        return self._filelock.stale_owner
+
+    def owner(self):
+        """
+        Return the owner of the exclusive lock.
+
+        :returns: The owner, see :meth:`~.FileLock.owner`.
+        :rtype: :class:`dict` or :obj:`None`
+        """
+        return self._filelock.owner()
+
+    def is_held(self):
+        """
+        Check whether the lock is held, by this or another process, without
+        waiting for it and without creating any file.
+
+        :returns: True if the lock is held.
+        :rtype: :class:`bool`
+        """
+        if self.locked is True:
+            return True
+        if not os.path.exists(self.active_filename):
+            return False
+
+        probe = FileLock(self.active_filename, shared=True)
+        try:
+            probe.acquire()
+        except interfaces.AcquireError:
+            return True
+        probe.release()
+        return False
+
     def acquire(self):
         try:
             self._filelock.acquire()
-        except interfaces.AcquireError:
+        except interfaces.AcquireError as error:
             raise interfaces.AcquireError(
-                "Failed acquiring a lock for path {0!r}.".format(self.path)
+                "Failed acquiring a lock for path {0!r}: {1}".format(
+                    self.path, error
+                )
             )
 
+        try:
+            # only ever held for a moment by the readers checking the lock.
+            self._active.acquire()
+        except Exception:
+            self._filelock.release()
+            raise
+
+    def _remove_file(self):
+        try:
+            os.remove(self.filename)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+
     def release(self):
+        remove = self.locked is True
+        if self._active.locked is True:
+            self._active.release()
+        if remove is True and os.name != 'nt':
+            self._remove_file()
         try:
             self._filelock.release()
         except interfaces.ReleaseError:
             raise interfaces.ReleaseError(
                 "Failed releasing the lock for path {0!r}.".format(self.path)
             )
-        finally:
-            if os.path.isfile(self.filename):
-                os.remove(self.filename)
+
+        # open files can not be removed on Windows.
+        if remove is True and os.name == 'nt':
+            self._remove_file()
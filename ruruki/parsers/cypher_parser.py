@@ -2,7 +2,24 @@
 """
 https://s3.amazonaws.com/artifacts.opencypher.org/cypher.ebnf
 """
+from collections import OrderedDict, namedtuple
+import heapq
+import itertools
+import operator
+import re
+import sys
+import threading
 import parsley
+from ruruki import interfaces
+from ruruki.entities import OPERATORS
+from ruruki.parsers import fast_cypher_parser
+
+try:
+    STRING_TYPES = (str, unicode)
+    NUMBER_TYPES = (int, long, float)
+except NameError:
+    STRING_TYPES = (str,)
+    NUMBER_TYPES = (int, float)
 
 
 Parser = parsley.makeGrammar(
@@ -69,14 +86,14 @@ Parser = parsley.makeGrammar(
     ReturnItem = Expression:ex SP A S SP SymbolicName:s -> ["ReturnItem", ex, s]
                | Expression:ex -> ["ReturnItem", ex, None]
 
-    Order =  O R D E R SP B Y SP SortItem:head (',' WS SortItem)*:tail -> ["Order", [head] + tail]
+    Order =  O R D E R SP B Y SP SortItem:head (WS ',' WS SortItem)*:tail -> ["Order", [head] + tail]
 
     Skip =  S K I P SP Expression:ex -> ["Skip", ex]
 
     Limit =  L I M I T SP Expression:ex -> ["Limit", ex]
 
-    SortItem = Expression:ex (D E S C E N D I N G | D E S C) -> ["sort", ex, "desc"]
-             | Expression:ex (A S C E N D I N G | A S C)? -> ["sort", ex, "asc"]
+    SortItem = Expression:ex SP (D E S C E N D I N G | D E S C) -> ["sort", ex, "desc"]
+             | Expression:ex (SP (A S C E N D I N G | A S C))? -> ["sort", ex, "asc"]
 
     Where = W H E R E SP Expression:ex -> ["Where", ex]
 
@@ -103,7 +120,7 @@ Parser = parsley.makeGrammar(
                  (
                      Properties:p WS -> p
                  )?:p
-                ')' -> ["NodePattern", s, nl, p]
+                ')' -> ["NodePattern", v, nl, p]
 
     PatternElementChain = RelationshipPattern:rp WS NodePattern:np -> ["PatternElementChain", rp, np]
 
@@ -126,7 +143,10 @@ Parser = parsley.makeGrammar(
 
     NodeLabel = ':' LabelName:n -> ["NodeLabel", n]
 
-    RangeLiteral = (WS IntegerLiteral)?:start WS ('..' WS IntegerLiteral)?:stop WS -> slice(start, stop)
+    RangeLiteral = (WS IntegerLiteral)?:start WS (
+                       '..' WS IntegerLiteral?:stop WS -> slice(start, stop)
+                       | -> slice(start, start)
+                   )
 
     LabelName = SymbolicName
 
@@ -247,10 +267,14 @@ Parser = parsley.makeGrammar(
     # PropertyLookup = WS '.' WS ((PropertyKeyName ('?' | '!')) | PropertyKeyName)
     PropertyLookup = WS '.' WS PropertyKeyName:n -> ["PropertyLookup", n]
 
-    CaseExpression =
-                     C A S E WS
-                     (Expression)?:ex
-                     (WS CaseAlternatives)+:cas 
+    CaseExpression = C A S E
+                     (WS CaseAlternatives)+:cas
+                     (WS E L S E WS Expression)?:el
+                     WS E N D
+                     -> ["Case", None, cas, el]
+                   | C A S E WS
+                     Expression:ex
+                     (WS CaseAlternatives)+:cas
                      (WS E L S E WS Expression)?:el
                      WS E N D
                      -> ["Case", ex, cas, el]
@@ -395,178 +419,1664 @@ Parser = parsley.makeGrammar(
 )
 
 
-def literal(context, value):
-    return value
-
-
-def variable(context, name):
-    return context[name]
-
-
-def minus(context, ast):
-    v = cypher_eval(ast, context)
-    return -v
-
-
-def hat(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1**v2
-
-
-def multi(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1*v2
-
-
-def div(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1/v2
-
-
-def mod(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1%v2
-
-
-def add(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1+v2
-
-
-def sub(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1-v2
-
-
-def eq(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1 == v2
-
-
-def neq(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1 != v2
-
-
-def lt(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1<v2
-
-
-def gt(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1>v2
-
 
-def lte(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1<=v2
 
-
-def gte(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1>=v2
-
-
-def not_(context, ast):
-    v = cypher_eval(ast, context)
-    return not v
-
-
-def and_(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1 and v2
+def _null_safe(func):
+    # Cypher expressions are null if any of their arguments is null.
+    def wrapper(*args):
+        if any(each is None for each in args):
+            return None
+        try:
+            return func(*args)
+        except TypeError:
+            # values of different types do not compare.
+            return None
+    return wrapper
+
+
+def _ordered(func):
+    # only numbers, strings and values of the same type are ordered.
+    def compare(v1, v2):
+        if (isinstance(v1, NUMBER_TYPES) and isinstance(v2, NUMBER_TYPES) or
+                isinstance(v1, STRING_TYPES) and
+                isinstance(v2, STRING_TYPES) or
+                type(v1) is type(v2)):
+            return func(v1, v2)
+        return None
+    return compare
+
+
+def _binary(operation):
+    def compiler(ast1, ast2):
+        func1 = compile_ast(ast1)
+        func2 = compile_ast(ast2)
+
+        def binary(context):
+            v1 = func1(context)
+            v2 = func2(context)
+            if v1 is None or v2 is None:
+                return None
+            try:
+                return operation(v1, v2)
+            except TypeError:
+                return None
+        return binary
+    return compiler
+
+
+def literal(value):
+    if isinstance(value, dict):
+        # map literals hold the expressions of their values.
+        items = [(key, compile_ast(each)) for key, each in value.items()]
+        return lambda context: dict(
+            (key, func(context)) for key, func in items
+        )
+    return lambda context: value
+
+
+def variable(name):
+    def lookup(context):
+        try:
+            return context[name]
+        except KeyError:
+            raise interfaces.QueryError(
+                "Unknown variable {0!r}".format(name)
+            )
+    return lookup
+
+
+def parameter(name):
+    def lookup(context):
+        try:
+            return context["__parameters__"][name]
+        except KeyError:
+            raise interfaces.QueryError(
+                "Missing parameter {0!r}".format(name)
+            )
+    return lookup
+
+
+def minus(ast):
+    func = compile_ast(ast)
+
+    def negate(context):
+        v = func(context)
+        return None if v is None else -v
+    return negate
+
+
+hat = _binary(operator.pow)
+multi = _binary(operator.mul)
+div = _binary(lambda v1, v2: v1 / v2)
+mod = _binary(operator.mod)
+add = _binary(operator.add)
+sub = _binary(operator.sub)
+eq = _binary(operator.eq)
+neq = _binary(operator.ne)
+lt = _binary(_ordered(operator.lt))
+gt = _binary(_ordered(operator.gt))
+lte = _binary(_ordered(operator.le))
+gte = _binary(_ordered(operator.ge))
+
+
+def not_(ast):
+    func = compile_ast(ast)
+
+    def negate(context):
+        v = func(context)
+        return None if v is None else not v
+    return negate
+
+
+def and_(ast1, ast2):
+    func1 = compile_ast(ast1)
+    func2 = compile_ast(ast2)
+
+    def conjunction(context):
+        v1 = func1(context)
+        if v1 is False:
+            return False
+        v2 = func2(context)
+        if v2 is False:
+            return False
+        if v1 is None or v2 is None:
+            return None
+        return True
+    return conjunction
+
+
+def xor(ast1, ast2):
+    func1 = compile_ast(ast1)
+    func2 = compile_ast(ast2)
+
+    def exclusive(context):
+        v1 = func1(context)
+        v2 = func2(context)
+        if v1 is None or v2 is None:
+            return None
+        return bool(v1) != bool(v2)
+    return exclusive
+
+
+def or_(ast1, ast2):
+    func1 = compile_ast(ast1)
+    func2 = compile_ast(ast2)
+
+    def disjunction(context):
+        v1 = func1(context)
+        if v1 is True:
+            return True
+        v2 = func2(context)
+        if v2 is True:
+            return True
+        if v1 is None or v2 is None:
+            return None
+        return False
+    return disjunction
+
+
+def list_(asts):
+    funcs = [compile_ast(each) for each in asts]
+    return lambda context: [func(context) for func in funcs]
+
+
+def case(ex, alt, el):
+    # without a expression the first alternative which is true is used.
+    func = None if ex is None else compile_ast(ex)
+    alternatives = [
+        (compile_ast(when_), compile_ast(then_)) for when_, then_ in alt
+    ]
+    otherwise = literal(None) if el is None else compile_ast(el)
+
+    def choose(context):
+        v = True if func is None else func(context)
+        for when_, then_ in alternatives:
+            if when_(context) == v:
+                return then_(context)
+        return otherwise(context)
+    return choose
+
+
+def _property(value, key):
+    try:
+        return value.properties.get(key)
+    except AttributeError:
+        pass
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return value.get(key)
+    raise interfaces.QueryError(
+        "Can not look up property {0!r} of {1!r}".format(key, value)
+    )
+
+
+def _has_labels(labels):
+    labels = [label for _, label in labels]
+
+    def check(value):
+        if value is None:
+            return None
+        return all(label == value.label for label in labels)
+    return check
+
+
+def expression2(atom, lookups):
+    if (atom[0] == "Variable" and len(lookups) == 1 and
+            lookups[0][0] == "PropertyLookup"):
+        # the common n.key is looked up without any intermediate calls.
+        name, key = atom[1], lookups[0][1]
+
+        def property_of(context):
+            try:
+                value = context[name]
+            except KeyError:
+                raise interfaces.QueryError(
+                    "Unknown variable {0!r}".format(name)
+                )
+            try:
+                return value.properties.get(key)
+            except AttributeError:
+                return _property(value, key)
+        return property_of
+
+    func = compile_ast(atom)
+    steps = []
+    for lookup in lookups:
+        if lookup[0] == "PropertyLookup":
+            steps.append(lambda value, key=lookup[1]: _property(value, key))
+        else:
+            # label predicate, for example a:person
+            steps.append(_has_labels(lookup))
+
+    def evaluate(context):
+        value = func(context)
+        for step in steps:
+            value = step(value)
+        return value
+    return evaluate
+
+
+def _subscript(ast):
+    func = compile_ast(ast)
+
+    def subscript(context, value):
+        key = func(context)
+        if value is None or key is None:
+            return None
+        if isinstance(value, (interfaces.IEntity, dict)):
+            return _property(value, key)
+        try:
+            return value[key]
+        except IndexError:
+            return None
+        except TypeError:
+            raise interfaces.QueryError(
+                "Can not subscript {0!r} with {1!r}".format(value, key)
+            )
+    return subscript
+
+
+def _slice(start, end):
+    start = literal(None) if start is None else compile_ast(start)
+    end = literal(None) if end is None else compile_ast(end)
+
+    def slice_(context, value):
+        if value is None:
+            return None
+        return value[start(context):end(context)]
+    return slice_
+
+
+def _string_operator(operation):
+    def compiler(ast):
+        func = compile_ast(ast)
+
+        def compare(context, value):
+            other = func(context)
+            if not isinstance(value, STRING_TYPES):
+                return None
+            if not isinstance(other, STRING_TYPES):
+                return None
+            return operation(value, other)
+        return compare
+    return compiler
+
+
+def _regex(ast):
+    if ast[0] == "Literal":
+        # constant patterns are compiled once.
+        pattern = re.compile("(?:{0})\\Z".format(ast[1]))
+        operation = lambda value, other: pattern.match(value) is not None
+    else:
+        operation = lambda value, other: re.match(
+            "(?:{0})\\Z".format(other), value
+        ) is not None
+    return _string_operator(operation)(ast)
+
+
+def _in(ast):
+    func = compile_ast(ast)
+
+    def contains(context, value):
+        values = func(context)
+        if values is None:
+            return None
+        return value in values
+    return contains
+
+
+EXPRESSION3_OPERATIONS = {
+    "PropertyLookup": _subscript,
+    "slice": _slice,
+    "regex": _regex,
+    "in": _in,
+    "starts_with": _string_operator(lambda v1, v2: v1.startswith(v2)),
+    "ends_with": _string_operator(lambda v1, v2: v1.endswith(v2)),
+    "contains": _string_operator(lambda v1, v2: v2 in v1),
+    "is_null": lambda: lambda context, value: value is None,
+    "is_not_null": lambda: lambda context, value: value is not None,
+}
 
 
-def xor(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return bool(v1) != bool(v2)
+def expression3(ex, operations):
+    func = compile_ast(ex)
+    steps = [
+        EXPRESSION3_OPERATIONS[each[0]](*each[1:]) for each in operations
+    ]
+
+    def evaluate(context):
+        value = func(context)
+        for step in steps:
+            value = step(context, value)
+        return value
+    return evaluate
+
+
+FUNCTIONS = {
+    "id": _null_safe(lambda entity: entity.ident),
+    "labels": _null_safe(lambda vertex: [vertex.label]),
+    "type": _null_safe(lambda edge: edge.label),
+    "properties": _null_safe(lambda entity: dict(entity.properties)),
+    "keys": _null_safe(
+        lambda value: sorted(getattr(value, "properties", value))
+    ),
+    "startnode": _null_safe(lambda edge: edge.head),
+    "endnode": _null_safe(lambda edge: edge.tail),
+    "exists": lambda value: value is not None,
+    "coalesce": lambda *values: next(
+        (each for each in values if each is not None), None
+    ),
+    "size": _null_safe(len),
+    "head": _null_safe(lambda values: values[0] if values else None),
+    "last": _null_safe(lambda values: values[-1] if values else None),
+    "abs": _null_safe(abs),
+    "tolower": _null_safe(lambda value: value.lower()),
+    "toupper": _null_safe(lambda value: value.upper()),
+    "trim": _null_safe(lambda value: value.strip()),
+    "tostring": _null_safe(str),
+    "tointeger": _null_safe(int),
+    "tofloat": _null_safe(float),
+}
 
 
-def or_(context, ast1, ast2):
-    v1 = cypher_eval(ast1, context)
-    v2 = cypher_eval(ast2, context)
-    return v1 or v2
+class _Count(object):
+    """
+    Number of the values.
+    """
+    __slots__ = ["result"]
 
+    def __init__(self):
+        self.result = 0
 
-def list_(context, asts):
-    return [cypher_eval(each, context) for each in asts]
+    def add(self, _):
+        self.result += 1
 
 
-def case(context, ex, alt, el):
-    v = cypher_eval(ex, context)
-    for when_, then_ in alt:
-        wv = cypher_eval(when_, context)
-        if v == wv:
-            tv = cypher_eval(then_, context)
-            return tv
-    return cypher_eval(el, context)
+class _Sum(object):
+    """
+    Sum of the values.
+    """
+    __slots__ = ["result"]
 
+    def __init__(self):
+        self.result = 0
 
-def match(context, pattern, where_):
-    assert where_ is None
+    def add(self, value):
+        if not isinstance(value, NUMBER_TYPES) or isinstance(value, bool):
+            raise interfaces.QueryError(
+                "sum() of a non number {0!r}".format(value)
+            )
+        self.result += value
+
+
+class _Avg(object):
+    """
+    Average of the values.
+    """
+    __slots__ = ["total", "count"]
+
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+
+    def add(self, value):
+        if not isinstance(value, NUMBER_TYPES) or isinstance(value, bool):
+            raise interfaces.QueryError(
+                "avg() of a non number {0!r}".format(value)
+            )
+        self.total += value
+        self.count += 1
+
+    @property
+    def result(self):
+        if self.count == 0:
+            return None
+        return self.total / float(self.count)
+
+
+class _Collect(object):
+    """
+    List of the values.
+    """
+    __slots__ = ["result"]
+
+    def __init__(self):
+        self.result = []
+
+    def add(self, value):
+        self.result.append(value)
+
+
+class _Min(object):
+    """
+    Smallest of the values, values of different types are compared in the
+    ``ORDER BY`` order.
+    """
+    __slots__ = ["key", "result"]
+
+    def __init__(self):
+        self.key = None
+        self.result = None
+
+    def add(self, value):
+        key = _sort_key(value)
+        if self.key is None or key < self.key:
+            self.key = key
+            self.result = value
+
+
+class _Max(_Min):
+    """
+    Largest of the values.
+    """
+    __slots__ = []
+
+    def add(self, value):
+        key = _sort_key(value)
+        if self.key is None or key > self.key:
+            self.key = key
+            self.result = value
+
+
+class _Distinct(object):
+    """
+    Aggregation of the distinct values only, for ``DISTINCT`` arguments.
+    """
+    __slots__ = ["aggregation", "seen"]
+
+    def __init__(self, aggregation):
+        self.aggregation = aggregation
+        self.seen = set()
+
+    def add(self, value):
+        key = _hash_key(value)
+        if key not in self.seen:
+            self.seen.add(key)
+            self.aggregation.add(value)
+
+    @property
+    def result(self):
+        return self.aggregation.result
+
+
+AGGREGATIONS = {
+    "avg": _Avg,
+    "collect": _Collect,
+    "count": _Count,
+    "max": _Max,
+    "min": _Min,
+    "sum": _Sum,
+}
 
 
-def node_pattern(context, name, labels, properties):
-    entities = context["__entityset__"]
+def call(name, distinct, args):
+    func = FUNCTIONS.get(name.lower())
+    if func is None:
+        if name.lower() in AGGREGATIONS:
+            raise interfaces.QueryError(
+                "Aggregation function {0!r} can only be used in "
+                "RETURN".format(name)
+            )
+        raise interfaces.QueryError("Unknown function {0!r}".format(name))
+    funcs = [compile_ast(each) for each in args]
+
+    def invoke(context):
+        try:
+            return func(*[each(context) for each in funcs])
+        except (AttributeError, ValueError) as error:
+            raise interfaces.QueryError(
+                "Function {0!r} failed: {1}".format(name, error)
+            )
+    return invoke
+
+
+def count_all():
+    return call("count", None, [])
+
+
+def _bind(context, name, value):
+    row = dict(context)
+    if name is not None:
+        row[name] = value
+    return row
+
+
+def _properties(properties):
+    # compiled property map of a pattern, or None if there is none.
+    return None if properties is None else compile_ast(properties)
+
+
+def _properties_match(entity, properties):
+    for key, value in properties.items():
+        if value is None or entity.properties.get(key) != value:
+            return False
+    return True
+
+
+def _filters(filters):
+    # compiled WHERE comparisons pushed down to a node, see push_down.
+    return [(key, verb, compile_ast(value)) for key, verb, value in filters]
+
+
+def _filters_match(entity, filters, context):
+    for key, verb, value in filters:
+        prop_value = entity.properties.get(key)
+        value = value(context)
+        if prop_value is None or value is None:
+            return False
+        if not PUSHDOWN_FILTERS[verb](prop_value, value):
+            return False
+    return True
+
+
+def _node_check(name, labels, properties, filters=()):
+    labels = [label for _, label in labels or []]
+    properties = _properties(properties)
+    filters = _filters(filters)
+
+    def check(context, vertex):
+        if (name is not None and name in context and
+                context[name] is not vertex):
+            return False
+        for label in labels:
+            if label != vertex.label:
+                return False
+        if (properties is not None and
+                not _properties_match(vertex, properties(context))):
+            return False
+        return _filters_match(vertex, filters, context)
+    return check
+
+
+def node_pattern(name, labels, properties, filters=()):
+    check = _node_check(None, labels, properties, filters)
+    labels = [label for _, label in labels or []]
+    properties = _properties(properties)
+    filters = _filters(filters)
+
+    def candidates(context):
+        if name is not None and name in context:
+            vertex = context[name]
+            if (isinstance(vertex, interfaces.IVertex) and
+                    check(context, vertex)):
+                return [vertex]
+            return []
+
+        props = {} if properties is None else properties(context)
+        for key, verb, value in filters:
+            if verb == "eq":
+                props[key] = value(context)
+        if any(each is None for each in props.values()):
+            return []
+
+        # the vertices are looked up in the label and property indexes,
+        # the other comparisons are checked on each vertex as the entity
+        # filters do not follow the Cypher comparison rules.
+        vertices = context["__graph__"].vertices.iter_filter(
+            labels[0] if labels else None, **props
+        )
+        return (
+            each for each in vertices
+            if all(label == each.label for label in labels[1:]) and
+            _filters_match(each, filters, context)
+        )
+    return candidates
+
+
+def _relationships(vertex, left, right, labels, properties):
+    seen = set()
     for label in labels:
-        label = cypher_eval(label, context) # check is easier to get directly
-        entities = entities.filter(label=label)
-    props = cypher_eval(properties, context)
-    entities = entities.filter(**props)
-    return entities
-
+        if right is not None or left is None:
+            for edge in vertex.out_edges.iter_filter(label, **properties):
+                seen.add(edge)
+                yield edge, edge.tail
+        if left is not None or right is None:
+            for edge in vertex.in_edges.iter_filter(label, **properties):
+                # a edge looping back is only matched once.
+                if edge not in seen:
+                    yield edge, edge.head
+
+
+def _flipped(left, right):
+    # directions of a relationship followed from its other end.
+    return ("<" if right else None), (">" if left else None)
+
+
+def _distances(vertex, left, right, labels, properties, matched, high):
+    # fewest relationships from each vertex within high of a vertex, not
+    # following the relationships already matched by the pattern.
+    distances = {vertex: 0}
+    frontier = [vertex]
+    depth = 0
+    while frontier and (high is None or depth < high):
+        depth += 1
+        level = []
+        for each in frontier:
+            for edge, other in _relationships(each, left, right, labels,
+                                              properties):
+                if other in distances or edge in matched:
+                    continue
+                distances[other] = depth
+                level.append(other)
+        frontier = level
+    return distances
+
+
+def _paths(vertex, left, right, labels, properties, matched, length,
+           target=None):
+    """
+    Yield the relationships and vertices of every path from a vertex with
+    a number of relationships in the range, depth first. Like Cypher, a
+    path does not follow a relationship twice, nor a relationship already
+    matched by the pattern, so each path is a row of its own.
+
+    If the vertex at the other end is bound to ``target``, the fewest
+    relationships from each vertex to it are found first, searching
+    breadth first from the target, and a path is only followed to the
+    vertices from which the target can still be reached in the range.
+    A path never needs fewer relationships than that to reach the target,
+    so the same paths are found, without following the ones which never
+    reach it.
+    """
+    low = 1 if length.start is None else length.start
+    high = length.stop
+    distances = None
+    if target is not None:
+        back_left, back_right = _flipped(left, right)
+        distances = _distances(target, back_left, back_right, labels,
+                               properties, matched, high)
+        if vertex not in distances:
+            return
+
+    if low == 0 and target in (None, vertex):
+        yield []
+
+    # relationships which may not be followed, the path so far, and the
+    # relationships left to follow from each vertex on it.
+    followed = set(matched)
+    hops = []
+    stack = [_relationships(vertex, left, right, labels, properties)]
+    while stack:
+        for edge, other in stack[-1]:
+            if edge in followed:
+                continue
+            depth = len(hops) + 1
+            if distances is not None and (
+                    other not in distances or
+                    (high is not None and depth + distances[other] > high)):
+                continue
+
+            followed.add(edge)
+            hops.append((edge, other))
+            if depth >= low and target in (None, other):
+                yield list(hops)
+            if high is None or depth < high:
+                stack.append(
+                    _relationships(other, left, right, labels, properties)
+                )
+            else:
+                stack.append(iter(()))
+            break
+        else:
+            stack.pop()
+            if hops:
+                followed.discard(hops.pop()[0])
+
+
+def _variable_expansion(name, length, left, right, labels, properties,
+                        node, reverse, filters):
+    node_name = node[1]
+    check = _node_check(*node[1:], filters=filters)
+
+    def expand(context):
+        props = {} if properties is None else properties(context)
+        if any(each is None for each in props.values()):
+            return
+
+        path = context["__path__"]
+        matched = context.get("__edges__", ())
+        vertex = path[0] if reverse else path[-1]
+        target = context.get(node_name) if node_name is not None else None
+        if not isinstance(target, interfaces.IVertex):
+            target = None
+
+        for hops in _paths(vertex, left, right, labels, props, matched,
+                           length, target):
+            other = hops[-1][1] if hops else vertex
+            edges = [edge for edge, _ in hops]
+            steps = []
+            for edge, each in hops:
+                steps.extend([edge, each])
+            if reverse:
+                edges.reverse()
+                steps.reverse()
+            if (name is not None and name in context and
+                    context[name] != edges):
+                continue
+            if not check(context, other):
+                continue
+
+            row = _bind(_bind(context, name, edges), node_name, other)
+            row["__edges__"] = matched + tuple(edges)
+            if reverse:
+                row["__path__"] = steps + path
+            else:
+                row["__path__"] = path + steps
+            yield row
+    return expand
+
+
+def _expansion(relationship, node, reverse=False, filters=()):
+    _, left, detail, right = relationship
+    if reverse:
+        # expanding from the node on the right to the node on the left.
+        left, right = _flipped(left, right)
+    name = types = length = properties = None
+    if detail is not None:
+        _, variable_, _, types, length, properties = detail
+        if variable_ is not None:
+            name = variable_[1]
+
+    labels = [None] if types is None else types[1:]
+    properties = _properties(properties)
+    if length is not None:
+        return _variable_expansion(name, length, left, right, labels,
+                                   properties, node, reverse, filters)
+    node_name = node[1]
+    check = _node_check(*node[1:], filters=filters)
+
+    def expand(context):
+        props = {} if properties is None else properties(context)
+        if any(each is None for each in props.values()):
+            return
+
+        path = context["__path__"]
+        matched = context.get("__edges__", ())
+        vertex = path[0] if reverse else path[-1]
+        for edge, other in _relationships(vertex, left, right, labels,
+                                          props):
+            # a relationship is only matched once by a pattern.
+            if edge in matched:
+                continue
+            if (name is not None and name in context and
+                    context[name] is not edge):
+                continue
+            if not check(context, other):
+                continue
+
+            row = _bind(_bind(context, name, edge), node_name, other)
+            row["__edges__"] = matched + (edge,)
+            if reverse:
+                row["__path__"] = [other, edge] + path
+            else:
+                row["__path__"] = path + [edge, other]
+            yield row
+    return expand
+
+
+# estimated fraction of the vertices with a property key which have the
+# value matched by a pattern, as there are no statistics of the values.
+EQUALITY_SELECTIVITY = 0.1
+
+# estimated fraction of the vertices with a property key which match the
+# other WHERE comparisons pushed down to the filter of the key.
+RANGE_SELECTIVITY = 0.3
+
+FILTER_SELECTIVITY = {
+    "eq": EQUALITY_SELECTIVITY,
+    "ne": 1 - EQUALITY_SELECTIVITY,
+}
 
-def singlequery(context, match, with_, return_):
-    assert with_ is None
-    return cypher_eval(return_, context)
 
+class PlanStep(namedtuple("PlanStep", ["operator", "index", "pattern",
+                                       "estimated_rows"])):
+    """
+    Step of the plan matching a pattern element, see :func:`explain`.
+
+    :param operator: ``Argument`` for a vertex bound by a earlier pattern,
+        ``NodeUniqueSeek`` for a vertex with a unique property,
+        ``NodeByLabelScan`` or ``AllNodesScan`` for the other vertices the
+        match starts from, and ``Expand`` or ``ExpandReverse`` for following
+        a relationship forward or backward from the vertices matched so far.
+    :type operator: :class:`str`
+    :param index: Index of the starting node, or of the relationship, in
+        the pattern element.
+    :type index: :class:`int`
+    :param pattern: The node or relationship, in Cypher.
+    :type pattern: :class:`str`
+    :param estimated_rows: Estimated number of rows after the step, for
+        each row matched by the earlier patterns.
+    :type estimated_rows: :class:`float`
+    """
+    __slots__ = ()
+
+
+def _describe_value(ast):
+    if ast[0] == "Parameter":
+        return "{{{0}}}".format(ast[1])
+    if isinstance(ast[1], STRING_TYPES):
+        return "'{0}'".format(ast[1])
+    if ast[1] is None:
+        return "null"
+    if isinstance(ast[1], bool):
+        return str(ast[1]).lower()
+    return str(ast[1])
+
+
+def _describe_node(node, filters=()):
+    _, name, labels, properties = node
+    text = name or ""
+    for _, label in labels or []:
+        text += ":" + label
+    if properties is not None:
+        if properties[0] == "Parameter":
+            keys = ["{{{0}}}".format(properties[1])]
+        else:
+            keys = sorted(properties[1])
+        text += " {" + ", ".join(keys) + "}"
+    if filters:
+        text += " WHERE " + " AND ".join(
+            "{0}.{1} {2} {3}".format(
+                name, key, PUSHDOWN_SYMBOLS[verb], _describe_value(value)
+            )
+            for key, verb, value in filters
+        )
+    return "(" + text.strip() + ")"
+
+
+def _describe_relationship(relationship, reverse):
+    _, left, detail, right = relationship
+    if reverse:
+        left, right = _flipped(left, right)
+    text = ""
+    if detail is not None:
+        _, variable_, _, types, length, _ = detail
+        text = variable_[1] if variable_ is not None else ""
+        if types is not None:
+            text += ":" + "|".join(types[1:])
+        if length is not None:
+            text += "*"
+            if length.start is not None and length.start == length.stop:
+                text += str(length.start)
+            elif length.start is not None or length.stop is not None:
+                text += "{0}..{1}".format(
+                    "" if length.start is None else length.start,
+                    "" if length.stop is None else length.stop,
+                )
+        text = "[" + text + "]"
+    return (left or "") + "-" + text + "-" + (right or "")
+
+
+def _node_estimate(graph, node, bound, constraints, filters=()):
+    """
+    Return the operator and the estimated number of vertices matched by a
+    node pattern on its own, and the WHERE comparisons pushed down to it.
+    """
+    _, name, labels, properties = node
+    if name is not None and name in bound:
+        return "Argument", 1.0
+
+    label = labels[0][1] if labels else None
+    keys = []
+    if properties is not None and properties[0] == "Literal":
+        keys = [(key, "eq") for key in properties[1]]
+    keys += [(key, verb) for key, verb, _ in filters]
+    total = float(graph.vertices.count(label))
+    if any((label, key) in constraints
+           for key, verb in keys if verb == "eq"):
+        return "NodeUniqueSeek", min(1.0, total)
+
+    estimate = total
+    for key, verb in keys:
+        if total:
+            estimate *= (
+                graph.vertices.count(label, key) / total *
+                FILTER_SELECTIVITY.get(verb, RANGE_SELECTIVITY)
+            )
+    return "NodeByLabelScan" if label else "AllNodesScan", estimate
+
+
+def _paths_estimate(degree, length, edges):
+    # paths matched by a variable length relationship from each vertex,
+    # which are at most as long as the number of edges, as none of them is
+    # followed twice.
+    low = 1 if length.start is None else length.start
+    high = edges if length.stop is None else min(length.stop, edges)
+    if high < low:
+        return 0.0
+    if degree == 1.0:
+        return float(high - low + 1)
+    try:
+        return (degree ** (high + 1) - degree ** low) / (degree - 1.0)
+    except OverflowError:
+        # unlike infinity, the largest float is still zero when multiplied
+        # by zero.
+        return sys.float_info.max
+
+
+def plan_element(graph, nodes, relationships, bound=(), filters=None):
+    """
+    Plan the matching of a pattern element, starting from a node pattern
+    bound by the earlier patterns, or else from the node pattern matching
+    the fewest vertices, and expanding along the relationships from there,
+    rather than from the first node pattern.
+
+    The number of vertices each node pattern matches is estimated from the
+    unique constraints and the label and property indexes of the graph, see
+    :meth:`~.IEntitySet.count`, and the number of edges each vertex has from
+    the number of edges with the relationship types.
+
+    :param graph: Graph the pattern is matched in.
+    :type graph: :class:`~.IGraph`
+    :param nodes: Node patterns of the element.
+    :type nodes: :class:`list`
+    :param relationships: Relationship patterns between the nodes.
+    :type relationships: :class:`list`
+    :param bound: Names of the variables bound by the earlier patterns.
+    :type bound: Container of :class:`str`
+    :param filters: WHERE comparisons pushed down to the nodes, keyed by
+        variable name, see :func:`push_down`.
+    :type filters: :class:`dict`
+    :returns: The step matching the starting node, followed by the steps
+        expanding to the nodes on its right and then on its left.
+    :rtype: :class:`list` of :class:`PlanStep`
+    """
+    filters = filters or {}
+    node_filters = [filters.get(each[1], ()) for each in nodes]
+    constraints = set(graph.get_vertex_constraints())
+    estimates = [
+        _node_estimate(graph, each, bound, constraints, node_filters[index])
+        for index, each in enumerate(nodes)
+    ]
+    # a bound vertex is used as it is, while the others are looked up.
+    anchor = min(
+        range(len(nodes)),
+        key=lambda index: (estimates[index][0] != "Argument",
+                           estimates[index][1]),
+    )
+    operator, rows = estimates[anchor]
+    steps = [
+        PlanStep(
+            operator,
+            anchor,
+            _describe_node(nodes[anchor], node_filters[anchor]),
+            rows,
+        )
+    ]
+
+    vertices = float(graph.vertices.count()) or 1.0
+    edges = len(graph.edges)
+    order = [(index, False) for index in range(anchor, len(relationships))]
+    order += [(index, True) for index in reversed(range(anchor))]
+    for index, reverse in order:
+        relationship = relationships[index]
+        node_index = index if reverse else index + 1
+        node = nodes[node_index]
+        _, left, detail, right = relationship
+        types = [None]
+        if detail is not None and detail[3] is not None:
+            types = detail[3][1:]
+
+        degree = sum(graph.edges.count(each) for each in types) / vertices
+        if (left is None) == (right is None):
+            degree *= 2
+        if detail is not None and detail[4] is not None:
+            degree = _paths_estimate(degree, detail[4], edges)
+        selectivity = min(
+            1.0,
+            _node_estimate(
+                graph, node, bound, constraints, node_filters[node_index]
+            )[1] / vertices,
+        )
+        rows *= degree * selectivity
+        steps.append(
+            PlanStep(
+                "ExpandReverse" if reverse else "Expand",
+                index,
+                _describe_relationship(relationship, reverse) +
+                _describe_node(node, node_filters[node_index]),
+                rows,
+            )
+        )
+    return steps
+
+
+def _anchor_rows(context, name, vertices):
+    for vertex in vertices:
+        row = _bind(context, name, vertex)
+        row["__path__"] = [vertex]
+        yield row
+
+
+def _expand_rows(expand, rows):
+    # each row is expanded as it is needed, so the rows of a pattern are
+    # never all held at once.
+    for each in rows:
+        for row in expand(each):
+            yield row
+
+
+def pattern_element(node, chains, filters=None):
+    filters = filters or {}
+    nodes = [node] + [each for _, _, each in chains]
+    relationships = [relationship for _, relationship, _ in chains]
+    node_filters = [filters.get(each[1], ()) for each in nodes]
+    candidates = [
+        node_pattern(*each[1:], filters=node_filters[index])
+        for index, each in enumerate(nodes)
+    ]
+    # expand along the edges of the vertices matched so far, rather than
+    # matching each node pattern on its own and joining them.
+    forward = [
+        _expansion(relationship, nodes[index + 1],
+                   filters=node_filters[index + 1])
+        for index, relationship in enumerate(relationships)
+    ]
+    backward = [
+        _expansion(relationship, nodes[index], reverse=True,
+                   filters=node_filters[index])
+        for index, relationship in enumerate(relationships)
+    ]
+    key = object()
+
+    def match_element(context):
+        # planned once per run, as every row has the same bound variables.
+        plans = context.get("__plans__", {})
+        plan = plans.get(key)
+        if plan is None:
+            plan = plans[key] = plan_element(
+                context["__graph__"], nodes, relationships, context, filters
+            )
+
+        anchor = plan[0].index
+        rows = _anchor_rows(
+            context, nodes[anchor][1], candidates[anchor](context)
+        )
+        for step in plan[1:]:
+            if step.operator == "Expand":
+                rows = _expand_rows(forward[step.index], rows)
+            else:
+                rows = _expand_rows(backward[step.index], rows)
+        return rows
+    return match_element
+
+
+def pattern_part(variable_, element, filters=None):
+    func = pattern_element(*element[1:], filters=filters)
+    if variable_ is None:
+        return func
+
+    name = variable_[1]
+    return lambda context: (
+        _bind(row, name, row["__path__"]) for row in func(context)
+    )
+
+
+def where(ex):
+    return compile_ast(ex)
+
+
+# WHERE comparisons pushed down to the property filters, keyed by their
+# operator, with the filter operator used when the property is on the left
+# and on the right of the comparison.
+PUSHDOWN_OPERATORS = {
+    "eq": ("eq", "eq"),
+    "neq": ("ne", "ne"),
+    "lt": ("lt", "gt"),
+    "lte": ("le", "ge"),
+    "gt": ("gt", "lt"),
+    "gte": ("ge", "le"),
+    "starts_with": ("startswith", None),
+    "ends_with": ("endswith", None),
+}
 
-def return_body(context, items, order, skip, limit):
-    assert order is None
-    assert skip is None
-    assert limit is None
-    return cypher_eval(items, context)
+PUSHDOWN_SYMBOLS = {
+    "eq": "=",
+    "ne": "<>",
+    "lt": "<",
+    "le": "<=",
+    "gt": ">",
+    "ge": ">=",
+    "startswith": "STARTS WITH",
+    "endswith": "ENDS WITH",
+}
 
 
-def return_item(context, ex, name):
-    v = cypher_eval(ex, context)
-    return v, name
+def _pushdown_filter(verb):
+    # the entity filter operator of a pushed down comparison, which like
+    # the comparison does not match values it can not compare.
+    func = OPERATORS[verb]
+    if verb in ("eq", "ne"):
+        return lambda prop_value, value: func(prop_value, value, False)
+    if verb in ("startswith", "endswith"):
+        return lambda prop_value, value: (
+            isinstance(prop_value, STRING_TYPES) and
+            isinstance(value, STRING_TYPES) and
+            func(prop_value, value, False)
+        )
+    return _null_safe(
+        _ordered(lambda prop_value, value: func(prop_value, value, False))
+    )
+
+
+PUSHDOWN_FILTERS = dict(
+    (verb, _pushdown_filter(verb)) for verb in PUSHDOWN_SYMBOLS
+)
 
 
-def return_items(context, items):
+def _node_property(ast, names):
+    # variable name and key of a n.key lookup of a node variable.
+    if (ast[0] == "Expression2" and ast[1][0] == "Variable" and
+            ast[1][1] in names and len(ast[2]) == 1 and
+            ast[2][0][0] == "PropertyLookup"):
+        return ast[1][1], ast[2][0][1]
+    return None
+
+
+def _is_constant(ast):
+    # map literals hold expressions, which may use variables.
+    return (ast[0] == "Parameter" or
+            ast[0] == "Literal" and not isinstance(ast[1], dict))
+
+
+def _pushed_filter(ast, names):
+    # variable name, key, filter operator and value of a comparison of a
+    # node property with a constant, or None.
+    operation = ast[0]
+    operands = []
+    if operation in PUSHDOWN_OPERATORS:
+        operands = [(ast[1], ast[2], 0), (ast[2], ast[1], 1)]
+    elif ast[0] == "Expression3" and len(ast[2]) == 1:
+        operation = ast[2][0][0]
+        if operation in PUSHDOWN_OPERATORS:
+            operands = [(ast[1], ast[2][0][1], 0)]
+
+    for lookup, value, side in operands:
+        verb = PUSHDOWN_OPERATORS[operation][side]
+        lookup = _node_property(lookup, names)
+        if verb is not None and lookup is not None and _is_constant(value):
+            return lookup[0], lookup[1], verb, value
+    return None
+
+
+def push_down(pattern, ex):
+    """
+    Split a ``WHERE`` expression into the comparisons of a node property
+    with a literal or a parameter, such as ``n.age > 30`` or
+    ``n.name STARTS WITH 'J'``, which are pushed down to the property
+    filters of the nodes, see :meth:`~.IEntitySet.filter`, and the
+    residual expression evaluated for every matched row.
+
+    Only the comparisons joined to the rest of the expression by ``AND``
+    are pushed down, as the rows kept are those matching all of them.
+
+    :param pattern: Pattern parts of the ``MATCH`` clause.
+    :type pattern: :class:`list`
+    :param ex: Expression of the ``WHERE`` clause.
+    :type ex: :class:`list`
+    :returns: The pushed down comparisons as lists of ``(key, operator,
+        value)`` keyed by node variable name, and the residual expression,
+        or :obj:`None` if every comparison was pushed down.
+    :rtype: :class:`tuple` (:class:`dict`, :class:`list` or :obj:`None`)
+    """
+    names = set()
+    for _, _, (_, node, chains) in pattern:
+        names.update(
+            each[1] for each in [node] + [each for _, _, each in chains]
+        )
+    names.discard(None)
+
+    conjuncts = []
+    stack = [ex]
+    while stack:
+        ex = stack.pop()
+        if ex[0] == "and":
+            stack.extend([ex[2], ex[1]])
+        else:
+            conjuncts.append(ex)
+
+    filters = {}
+    residual = []
+    for ex in conjuncts:
+        pushed = _pushed_filter(ex, names)
+        if pushed is None:
+            residual.append(ex)
+            continue
+        name, key, verb, value = pushed
+        node_filters = filters.setdefault(name, [])
+        # a key is filtered once per operator.
+        if any(key == each[0] and verb == each[1] for each in node_filters):
+            residual.append(ex)
+        else:
+            node_filters.append((key, verb, value))
+
+    if not residual:
+        return filters, None
+    ex = residual[-1]
+    for each in reversed(residual[:-1]):
+        ex = ["and", each, ex]
+    return filters, ex
+
+
+def match(pattern, where_):
+    filters = {}
+    residual = None
+    if where_ is not None:
+        # the comparisons of node properties are filtered while the nodes
+        # are looked up and expanded to, before the rows are built.
+        filters, residual = push_down(pattern, where_[1])
+    parts = [pattern_part(*part[1:], filters=filters) for part in pattern]
+    predicate = None if residual is None else compile_ast(residual)
+
+    def match_pattern(context):
+        rows = iter([context])
+        for part in parts:
+            rows = _expand_rows(part, rows)
+        if predicate is not None:
+            rows = (row for row in rows if predicate(row) is True)
+        return rows
+    return match_pattern
+
+
+def singlequery(match_, with_, return_):
+    if with_ is not None:
+        raise interfaces.QueryError("WITH is not supported")
+    rows = None if match_ is None else compile_ast(match_)
+    project = compile_ast(return_)
+
+    def run(context):
+        matched = iter([context]) if rows is None else rows(context)
+        return project(context, matched)
+    return run
+
+
+def _row_count(clause, ast):
+    func = compile_ast(ast)
+
+    def count(context):
+        value = func(context)
+        if (not isinstance(value, NUMBER_TYPES) or
+                isinstance(value, (bool, float)) or value < 0):
+            raise interfaces.QueryError(
+                "{0} must be a non negative integer, not {1!r}".format(
+                    clause, value
+                )
+            )
+        return value
+    return count
+
+
+def _sort_key(value):
+    # values of different types are ordered as maps, vertices, edges, lists,
+    # strings, booleans and numbers, with null last.
+    if value is None:
+        return (9,)
+    if isinstance(value, bool):
+        return (6, value)
+    if isinstance(value, NUMBER_TYPES):
+        return (7, value)
+    if isinstance(value, STRING_TYPES):
+        return (5, value)
+    if isinstance(value, interfaces.IVertex):
+        return (1, value.ident)
+    if isinstance(value, interfaces.IEdge):
+        return (2, value.ident)
+    if isinstance(value, dict):
+        return (0, tuple(
+            (key, _sort_key(each)) for key, each in sorted(value.items())
+        ))
+    if isinstance(value, (list, tuple)):
+        return (3, tuple(_sort_key(each) for each in value))
+    return (8, repr(value))
+
+
+class _Descending(object):
+    """
+    Sort key ordered the other way around, for ``DESC`` sort items.
+    """
+    __slots__ = ["key"]
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return self.key != other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    __hash__ = None
+
+
+def _order(sort_items):
+    # sort key of the rows, and True if the rows are sorted in reverse.
+    funcs = [compile_ast(ex) for _, ex, _ in sort_items]
+    descending = [direction == "desc" for _, _, direction in sort_items]
+    if all(descending) or not any(descending):
+        # rows sorted in a single direction have plain keys, which are much
+        # cheaper to compare.
+        if len(funcs) == 1:
+            func = funcs[0]
+            return lambda scope: _sort_key(func(scope)), descending[0]
+        return (
+            lambda scope: tuple(_sort_key(each(scope)) for each in funcs),
+            descending[0],
+        )
+
+    funcs = list(zip(funcs, descending))
+
+    def key(scope):
+        return tuple(
+            _Descending(_sort_key(func(scope))) if reverse else
+            _sort_key(func(scope))
+            for func, reverse in funcs
+        )
+    return key, False
+
+
+def _variables(ast):
+    # names of the variables used by a tree.
+    if isinstance(ast, dict):
+        ast = list(ast.values())
+    if isinstance(ast, list):
+        if len(ast) == 2 and ast[0] == "Variable":
+            yield ast[1]
+        for each in ast:
+            for name in _variables(each):
+                yield name
+
+
+def _aliases(items):
+    # returned column names which are not the variable of the same name.
+    return set(
+        each[2] for each in items
+        if each != "*" and each[2] is not None and
+        each[1] != ["Variable", each[2]]
+    )
+
+
+def _decorated(key, pairs):
+    for row, projected in pairs:
+        # the sort items see the returned columns as well as the variables.
+        scope = dict(row)
+        scope.update(projected)
+        yield key(scope), projected
+
+
+def _sorted(decorated, reverse, count):
+    first = operator.itemgetter(0)
+    if count is None:
+        return sorted(decorated, key=first, reverse=reverse)
+    if reverse:
+        # only the first rows are kept, in a bounded heap, rather than
+        # sorting all the rows.
+        return heapq.nlargest(count, decorated, key=first)
+    return heapq.nsmallest(count, decorated, key=first)
+
+
+def _ordered_rows(project, order, rows, count):
+    key, reverse = order
+    ordered = _sorted(((key(row), row) for row in rows), reverse, count)
+    return (project(row) for _, row in ordered)
+
+
+def _ordered_projections(order, pairs, count):
+    key, reverse = order
+    ordered = _sorted(_decorated(key, pairs), reverse, count)
+    return (projected for _, projected in ordered)
+
+
+def _hash_key(value):
+    # hashable key of a value, equal for the values which are equal in
+    # Cypher, so that lists and maps can be grouped in hash tables too.
+    if not isinstance(value, (bool, list, tuple, dict)):
+        return value
+    if isinstance(value, bool):
+        # True and 1 are the same key in Python.
+        return (bool, value)
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(_hash_key(each) for each in value))
+    return (dict, frozenset(
+        (key, _hash_key(each)) for key, each in value.items()
+    ))
+
+
+def _distinct(pairs):
+    seen = set()
+    for row, projected in pairs:
+        key = _hash_key(projected)
+        if key not in seen:
+            seen.add(key)
+            yield row, projected
+
+
+def _is_aggregation(ast):
+    if ast[0] == "count *":
+        return True
+    return (
+        ast[0] == "call" and len(ast) == 4 and
+        ast[1].lower() in AGGREGATIONS
+    )
+
+
+def _replace_aggregations(ast, calls):
+    # copy of a tree with its aggregation calls replaced by their results,
+    # the calls are appended to calls.
+    if isinstance(ast, dict):
+        return dict(
+            (key, _replace_aggregations(each, calls))
+            for key, each in ast.items()
+        )
+    if not isinstance(ast, list) or not ast:
+        return ast
+    if not _is_aggregation(ast):
+        return [_replace_aggregations(each, calls) for each in ast]
+
+    if ast[0] == "count *":
+        calls.append(("count", None, None))
+    else:
+        _, name, distinct, args = ast
+        if len(args) != 1:
+            raise interfaces.QueryError(
+                "Aggregation function {0!r} takes one argument".format(name)
+            )
+        nested = []
+        _replace_aggregations(args[0], nested)
+        if nested:
+            raise interfaces.QueryError(
+                "Aggregation functions can not be nested"
+            )
+        calls.append((name.lower(), distinct, args[0]))
+    return ["AggregationResult", len(calls) - 1]
+
+
+def aggregation_result(index):
+    return lambda context: context["__aggregations__"][index]
+
+
+def _returned_variables(context):
+    return dict(
+        (key, value) for key, value in context.items()
+        if not key.startswith("__")
+    )
+
+
+def aggregation(items):
+    """
+    Compile the returned items of a aggregating ``RETURN``.
+
+    The rows are grouped in a hash table keyed by the values of the items
+    without aggregation functions, and each group only keeps its first row
+    and the running state of its aggregations, so the rows are aggregated
+    in a single pass whatever their number.
+
+    :param items: Returned items.
+    :type items: :class:`list`
+    :returns: Function taking the context and the matched rows, and
+        yielding the first row and the projected row of each group, or
+        :obj:`None` if none of the items aggregate.
+    :rtype: :func:`callable` or :obj:`None`
+    """
+    calls = []
+    keys = []
+    replaced = []
+    for each in items:
+        if each == "*":
+            keys.append(_returned_variables)
+            replaced.append(each)
+            continue
+        count = len(calls)
+        ex = _replace_aggregations(each[1], calls)
+        if len(calls) == count:
+            keys.append(compile_ast(each[1]))
+        replaced.append([each[0], ex, each[2]])
+    if not calls:
+        return None
+
+    project = return_items(replaced)
+    factories = [
+        (AGGREGATIONS[name], distinct is not None)
+        for name, distinct, _ in calls
+    ]
+    # count(*) counts every row, null or not.
+    funcs = [
+        (lambda _: True) if arg is None else compile_ast(arg)
+        for _, _, arg in calls
+    ]
+
+    def create():
+        return [
+            _Distinct(factory()) if distinct else factory()
+            for factory, distinct in factories
+        ]
+
+    if len(keys) == 1:
+        # a single key is not wrapped in a tuple.
+        key_func = keys[0]
+        group_key = lambda row: _hash_key(key_func(row))
+    else:
+        group_key = lambda row: tuple(_hash_key(func(row)) for func in keys)
+
+    def aggregate(context, rows):
+        groups = OrderedDict()
+        for row in rows:
+            key = group_key(row)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = (row, create())
+            for func, state in zip(funcs, group[1]):
+                value = func(row)
+                # null values are left out of all the aggregations.
+                if value is not None:
+                    state.add(value)
+
+        if not groups and not keys:
+            # aggregating no rows at all still returns a row.
+            groups[()] = (context, create())
+
+        for row, states in groups.values():
+            scope = dict(row)
+            scope["__aggregations__"] = [each.result for each in states]
+            yield row, project(scope)
+    return aggregate
+
+
+def return_body(items, order, skip, limit, distinct=False):
+    aggregate = aggregation(items[1])
+    project = compile_ast(items) if aggregate is None else None
+    aliased = False
+    if order is not None:
+        aliased = bool(_aliases(items[1]) & set(_variables(order[1])))
+        order = _order(order[1])
+    skip = None if skip is None else _row_count("SKIP", skip[1])
+    limit = None if limit is None else _row_count("LIMIT", limit[1])
+
+    def body(context, rows):
+        start = 0 if skip is None else skip(context)
+        stop = None if limit is None else start + limit(context)
+        if aggregate is not None:
+            pairs = aggregate(context, rows)
+        elif distinct or order is not None and (aliased or stop is None):
+            pairs = ((row, project(row)) for row in rows)
+        else:
+            pairs = None
+        if distinct:
+            # the distinct rows are kept by their hashed values, as they
+            # are projected.
+            pairs = _distinct(pairs)
+
+        if pairs is not None:
+            if order is None:
+                rows = (projected for _, projected in pairs)
+            else:
+                rows = _ordered_projections(order, pairs, stop)
+        elif order is None:
+            # the rows are projected as they are matched, so the matching
+            # stops once the LIMIT is reached.
+            rows = (project(row) for row in rows)
+        else:
+            # the matched rows are bigger than the projected rows, so they
+            # are only kept until projected when the heap bounds them.
+            rows = _ordered_rows(project, order, rows, stop)
+        if start or stop is not None:
+            rows = itertools.islice(rows, start, stop)
+        return rows
+    return body
+
+
+def _column_name(ast):
+    # unnamed variables and properties are named as in the query.
+    if ast[0] == "Variable":
+        return ast[1]
+    if ast[0] == "Expression2" and ast[1][0] == "Variable":
+        names = [ast[1][1]]
+        for lookup in ast[2]:
+            if lookup[0] != "PropertyLookup":
+                return None
+            names.append(lookup[1])
+        return ".".join(names)
+    return None
+
+
+def return_items(items):
     count = 0
-    res = {}
+    columns = []
     for each in items:
-        v, name = cypher_eval(each, context)
+        if each == "*":
+            columns.append(("*", None))
+            continue
+
+        _, ex, name = each
+        if name is None:
+            name = _column_name(ex)
         if name is None:
             name = count
             count += 1
-        res[name] = v
-    return res
+        columns.append((name, compile_ast(ex)))
+
+    def project(context):
+        res = {}
+        for name, func in columns:
+            if func is None:
+                res.update(
+                    (key, value) for key, value in context.items()
+                    if not key.startswith("__")
+                )
+            else:
+                res[name] = func(context)
+        return res
+    return project
 
 
-def return_(context, distinct, body):
-    assert distinct is None
-    return cypher_eval(body, context)
+def return_(distinct, body):
+    return return_body(*body[1:], distinct=distinct is not None)
 
 
-ACTION_MAP = {
-    # "Atom": atom,
+COMPILERS = {
     "SingleQuery": singlequery,
     "List": list_,
     "Case": case,
@@ -589,22 +2099,347 @@ ACTION_MAP = {
     "hat": hat,
     "Variable": variable,
     "Literal": literal,
+    "Parameter": parameter,
+    "Expression2": expression2,
+    "Expression3": expression3,
+    "call": call,
+    "count *": count_all,
+    "AggregationResult": aggregation_result,
     "Match": match,
+    "PatternPart": pattern_part,
+    "PatternElement": pattern_element,
+    "Where": where,
     "Return": return_,
     "ReturnBody": return_body,
-    "ReturnItem": return_item,
     "ReturnItems": return_items,
 }
 
+
+def compile_ast(ast):
+    """
+    Compile a abstract syntax tree, or a part of it, to a Python function
+    evaluating it against a context holding the variables bound to their
+    values.
+
+    The tree is walked once, so evaluating the function for every row of
+    a query does not dispatch on the tree again.
+
+    :param ast: Abstract syntax tree, see :func:`parse`.
+    :type ast: :class:`list`
+    :returns: Function taking the context and returning the value.
+    :rtype: :func:`callable`
+    :raises QueryError: If the tree uses unsupported Cypher.
+    """
+    compiler = COMPILERS.get(ast[0])
+    if compiler is None:
+        raise interfaces.QueryError("{0} is not supported".format(ast[0]))
+    return compiler(*ast[1:])
+
+
 def cypher_eval(value, context):
-    name, args = value[0], value[1:]
-    return ACTION_MAP[name](context, *args)
+    return compile_ast(value)(context)
 
 
 def parse(query_string):
-    p = Parser(q).Cypher()
-    cypher_eval(p, {})
+    """
+    Parse a Cypher query.
+
+    Queries are parsed by :mod:`~ruruki.parsers.fast_cypher_parser` if they
+    are in the subset of Cypher it handles, and by the grammar otherwise.
+
+    :param query_string: Cypher query.
+    :type query_string: :class:`str`
+    :returns: Abstract syntax tree of the query.
+    :rtype: :class:`list`
+    :raises QueryError: If the query is not valid Cypher.
+    """
+    try:
+        return fast_cypher_parser.parse(query_string)
+    except fast_cypher_parser.UnsupportedSyntax:
+        pass
+
+    try:
+        return Parser(query_string).Cypher()
+    except parsley.ParseError as error:
+        raise interfaces.QueryError(
+            "Invalid query {0!r}: {1}".format(query_string, error)
+        )
+
+
+def compile_query(ast):
+    """
+    Compile a parsed Cypher query once, to be run any number of times.
+
+    The compiled query matches and projects the rows one at a time, as
+    they are iterated over.
+
+    :param ast: Abstract syntax tree of the query, see :func:`parse`.
+    :type ast: :class:`list`
+    :returns: Function taking the graph and the parameters of the query,
+        and returning a iterator over the rows, see :func:`execute`.
+    :rtype: :func:`callable`
+    :raises QueryError: If the query uses unsupported Cypher.
+    """
+    plan = compile_ast(ast)
+
+    def run(graph, parameters=None):
+        return plan(
+            {
+                "__graph__": graph,
+                "__parameters__": (
+                    parameters if parameters is not None else {}
+                ),
+                "__plans__": {},
+            }
+        )
+    return run
+
+
+def execute(graph, ast, parameters=None):
+    """
+    Run a parsed Cypher query against a graph.
+
+    :param graph: Graph to query.
+    :type graph: :class:`~.IGraph`
+    :param ast: Abstract syntax tree of the query, see :func:`parse`.
+    :type ast: :class:`list`
+    :param parameters: Values of the parameters used in the query.
+    :type parameters: :class:`dict` or :obj:`None`
+    :returns: One row per match, keyed by the returned column names.
+    :rtype: :class:`list` of :class:`dict`
+    :raises QueryError: If the query can not be run.
+    """
+    return list(compile_query(ast)(graph, parameters))
+
+
+# string literals and escaped names, which are kept as they are, and the
+# comments and whitespace outside of them.
+_NORMALIZE = re.compile(
+    r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)"""
+    r"""|(?://[^\n]*|/\*.*?\*/|\s)+""",
+    re.DOTALL,
+)
 
 
-#q = "MATCH (n:Person {name: 'Bob'}) RETURN DISTINCT n;"
-#parse(q)
+def normalize(query_string):
+    """
+    Normalize the text of a Cypher query, so that queries which only
+    differ in their layout share the same text.
+
+    Comments are removed, runs of whitespace outside of string literals
+    are collapsed to a single space, and the trailing ``;`` is removed.
+
+    :param query_string: Cypher query.
+    :type query_string: :class:`str`
+    :returns: Normalized query.
+    :rtype: :class:`str`
+    """
+    normalized = _NORMALIZE.sub(
+        lambda match: match.group(1) or " ",
+        query_string,
+    ).strip()
+    if normalized.endswith(";"):
+        normalized = normalized[:-1].rstrip()
+    return normalized
+
+
+class PlanCache(object):
+    """
+    Least recently used cache of compiled queries, keyed by their
+    normalized text, see :func:`normalize`.
+
+    Parsing a query is by far the slowest part of running it, so each
+    query is only parsed and compiled the first time it is seen. The
+    values of the ``{name}`` parameters are bound when the query runs, so
+    queries using parameters rather than literal values share the same
+    plan.
+
+    :param size: Maximum number of cached queries.
+    :type size: :class:`int`
+    """
+
+    def __init__(self, size=256):
+        if size < 1:
+            raise ValueError("Cache size needs to be at least 1.")
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._plans)
+
+    def get(self, query_string):
+        """
+        Return the compiled query, parsing and compiling it if it is not
+        cached, and mark it as the most recently used.
+
+        :param query_string: Cypher query.
+        :type query_string: :class:`str`
+        :returns: Compiled query, see :func:`compile_query`.
+        :rtype: :func:`callable`
+        :raises QueryError: If the query is not valid or uses unsupported
+            Cypher.
+        """
+        key = normalize(query_string)
+        with self._lock:
+            plan = self._plans.pop(key, None)
+            if plan is not None:
+                self._plans[key] = plan
+                self.hits += 1
+                return plan
+
+        # parsed outside of the lock so that other queries are not held up.
+        plan = compile_query(parse(query_string))
+        with self._lock:
+            self.misses += 1
+            self._plans[key] = plan
+            while len(self._plans) > self.size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def clear(self):
+        """
+        Remove all the cached queries.
+        """
+        with self._lock:
+            self._plans.clear()
+
+
+PLAN_CACHE = PlanCache()
+
+_EXPLAIN = re.compile(r"\s*EXPLAIN\s", re.IGNORECASE)
+
+
+def _bound_names(part):
+    # variables bound by a pattern part.
+    _, variable_, (_, node, chains) = part
+    names = [node[1]] + [each[1] for _, _, each in chains]
+    for _, (_, _, detail, _), _ in chains:
+        if detail is not None and detail[1] is not None:
+            names.append(detail[1][1])
+    if variable_ is not None:
+        names.append(variable_[1])
+    return [name for name in names if name is not None]
+
+
+def explain(graph, query_string):
+    """
+    Return the plan of a Cypher query against a graph, without running
+    the query.
+
+    :param graph: Graph to query.
+    :type graph: :class:`~.IGraph`
+    :param query_string: Cypher query.
+    :type query_string: :class:`str`
+    :returns: One row per step of the plan of each pattern, see
+        :class:`PlanStep`, keyed by ``part``, the index of the pattern in
+        the ``MATCH`` clause, and the fields of the step. The estimated
+        rows include the rows matched by the earlier patterns.
+    :rtype: :class:`list` of :class:`dict`
+    :raises QueryError: If the query is not valid or can not be run.
+    """
+    ast = parse(query_string)
+    compile_ast(ast)
+    rows = []
+    if ast[0] != "SingleQuery" or ast[1] is None:
+        return rows
+
+    _, pattern, where_ = ast[1]
+    filters = {} if where_ is None else push_down(pattern, where_[1])[0]
+    bound = set()
+    matched = 1.0
+    for number, part in enumerate(pattern):
+        _, _, (_, node, chains) = part
+        steps = plan_element(
+            graph,
+            [node] + [each for _, _, each in chains],
+            [relationship for _, relationship, _ in chains],
+            bound,
+            filters,
+        )
+        for step in steps:
+            row = dict(step._asdict(), part=number)
+            row["estimated_rows"] = round(matched * step.estimated_rows, 2)
+            rows.append(row)
+        matched *= steps[-1].estimated_rows
+        bound.update(_bound_names(part))
+    return rows
+
+
+def query(graph, query_string, parameters=None):
+    """
+    Run a Cypher read query against a graph.
+
+    Only ``MATCH ... WHERE ... RETURN ...`` read queries are supported.
+    Each pattern is matched by looking the node matching the fewest
+    vertices up in the label and property indexes of the graph, see
+    :func:`plan_element`, and expanding from there along the edges of the
+    vertices, filtered by label and properties with the edge indexes.
+    Comparisons of node properties in ``WHERE`` are filtered while the
+    nodes are matched, see :func:`push_down`, and the rows are matched one
+    at a time until the ``SKIP`` and ``LIMIT`` are reached, see
+    :func:`stream`. With ``ORDER BY`` and ``LIMIT``, only the first rows
+    are kept while matching, rather than sorting all of them.
+    ``RETURN`` items with ``count``, ``collect``, ``sum``, ``avg``, ``min``
+    or ``max`` group the rows by the other items, see :func:`aggregation`,
+    and ``DISTINCT`` rows are kept by their hashed values. Variable length
+    relationships, such as ``-[:knows*1..3]->``, match every path which
+    does not follow a relationship twice, and the paths to a bound vertex
+    only follow the vertices it can be reached from, see :func:`_paths`.
+    Queries starting with ``EXPLAIN`` return the plan instead of running
+    the query, see :func:`explain`.
+
+    Vertices and edges are returned as :class:`~.IVertex` and
+    :class:`~.IEdge`. Returned expressions without an ``AS`` name are named
+    after the variable or property they return, such as ``b.name``, and
+    numbered otherwise.
+
+    The compiled queries are kept in :data:`PLAN_CACHE`, see
+    :class:`PlanCache`, so pass values which change from one run to the
+    next as parameters.
+
+    :param graph: Graph to query.
+    :type graph: :class:`~.IGraph`
+    :param query_string: Cypher query.
+    :type query_string: :class:`str`
+    :param parameters: Values of the ``{name}`` parameters used in the
+        query.
+    :type parameters: :class:`dict` or :obj:`None`
+    :returns: One row per match, keyed by the returned column names.
+    :rtype: :class:`list` of :class:`dict`
+    :raises QueryError: If the query is not valid or can not be run.
+    """
+    return list(stream(graph, query_string, parameters))
+
+
+def stream(graph, query_string, parameters=None):
+    """
+    Run a Cypher read query against a graph, and iterate over the rows as
+    they are matched, see :func:`query`.
+
+    The vertices are scanned, expanded along their edges, filtered and
+    returned one row at a time, so that memory use does not grow with the
+    number of rows, and the match stops as soon as the ``LIMIT`` is
+    reached or the iteration is stopped.
+
+    .. note::
+
+        The graph should not be changed until the iteration is done.
+
+    :param graph: Graph to query.
+    :type graph: :class:`~.IGraph`
+    :param query_string: Cypher query.
+    :type query_string: :class:`str`
+    :param parameters: Values of the ``{name}`` parameters used in the
+        query.
+    :type parameters: :class:`dict` or :obj:`None`
+    :returns: One row per match, keyed by the returned column names.
+    :rtype: Iterator of :class:`dict`
+    :raises QueryError: If the query is not valid or can not be run.
+    """
+    explain_ = _EXPLAIN.match(query_string)
+    if explain_ is not None:
+        return iter(explain(graph, query_string[explain_.end():]))
+    return PLAN_CACHE.get(query_string)(graph, parameters)
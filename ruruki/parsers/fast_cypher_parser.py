@@ -0,0 +1,974 @@
+"""
+Hand written tokenizer and recursive descent parser for the commonly used
+subset of Cypher, ``MATCH``, ``WHERE`` and ``RETURN`` with ``ORDER BY``,
+``SKIP`` and ``LIMIT``.
+
+It produces the same abstract syntax tree as the parsley grammar of
+:mod:`~ruruki.parsers.cypher_parser`, which backtracks over every
+character and is by far the slowest part of running a query. Anything
+outside of the subset, or not valid Cypher, raises
+:class:`UnsupportedSyntax` and is left to the grammar, which also reports
+the syntax errors.
+
+The parsers can be compared with :mod:`~ruruki.test_utils.cypher_benchmark`.
+"""
+import re
+
+
+class UnsupportedSyntax(Exception):
+    """
+    Raised when a query is outside of the subset of Cypher handled by the
+    fast parser, or is not valid Cypher.
+    """
+
+
+# the whitespace of the grammar does not include carriage returns, and the
+# grammar does not backtrack into the integer part of an exponent, so it
+# rejects decimals with an exponent.
+_TOKEN = re.compile(
+    r"""
+    (?P<space>(?:[ \t\n]|//[^\r\n]*|/\*.*?\*/)+)
+    |(?P<unsupported>\d+\.\d+[eE]\d+)
+    |(?P<float>\d+[eE]\d+|\d+\.\d+)
+    |(?P<hex>0[xX][0-9a-fA-F]+)
+    |(?P<octal>0[0-7]+)
+    |(?P<integer>\d+)
+    |(?P<name>[^\W\d_]\w*)
+    |(?P<escaped>`(?:[^`]|``)*`)
+    |(?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    |(?P<operator>\.\.|=~|<>|!=|<=|>=|[-+*/%^=<>()\[\]{},.:;|?])
+    """,
+    re.VERBOSE | re.DOTALL | re.UNICODE,
+)
+
+_ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+
+_ESCAPES = {
+    "\\": "\\", "'": "'", '"': '"', "n": "\n", "N": "\n", "r": "\r",
+    "R": "\r", "t": "\t", "T": "\t", "_": "_", "%": "%",
+}
+
+_NUMBERS = {
+    "float": float,
+    "hex": lambda text: int(text, 16),
+    "octal": lambda text: int(text, 8),
+    "integer": int,
+}
+
+_COMPARISONS = {
+    "=": "eq", "<>": "neq", "!=": "neq", "<": "lt", ">": "gt", "<=": "lte",
+    ">=": "gte",
+}
+
+# arithmetic operators, from the lowest to the highest precedence.
+_ARITHMETIC = [
+    {"+": "add", "-": "sub"},
+    {"*": "multi", "/": "div", "%": "mod"},
+    {"^": "hat"},
+]
+
+_STRING_OPERATORS = [
+    (["IN"], "in"),
+    (["STARTS", "WITH"], "starts_with"),
+    (["ENDS", "WITH"], "ends_with"),
+    (["CONTAINS"], "contains"),
+]
+
+_DIRECTIONS = [
+    ("DESCENDING", "desc"), ("DESC", "desc"), ("ASCENDING", "asc"),
+    ("ASC", "asc"),
+]
+
+# maximum number of tokens the parser looks ahead.
+_LOOKAHEAD = 4
+
+# values of the keyword literals.
+_LITERALS = {"TRUE": True, "FALSE": False, "NULL": None}
+
+# atoms of the grammar which are not part of the subset.
+_FILTERS = set(["FILTER", "EXTRACT", "ALL", "ANY", "NONE", "SINGLE"])
+
+
+def _unescape(text):
+    """
+    Return the value of a string literal.
+
+    :param text: String literal, including the quotes.
+    :type text: :class:`str`
+    :returns: The string.
+    :rtype: :class:`str`
+    :raises UnsupportedSyntax: If the string uses an unknown escape.
+    """
+    if "\\" not in text:
+        return text[1:-1]
+
+    def replace(match):
+        try:
+            return _ESCAPES[match.group(1)]
+        except KeyError:
+            raise UnsupportedSyntax(
+                "Unknown escape {0!r}".format(match.group(0))
+            )
+
+    return _ESCAPE.sub(replace, text[1:-1])
+
+
+def tokenize(query_string):
+    """
+    Split a Cypher query into tokens.
+
+    Each token is a tuple of its kind, its text, its value and whether it
+    follows whitespace or a comment, which some keywords of the grammar
+    need. The kinds are ``name``, ``escaped`` for names in backticks,
+    ``number``, ``string``, ``operator`` and ``end``, for the end of the
+    query.
+
+    :param query_string: Cypher query.
+    :type query_string: :class:`str`
+    :returns: The tokens, ending with the ``end`` token.
+    :rtype: :class:`list` of :class:`tuple`
+    :raises UnsupportedSyntax: If the query holds characters which do not
+        start a token, or numbers which the grammar rejects.
+    """
+    tokens = []
+    spaced = False
+    position = 0
+    end = len(query_string)
+    match = _TOKEN.match
+    while position < end:
+        found = match(query_string, position)
+        if found is None:
+            raise UnsupportedSyntax(
+                "Unexpected character {0!r} at {1}".format(
+                    query_string[position], position
+                )
+            )
+
+        kind = found.lastgroup
+        text = found.group()
+        position = found.end()
+        if kind == "space":
+            spaced = True
+            continue
+        if kind == "unsupported":
+            raise UnsupportedSyntax(
+                "Unsupported number {0!r} at {1}".format(
+                    text, found.start()
+                )
+            )
+
+        value = text
+        if kind in _NUMBERS:
+            value = _NUMBERS[kind](text)
+            kind = "number"
+        elif kind == "string":
+            value = _unescape(text)
+        elif kind == "escaped":
+            value = text[1:-1].replace("``", "`")
+        tokens.append((kind, text, value, spaced))
+        spaced = False
+
+    tokens.append(("end", "", None, spaced))
+    return tokens
+
+
+class _Parser(object):
+    """
+    Recursive descent parser over the tokens of a query, with a private
+    method for each rule of the grammar which is part of the subset.
+
+    :param query_string: Cypher query.
+    :type query_string: :class:`str`
+    """
+
+    def __init__(self, query_string):
+        # padded with end tokens so that looking ahead never runs past it.
+        self.tokens = tokenize(query_string)
+        self.tokens.extend([self.tokens[-1]] * _LOOKAHEAD)
+        self.position = 0
+
+    def fail(self, expected):
+        """
+        Raise a :class:`UnsupportedSyntax` for the current token.
+
+        :param expected: What the parser expected.
+        :type expected: :class:`str`
+        :raises UnsupportedSyntax: Always.
+        """
+        raise UnsupportedSyntax(
+            "Expected {0} instead of {1!r}".format(
+                expected, self.tokens[self.position][1]
+            )
+        )
+
+    def peek(self, offset=0):
+        """
+        Return a token after the current token, without consuming it.
+
+        :param offset: Number of tokens to look ahead.
+        :type offset: :class:`int`
+        :returns: The token, or the ``end`` token past the end.
+        :rtype: :class:`tuple`
+        """
+        return self.tokens[self.position + offset]
+
+    def is_operator(self, text, offset=0):
+        """
+        Check if a token is an operator.
+
+        :param text: The operator.
+        :type text: :class:`str`
+        :param offset: Number of tokens to look ahead.
+        :type offset: :class:`int`
+        :returns: True if the token is the operator.
+        :rtype: :class:`bool`
+        """
+        kind, token_text, _, _ = self.peek(offset)
+        return kind == "operator" and token_text == text
+
+    def unspaced(self):
+        """
+        Check that the current token does not follow whitespace, which the
+        grammar does not allow in some places.
+
+        :raises UnsupportedSyntax: If the token follows whitespace.
+        """
+        if self.peek()[3]:
+            raise UnsupportedSyntax(
+                "Unexpected whitespace before {0!r}".format(self.peek()[1])
+            )
+
+    def accept(self, text, spaced=True):
+        """
+        Consume the current token if it is an operator.
+
+        :param text: The operator.
+        :type text: :class:`str`
+        :param spaced: If False, the operator may not follow whitespace.
+        :type spaced: :class:`bool`
+        :returns: True if the token was consumed.
+        :rtype: :class:`bool`
+        :raises UnsupportedSyntax: If the operator follows whitespace which
+            is not allowed.
+        """
+        if self.is_operator(text):
+            if not spaced:
+                self.unspaced()
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text, spaced=True):
+        """
+        Consume the current token, which has to be an operator.
+
+        :param text: The operator.
+        :type text: :class:`str`
+        :param spaced: If False, the operator may not follow whitespace.
+        :type spaced: :class:`bool`
+        :raises UnsupportedSyntax: If the token is not the operator, or
+            follows whitespace which is not allowed.
+        """
+        if not self.accept(text, spaced):
+            self.fail(repr(text))
+
+    def is_keyword(self, words, before=False, after=False, offset=0):
+        """
+        Check if the tokens are keywords, which are names in any case.
+        Multiple keywords need whitespace between them.
+
+        :param words: Upper case keywords.
+        :type words: :class:`list` of :class:`str`
+        :param before: If True, whitespace is needed before the keywords.
+        :type before: :class:`bool`
+        :param after: If True, whitespace is needed after the keywords.
+        :type after: :class:`bool`
+        :param offset: Number of tokens to look ahead.
+        :type offset: :class:`int`
+        :returns: True if the tokens are the keywords.
+        :rtype: :class:`bool`
+        """
+        for index, word in enumerate(words):
+            kind, text, _, spaced = self.peek(offset + index)
+            if kind != "name" or text.upper() != word:
+                return False
+            if (index > 0 or before) and not spaced:
+                return False
+        return not after or self.peek(offset + len(words))[3]
+
+    def keyword(self, words, before=False, after=False):
+        """
+        Consume the tokens if they are keywords, see :meth:`is_keyword`.
+
+        :returns: Text of the last keyword, or :obj:`None` if the tokens
+            are not the keywords.
+        :rtype: :class:`str` or :obj:`None`
+        """
+        if self.is_keyword(words, before, after):
+            self.position += len(words)
+            return self.tokens[self.position - 1][1]
+        return None
+
+    def expect_keyword(self, words, before=False, after=False):
+        """
+        Consume the tokens, which have to be keywords, see
+        :meth:`is_keyword`.
+
+        :raises UnsupportedSyntax: If the tokens are not the keywords.
+        """
+        if self.keyword(words, before, after) is None:
+            self.fail(" ".join(words))
+
+    def is_name(self, offset=0):
+        """
+        Check if a token is a name.
+
+        :param offset: Number of tokens to look ahead.
+        :type offset: :class:`int`
+        :returns: True if the token is a name, with or without backticks.
+        :rtype: :class:`bool`
+        """
+        return self.peek(offset)[0] in ("name", "escaped")
+
+    def name(self):
+        """
+        Consume a name.
+
+        :returns: The name.
+        :rtype: :class:`str`
+        :raises UnsupportedSyntax: If the token is not a name.
+        """
+        if not self.is_name():
+            self.fail("a name")
+        self.position += 1
+        return self.tokens[self.position - 1][2]
+
+    def cypher(self):
+        """
+        Parse a whole query, a ``SingleQuery`` with an optional ``MATCH``
+        and a ``RETURN``.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        if self.is_keyword(["OPTIONAL"]):
+            raise UnsupportedSyntax("OPTIONAL MATCH is not supported")
+
+        match = None
+        if self.keyword(["MATCH"]) is not None:
+            match = self._match()
+        if self.is_keyword(["WITH"]):
+            raise UnsupportedSyntax("WITH is not supported")
+        return_ = self._return()
+        self.accept(";")
+        if self.peek()[0] != "end":
+            self.fail("the end of the query")
+        return ["SingleQuery", match, None, return_]
+
+    def _match(self):
+        """
+        Parse the patterns and the optional ``WHERE`` of a ``MATCH``
+        clause.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        pattern = [self._pattern_part()]
+        while self.accept(",", spaced=False):
+            pattern.append(self._pattern_part())
+
+        where = None
+        if self.keyword(["WHERE"], after=True) is not None:
+            where = ["Where", self.expression()]
+        return ["Match", pattern, where]
+
+    def _pattern_part(self):
+        """
+        Parse a pattern, which may be assigned to a path variable.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        variable = None
+        if self.is_name() and self.is_operator("=", 1):
+            variable = ["Variable", self.name()]
+            self.position += 1
+        return ["PatternPart", variable, self._pattern_element()]
+
+    def _pattern_element(self):
+        """
+        Parse a node followed by a chain of relationships and nodes,
+        optionally in parentheses.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        if self.is_operator("(") and self.is_operator("(", 1):
+            self.position += 1
+            self.unspaced()
+            element = self._pattern_element()
+            self.expect(")", spaced=False)
+            return element
+
+        node = self._node_pattern()
+        chains = []
+        while self.is_operator("<") or self.is_operator("-"):
+            chains.append(
+                [
+                    "PatternElementChain",
+                    self._relationship_pattern(),
+                    self._node_pattern(),
+                ]
+            )
+        return ["PatternElement", node, chains]
+
+    def _node_pattern(self):
+        """
+        Parse a node with its optional variable, labels and
+        properties.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        self.expect("(")
+        variable = self.name() if self.is_name() else None
+        labels = None
+        if self.is_operator(":"):
+            labels = self._node_labels()
+        properties = self._properties() if self.is_operator("{") else None
+        self.expect(")")
+        return ["NodePattern", variable, labels, properties]
+
+    def _node_labels(self):
+        """
+        Parse the labels of a node, each following a colon.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        labels = []
+        while self.accept(":"):
+            self.unspaced()
+            labels.append(["NodeLabel", self.name()])
+        return labels
+
+    def _properties(self):
+        """
+        Parse the properties of a node or relationship, a map or a
+        parameter.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        if not self.is_operator("{"):
+            self.fail("properties")
+        return self._map_or_parameter()
+
+    def _relationship_pattern(self):
+        """
+        Parse a relationship with its direction and optional details.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        left = "<" if self.accept("<") else None
+        self.expect("-")
+        detail = self._relationship_detail() if self.is_operator("[") else None
+        self.expect("-")
+        right = ">" if self.accept(">") else None
+        return ["RelationshipsPattern", left, detail, right]
+
+    def _relationship_detail(self):
+        """
+        Parse the details of a relationship in brackets, its variable,
+        types, length and properties.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        # the grammar allows whitespace only before the properties, or
+        # before the closing bracket if there are none.
+        self.expect("[")
+        variable = None
+        if self.is_name():
+            self.unspaced()
+            variable = ["Variable", self.name()]
+        optional = "?" if self.accept("?", spaced=False) else None
+
+        types = None
+        if self.accept(":", spaced=False):
+            self.unspaced()
+            types = ["RelationshipTypes", self.name()]
+            while self.accept("|"):
+                self.accept(":", spaced=False)
+                types.append(self.name())
+
+        length = None
+        if self.accept("*", spaced=False):
+            start = self._integer()
+            stop = self._integer() if self.accept("..") else start
+            length = slice(start, stop)
+
+        properties = self._properties() if self.is_operator("{") else None
+        self.expect("]", spaced=properties is None)
+        return [
+            "RelationshipDetail", variable, optional, types, length, properties
+        ]
+
+    def _integer(self):
+        """
+        Consume an integer, if the current token is one.
+
+        :returns: The integer, or :obj:`None` if the token is not an
+            integer.
+        :rtype: :class:`int` or :obj:`None`
+        """
+        kind, _, value, _ = self.peek()
+        if kind == "number" and not isinstance(value, float):
+            self.position += 1
+            return value
+        return None
+
+    def _return(self):
+        """
+        Parse a ``RETURN`` clause with its optional ``DISTINCT``.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        self.expect_keyword(["RETURN"], after=True)
+        distinct = self.keyword(["DISTINCT"], before=True, after=True)
+        if distinct is not None:
+            # the grammar keeps the last character of the keyword.
+            distinct = distinct[-1]
+        elif self.is_name() and self.peek()[1].upper().startswith("DISTINCT"):
+            # the grammar reads the keyword and fails on the rest.
+            raise UnsupportedSyntax("Ambiguous {0!r}".format(self.peek()[1]))
+        return ["Return", distinct, self._return_body()]
+
+    def _return_body(self):
+        """
+        Parse the items of a ``RETURN`` clause, followed by the optional
+        ``ORDER BY``, ``SKIP`` and ``LIMIT``.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        if self.accept("*"):
+            items = ["*"]
+        else:
+            items = [self._return_item()]
+        while self.accept(","):
+            items.append(self._return_item())
+
+        order = skip = limit = None
+        if self.keyword(["ORDER", "BY"], before=True, after=True):
+            order = ["Order", [self._sort_item()]]
+            while self.accept(","):
+                order[1].append(self._sort_item())
+        if self.keyword(["SKIP"], before=True, after=True):
+            skip = ["Skip", self.expression()]
+        if self.keyword(["LIMIT"], before=True, after=True):
+            limit = ["Limit", self.expression()]
+        return ["ReturnBody", ["ReturnItems", items], order, skip, limit]
+
+    def _return_item(self):
+        """
+        Parse an expression to return, with its optional alias.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        expression = self.expression()
+        name = None
+        if self.keyword(["AS"], before=True, after=True):
+            name = self.name()
+        return ["ReturnItem", expression, name]
+
+    def _sort_item(self):
+        """
+        Parse an ``ORDER BY`` expression and its direction, which
+        defaults to ascending.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        expression = self.expression()
+        for word, direction in _DIRECTIONS:
+            if self.keyword([word]):
+                return ["sort", expression, direction]
+        return ["sort", expression, "asc"]
+
+    def expression(self):
+        """
+        Parse an expression. Like the grammar, the binary operators
+        associate to the right.
+        """
+        return self._boolean_expression(0)
+
+    def _boolean_expression(self, level):
+        """
+        Parse the ``OR``, ``XOR`` and ``AND`` expressions, from the
+        lowest precedence.
+
+        :param level: Precedence level to parse.
+        :type level: :class:`int`
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        if level == 3:
+            return self._expression9()
+        left = self._boolean_expression(level + 1)
+        word = ("OR", "XOR", "AND")[level]
+        if self.keyword([word], before=True, after=True):
+            return [word.lower(), left, self._boolean_expression(level)]
+        return left
+
+    def _expression9(self):
+        """
+        Parse an expression which may be negated by ``NOT``.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        if self.keyword(["NOT"], after=True):
+            return ["not", self._expression9()]
+        return self._expression8()
+
+    def _expression8(self):
+        """
+        Parse a comparison.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        left = self._expression7()
+        kind, text, _, _ = self.peek()
+        if kind == "operator" and text in _COMPARISONS:
+            self.position += 1
+            return [_COMPARISONS[text], left, self._expression8()]
+        return left
+
+    def _expression7(self):
+        """
+        Parse the arithmetic operators.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        return self._arithmetic(0)
+
+    def _arithmetic(self, level):
+        """
+        Parse the arithmetic operators, from the lowest precedence.
+
+        :param level: Precedence level to parse.
+        :type level: :class:`int`
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        if level == len(_ARITHMETIC):
+            return self._expression4()
+        left = self._arithmetic(level + 1)
+        operations = _ARITHMETIC[level]
+        kind, text, _, _ = self.peek()
+        if kind == "operator" and text in operations:
+            self.position += 1
+            return [operations[text], left, self._arithmetic(level)]
+        return left
+
+    def _expression4(self):
+        """
+        Parse an expression with its optional unary signs.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        if self.accept("+"):
+            return self._expression4()
+        if self.accept("-"):
+            return ["minus", self._expression4()]
+        return self._expression3()
+
+    def _expression3(self):
+        """
+        Parse an expression followed by subscripts, regular expression
+        matches, ``NULL`` checks and string operators.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        expression = self._expression2()
+        operations = []
+        while True:
+            kind, text, _, spaced = self.peek()
+            if kind == "operator" and text == "[":
+                self.position += 1
+                operations.append(self._subscript())
+            elif kind == "operator" and text == "=~":
+                self.position += 1
+                operations.append(["regex", self._expression2()])
+            elif kind != "name" or not spaced:
+                break
+            elif self.keyword(["IS", "NULL"], before=True):
+                operations.append(["is_null"])
+            elif self.keyword(["IS", "NOT", "NULL"], before=True):
+                operations.append(["is_not_null"])
+            else:
+                for words, name in _STRING_OPERATORS:
+                    if self.keyword(words, before=True):
+                        operations.append([name, self._expression2()])
+                        break
+                else:
+                    break
+
+        if operations:
+            return ["Expression3", expression, operations]
+        return expression
+
+    def _subscript(self):
+        """
+        Parse an index or a slice, after the opening bracket.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        # the grammar does not allow whitespace inside of the brackets.
+        self.unspaced()
+        start = None
+        if not self.is_operator(".."):
+            start = self.expression()
+            if self.accept("]", spaced=False):
+                return ["PropertyLookup", start]
+        self.expect("..", spaced=False)
+        end = None
+        if not self.is_operator("]"):
+            self.unspaced()
+            end = self.expression()
+        self.expect("]", spaced=False)
+        return ["slice", start, end]
+
+    def _expression2(self):
+        """
+        Parse an atom followed by its property lookups and labels.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        atom = self._atom()
+        lookups = []
+        while True:
+            if self.accept("."):
+                lookups.append(["PropertyLookup", self.name()])
+            elif self.is_operator(":") and not self.peek()[3]:
+                lookups.append(self._node_labels())
+            else:
+                break
+
+        if lookups:
+            return ["Expression2", atom, lookups]
+        return atom
+
+    def _atom(self):
+        """
+        Parse a literal, map, parameter, list, parenthesized expression,
+        ``CASE``, ``count(*)``, function call or variable.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        literal = self._literal()
+        if literal is not None:
+            return literal
+
+        kind, text, _, _ = self.peek()
+        if kind == "operator":
+            return self._bracketed(text)
+        word = text.upper() if kind == "name" else None
+        if word == "CASE":
+            return self._case()
+        if (word == "COUNT" and self.is_operator("(", 1) and
+                self.is_operator("*", 2) and self.is_operator(")", 3) and
+                not any(self.peek(each)[3] for each in range(1, 4))):
+            self.position += 4
+            return ["count *"]
+        if word in _FILTERS and self.is_operator("(", 1):
+            raise UnsupportedSyntax("{0} is not supported".format(text))
+        if self.is_name() and self.is_operator("(", 1):
+            return self._function_invocation()
+        return ["Variable", self.name()]
+
+    def _literal(self):
+        """
+        Consume a number, string, boolean or ``NULL`` literal, if the
+        current token is one.
+
+        :returns: Abstract syntax tree of the rule, or :obj:`None` if the
+            token is not a literal.
+        :rtype: :class:`list` or :obj:`None`
+        :raises UnsupportedSyntax: If the token is a name starting with a
+            boolean or ``NULL``.
+        """
+        kind, text, value, _ = self.peek()
+        if kind == "name":
+            word = text.upper()
+            if word not in _LITERALS:
+                if word.startswith(tuple(_LITERALS)):
+                    # the grammar reads the literal and fails on the rest.
+                    raise UnsupportedSyntax("Ambiguous {0!r}".format(text))
+                return None
+            value = _LITERALS[word]
+        elif kind not in ("number", "string"):
+            return None
+        self.position += 1
+        return ["Literal", value]
+
+    def _bracketed(self, text):
+        """
+        Parse a map, parameter, list or parenthesized expression.
+
+        :param text: The opening bracket.
+        :type text: :class:`str`
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        :raises UnsupportedSyntax: If the operator does not start an
+            expression.
+        """
+        if text == "{":
+            return self._map_or_parameter()
+        if text == "[":
+            return self._list()
+        if text != "(":
+            self.fail("an expression")
+        return self._parenthesized()
+
+    def _map_or_parameter(self):
+        """
+        Parse a map literal, or a parameter in braces.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        self.expect("{")
+        kind, text, value, _ = self.peek()
+        if self.is_operator("}", 1) and (
+                self.is_name() or (kind == "number" and text.isdigit())):
+            self.position += 2
+            return ["Parameter", int(text) if kind == "number" else value]
+
+        pairs = {}
+        if not self.accept("}"):
+            while True:
+                key = self.name()
+                self.expect(":")
+                pairs[key] = self.expression()
+                if self.accept("}"):
+                    break
+                self.expect(",")
+        return ["Literal", pairs]
+
+    def _list(self):
+        """
+        Parse a list literal.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        self.expect("[")
+        if self.is_name() and self.is_keyword(["IN"], before=True, offset=1):
+            raise UnsupportedSyntax("List comprehensions are not supported")
+
+        items = []
+        if not self.accept("]", spaced=False):
+            items.append(self.expression())
+            while self.accept(","):
+                items.append(self.expression())
+            self.expect("]")
+        return ["List", items]
+
+    def _parenthesized(self):
+        """
+        Parse an expression in parentheses.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        # like the grammar, anything which looks like a node is a pattern.
+        offset = 2 if self.is_name(1) else 1
+        if any(self.is_operator(each, offset) for each in (")", ":", "{")):
+            raise UnsupportedSyntax("Pattern expressions are not supported")
+
+        self.expect("(")
+        expression = self.expression()
+        self.expect(")")
+        return expression
+
+    def _case(self):
+        """
+        Parse a ``CASE`` expression, with or without a test expression.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        self.position += 1
+        expression = None
+        if not self.is_keyword(["WHEN"]):
+            expression = self.expression()
+
+        alternatives = []
+        while self.keyword(["WHEN"]):
+            when = self.expression()
+            self.expect_keyword(["THEN"])
+            alternatives.append([when, self.expression()])
+        if not alternatives:
+            self.fail("WHEN")
+
+        default = None
+        if self.keyword(["ELSE"]):
+            default = self.expression()
+        self.expect_keyword(["END"])
+        return ["Case", expression, alternatives, default]
+
+    def _function_invocation(self):
+        """
+        Parse a function call and its optional ``DISTINCT``.
+
+        :returns: Abstract syntax tree of the rule.
+        :rtype: :class:`list`
+        """
+        name = self.name()
+        self.expect("(")
+        kind, text, _, _ = self.peek()
+        if kind == "name" and text.upper().startswith("DISTINCT"):
+            if len(text) > len("DISTINCT"):
+                # the grammar splits the keyword from the rest of the name.
+                raise UnsupportedSyntax("Ambiguous {0!r}".format(text))
+            self.position += 1
+            distinct = "distinct"
+        else:
+            distinct = None
+
+        args = []
+        if not self.accept(")"):
+            args.append(self.expression())
+            while self.accept(",", spaced=False):
+                args.append(self.expression())
+            self.expect(")")
+        return ["call", name, distinct, args]
+
+
+def parse(query_string):
+    """
+    Parse a Cypher query in the subset handled by the fast parser.
+
+    :param query_string: Cypher query.
+    :type query_string: :class:`str`
+    :returns: Abstract syntax tree of the query, the same as the grammar of
+        :mod:`~ruruki.parsers.cypher_parser` returns.
+    :rtype: :class:`list`
+    :raises UnsupportedSyntax: If the query is not in the subset, or is not
+        valid Cypher.
+    """
+    return _Parser(query_string).cypher()
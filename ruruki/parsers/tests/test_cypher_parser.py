@@ -1,4 +1,5 @@
 #pylint: skip-file
+from ruruki import interfaces
 from ruruki.parsers import cypher_parser
 from ruruki.test_utils import base
 
@@ -7,11 +8,11 @@ from ruruki.test_utils import base
 class TestCypherEval(base.TestBase):
     def eval_query(self, query_string, expected_value):
         ast = cypher_parser.Parser(query_string).Cypher()
-        value = cypher_parser.cypher_eval(
+        rows = cypher_parser.cypher_eval(
             ast, {"__entityset__": self.graph.vertices}
         )
         self.assertEqual(
-            expected_value, value
+            expected_value, list(rows)
         )
 
     def eval_expression(self, query_string, expected_value, context={}):
@@ -126,8 +127,787 @@ class TestCypherEval(base.TestBase):
         self.eval_expression(q, "bye", {"x": 2})
         self.eval_expression(q, "what?", {"x": 3})
 
+    def test_null(self):
+        self.eval_expression("1 + NULL", None)
+        self.eval_expression("NULL = NULL", None)
+        self.eval_expression("1 < 'a'", None)
+        self.eval_expression("NOT NULL", None)
+        self.eval_expression("NULL AND FALSE", False)
+        self.eval_expression("NULL AND TRUE", None)
+        self.eval_expression("NULL OR TRUE", True)
+        self.eval_expression("NULL OR FALSE", None)
+
+    def test_expression3(self):
+        self.eval_expression("2 IN [1, 2]", True)
+        self.eval_expression("'marko' STARTS WITH 'ma'", True)
+        self.eval_expression("'marko' ENDS WITH 'ma'", False)
+        self.eval_expression("'marko' CONTAINS 'ark'", True)
+        self.eval_expression("'marko' =~ 'm.*o'", True)
+        self.eval_expression("'marko' =~ 'm'", False)
+        self.eval_expression("NULL IS NULL", True)
+        self.eval_expression("1 IS NOT NULL", True)
+        self.eval_expression("[1, 2, 3][1]", 2)
+        self.eval_expression("[1, 2, 3][1..]", [2, 3])
+
+    def test_map_literal(self):
+        self.eval_expression("{a: 1 + 1}", {"a": 2})
+        self.eval_expression("{a: 1}.a", 1)
+
+    def test_case_without_expression(self):
+        q = "CASE WHEN x > 1 THEN 'big' ELSE 'small' END"
+        self.eval_expression(q, "big", {"x": 2})
+        self.eval_expression(q, "small", {"x": 1})
+        self.eval_expression("CASE x WHEN 1 THEN 'one' END", None, {"x": 2})
+
+    def test_compile_ast(self):
+        ast = cypher_parser.Parser("a.age + 1 > b").Expression()
+        func = cypher_parser.compile_ast(ast)
+        self.assertEqual(func({"a": self.marko, "b": 29}), True)
+        self.assertEqual(func({"a": self.vadas, "b": 29}), False)
+        self.assertEqual(func({"a": {"age": 40}, "b": 29}), True)
+        self.assertEqual(func({"a": None, "b": 29}), None)
+
+    def test_compile_unsupported(self):
+        ast = cypher_parser.Parser("unknown(1)").Expression()
+        self.assertRaises(
+            interfaces.QueryError,
+            cypher_parser.compile_ast,
+            ast,
+        )
+
     def test_simplest_query(self):
-        self.eval_query("RETURN 1 + 2 as a;", {"a": 3})
+        self.eval_query("RETURN 1 + 2 as a;", [{"a": 3}])
 
     # def test_simple_match_query(self):
     #     self.eval_query("MATCH (a) RETURN a;", self.graph.vertices)
+
+
+class TestCypherQuery(base.TestBase):
+    def query(self, query_string, parameters=None):
+        rows = self.graph.query(query_string, parameters)
+        return sorted(sorted(each.items()) for each in rows)
+
+    def test_match(self):
+        self.assertEqual(
+            self.query(
+                "MATCH (a:person)-[:knows]->(b) WHERE b.age > 30 "
+                "RETURN b.name"
+            ),
+            [[("b.name", "josh")]],
+        )
+
+    def test_match_single_node(self):
+        self.assertEqual(
+            self.query("MATCH (a:app) RETURN a"),
+            sorted([[("a", self.lop)], [("a", self.ripple)]]),
+        )
+        self.assertEqual(
+            self.query("MATCH (a {name: 'marko'}) RETURN a.age AS age"),
+            [[("age", 29)]],
+        )
+        self.assertEqual(self.query("MATCH (a:person:app) RETURN a"), [])
+
+    def test_match_relationship(self):
+        self.assertEqual(
+            self.query(
+                "MATCH (a)-[r:knows {weight: 1}]->(b) RETURN a, r, b"
+            ),
+            [[("a", self.marko), ("b", self.josh),
+              ("r", self.marko_knows_josh)]],
+        )
+        self.assertEqual(
+            self.query(
+                "MATCH (a:app)<-[:created]-(b) WHERE a.name = 'ripple' "
+                "RETURN b.name"
+            ),
+            [[("b.name", "josh")]],
+        )
+        self.assertEqual(
+            self.query("MATCH ({name: 'josh'})--(b) RETURN b.name"),
+            [[("b.name", "lop")], [("b.name", "marko")],
+             [("b.name", "ripple")]],
+        )
+        self.assertEqual(
+            self.query(
+                "MATCH (a {name: 'marko'})-[:knows|created]->(b:app) "
+                "RETURN b.name"
+            ),
+            [[("b.name", "lop")]],
+        )
+
+    def test_relationship_matched_once(self):
+        self.assertEqual(
+            self.query(
+                "MATCH (a)-[:knows]->(b)<-[:knows]-(c) RETURN a, c"
+            ),
+            [],
+        )
+        self.assertEqual(
+            self.query(
+                "MATCH (a:person)-->(x)<--(b:person) "
+                "WHERE a.name = 'peter' RETURN b.name"
+            ),
+            [[("b.name", "josh")], [("b.name", "marko")]],
+        )
+
+    def test_bound_variables(self):
+        self.assertEqual(
+            self.query(
+                "MATCH (a {name: 'josh'}), (a)-[:created]->(b) "
+                "RETURN b.name"
+            ),
+            [[("b.name", "lop")], [("b.name", "ripple")]],
+        )
+        self.assertEqual(
+            self.query(
+                "MATCH (a)-[:knows]->(b), (b)-[:created]->(c) "
+                "RETURN a.name, c.name"
+            ),
+            [[("a.name", "marko"), ("c.name", "lop")],
+             [("a.name", "marko"), ("c.name", "ripple")]],
+        )
+
+    def test_named_path(self):
+        self.assertEqual(
+            self.query(
+                "MATCH p = (a {name: 'marko'})-[:knows]->({name: 'vadas'}) "
+                "RETURN p"
+            ),
+            [[("p", [self.marko, self.marko_knows_vadas, self.vadas])]],
+        )
+
+    def test_match_from_most_selective_node(self):
+        self.assertEqual(
+            self.query(
+                "MATCH p = (m:app)<-[:created]-(n:person {name: 'josh'}) "
+                "RETURN m.name, p"
+            ),
+            [
+                [("m.name", "lop"),
+                 ("p", [self.lop, self.josh_created_lop, self.josh])],
+                [("m.name", "ripple"),
+                 ("p", [self.ripple, self.josh_created_ripple, self.josh])],
+            ],
+        )
+
+    def test_plan_element(self):
+        ast = cypher_parser.parse(
+            "MATCH (a)-[:knows]->(b:person)<-[:created]-(c {name: 'x'}) "
+            "RETURN a"
+        )
+        _, node, chains = ast[1][1][0][2]
+        nodes = [node] + [each for _, _, each in chains]
+        relationships = [each for _, each, _ in chains]
+
+        steps = cypher_parser.plan_element(self.graph, nodes, relationships)
+        self.assertEqual(
+            [(each.operator, each.index, each.pattern) for each in steps],
+            [
+                ("AllNodesScan", 2, "(c {name})"),
+                ("ExpandReverse", 1, "-[:created]->(b:person)"),
+                ("ExpandReverse", 0, "<-[:knows]-(a)"),
+            ],
+        )
+
+        # bound variables are the most selective.
+        steps = cypher_parser.plan_element(
+            self.graph, nodes, relationships, ["b"]
+        )
+        self.assertEqual(
+            [(each.operator, each.index) for each in steps],
+            [("Argument", 1), ("Expand", 1), ("ExpandReverse", 0)],
+        )
+        self.assertEqual(steps[0].estimated_rows, 1.0)
+
+    def test_explain(self):
+        rows = self.graph.query(
+            "EXPLAIN MATCH (n:person {name: 'josh'})-[:created]->(m), (m) "
+            "RETURN m"
+        )
+        self.assertEqual(
+            [
+                (each["part"], each["operator"], each["pattern"])
+                for each in rows
+            ],
+            [
+                (0, "NodeUniqueSeek", "(n:person {name})"),
+                (0, "Expand", "-[:created]->(m)"),
+                (1, "Argument", "(m)"),
+            ],
+        )
+        self.assertEqual(rows[0]["estimated_rows"], 1.0)
+        self.assertEqual(rows[1]["estimated_rows"], rows[2]["estimated_rows"])
+        self.assertRaises(
+            interfaces.QueryError,
+            self.graph.query,
+            "EXPLAIN MATCH (a RETURN a",
+        )
+
+    def test_push_down(self):
+        ast = cypher_parser.parse(
+            "MATCH (a)-[r]->(b) WHERE a.age > 30 AND 'j' <= b.name AND "
+            "b.name STARTS WITH {p} AND (a.age < b.age OR r.w = 1) AND "
+            "a.age > 40 AND a.name CONTAINS 'o' RETURN a"
+        )
+        pattern, (_, where) = ast[1][1:]
+        filters, residual = cypher_parser.push_down(pattern, where)
+        self.assertEqual(
+            filters,
+            {
+                "a": [("age", "gt", ["Literal", 30])],
+                "b": [
+                    ("name", "ge", ["Literal", "j"]),
+                    ("name", "startswith", ["Parameter", "p"]),
+                ],
+            },
+        )
+        self.assertEqual(residual[0], "and")
+        self.assertEqual(residual[1][0], "or")
+        self.assertEqual(residual[2][1][0], "gt")
+        self.assertEqual(residual[2][2][0], "Expression3")
+
+        pattern, (_, where) = cypher_parser.parse(
+            "MATCH (a) WHERE a.age = 1 RETURN a"
+        )[1][1:]
+        self.assertEqual(
+            cypher_parser.push_down(pattern, where),
+            ({"a": [("age", "eq", ["Literal", 1])]}, None),
+        )
+
+    def test_where_pushed_down(self):
+        self.marko.set_property(age="unknown")
+        self.assertEqual(
+            self.query(
+                "MATCH (a:person)-[:knows]->(b) WHERE 30 < b.age AND "
+                "a.age < 100 AND b.name ENDS WITH 'h' RETURN b.name"
+            ),
+            [],
+        )
+        self.assertEqual(
+            self.query(
+                "MATCH (a)-[:created]->(b) WHERE a.age >= {age} AND "
+                "b.name STARTS WITH 'r' RETURN a.name",
+                {"age": 32},
+            ),
+            [[("a.name", "josh")]],
+        )
+        self.assertEqual(
+            self.query("MATCH (a) WHERE a.age > {age} RETURN a",
+                       {"age": None}),
+            [],
+        )
+        self.assertEqual(
+            self.query(
+                "MATCH (a:person) WHERE a.age STARTS WITH 'u' AND "
+                "a.name ENDS WITH 'o' RETURN a.name"
+            ),
+            [[("a.name", "marko")]],
+        )
+        self.assertEqual(
+            self.query("MATCH (a) WHERE a.age STARTS WITH '2' RETURN a"),
+            [],
+        )
+        rows = self.graph.query(
+            "EXPLAIN MATCH (a:person)-->(b) WHERE a.age > 30 AND "
+            "b.name = 'lop' AND a.name <> b.name RETURN a"
+        )
+        self.assertEqual(
+            [each["pattern"] for each in rows],
+            ["(b WHERE b.name = 'lop')", "<--(a:person WHERE a.age > 30)"],
+        )
+
+    def test_where(self):
+        self.assertEqual(
+            self.query(
+                "MATCH (a) WHERE a.name STARTS WITH 'p' OR a.age < 28 "
+                "RETURN a.name"
+            ),
+            [[("a.name", "peter")], [("a.name", "vadas")]],
+        )
+        self.assertEqual(
+            self.query("MATCH (a) WHERE a:app AND a.age IS NULL RETURN a"),
+            sorted([[("a", self.lop)], [("a", self.ripple)]]),
+        )
+        # apps without an age are not compared.
+        self.assertEqual(
+            len(self.query("MATCH (a) WHERE a.age > 0 RETURN a")),
+            4,
+        )
+
+    def test_parameters(self):
+        self.assertEqual(
+            self.query(
+                "MATCH (a:person {name: {name}}) WHERE a.age < {age} "
+                "RETURN a.name",
+                {"name": "vadas", "age": 30},
+            ),
+            [[("a.name", "vadas")]],
+        )
+        self.assertRaises(
+            interfaces.QueryError,
+            self.graph.query,
+            "MATCH (a) WHERE a.age > {age} RETURN a",
+        )
+
+    def test_return(self):
+        self.assertEqual(
+            self.query(
+                "MATCH (a {name: 'marko'})-[r:created]->(b) RETURN *"
+            ),
+            [[("a", self.marko), ("b", self.lop),
+              ("r", self.marko_created_lop)]],
+        )
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a {name: 'marko'})-[r:created]->(b) "
+                "RETURN id(a), type(r), labels(b), toUpper(b.name), "
+                "a.age * 2 AS double"
+            ),
+            [{0: self.marko.ident, 1: "created", 2: ["app"], 3: "LOP",
+              "double": 58}],
+        )
+
+    def test_skip_limit(self):
+        rows = self.graph.query("MATCH (a) RETURN a.name SKIP 1 LIMIT 2")
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(
+            len(self.graph.query("MATCH (a) RETURN a.name SKIP {s}",
+                                 {"s": 4})),
+            len(self.graph.vertices) - 4,
+        )
+        self.assertEqual(
+            self.graph.query("MATCH (a) RETURN a LIMIT {n}", {"n": 0}),
+            [],
+        )
+        # rows past the limit are never projected.
+        self.assertEqual(
+            self.graph.query("MATCH (a) RETURN a.name.first LIMIT 0"),
+            [],
+        )
+        for query_string in [
+                "RETURN 1 LIMIT -1",
+                "RETURN 1 LIMIT 1.5",
+                "RETURN 1 SKIP 'a'",
+                "RETURN 1 SKIP true",
+                "RETURN 1 LIMIT {n}",
+        ]:
+            self.assertRaises(
+                interfaces.QueryError,
+                self.graph.query,
+                query_string,
+                {"n": None},
+            )
+
+    def test_order_by(self):
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a) RETURN a.name AS name ORDER BY a.age DESC, name"
+            ),
+            [{"name": "lop"}, {"name": "ripple"}, {"name": "peter"},
+             {"name": "josh"}, {"name": "marko"}, {"name": "vadas"}],
+        )
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a) RETURN a.name ORDER BY a.age, a.name ASCENDING "
+                "SKIP 1 LIMIT 2"
+            ),
+            [{"a.name": "marko"}, {"a.name": "josh"}],
+        )
+        # returned columns hide the variables of the same name.
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (n:person) RETURN n.name AS name, n.age AS n "
+                "ORDER BY n LIMIT 1"
+            ),
+            [{"name": "vadas", "n": 27}],
+        )
+        # the first rows of a LIMIT are the first rows of the whole order.
+        for order in ["a.name, r.weight DESC", "a.name DESC", "a.name"]:
+            query_string = (
+                "MATCH (a)-[r]->(b) RETURN a, b ORDER BY " + order
+            )
+            ordered = self.graph.query(query_string)
+            for count in range(8):
+                self.assertEqual(
+                    self.graph.query(query_string + " LIMIT {n}",
+                                     {"n": count}),
+                    ordered[:count],
+                )
+
+    def test_aggregation(self):
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a:person) RETURN count(*) AS n, sum(a.age) AS sum, "
+                "avg(a.age) AS avg, min(a.age) AS min, max(a.name) AS max"
+            ),
+            [{"n": 4, "sum": 123, "avg": 30.75, "min": 27, "max": "vadas"}],
+        )
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a)-[r]->(b) RETURN a.name, count(r) AS n, "
+                "collect(DISTINCT b.lang) AS langs ORDER BY n DESC, a.name"
+            ),
+            [{"a.name": "marko", "n": 3, "langs": ["java"]},
+             {"a.name": "josh", "n": 2, "langs": ["java"]},
+             {"a.name": "peter", "n": 1, "langs": ["java"]}],
+        )
+        # null values are not aggregated.
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a) RETURN count(a.age) + 1, count(DISTINCT a.lang)"
+            ),
+            [{0: 5, 1: 1}],
+        )
+        self.assertEqual(
+            sorted(
+                sorted(row["names"]) for row in self.graph.query(
+                    "MATCH (a)-->(b) RETURN b, collect(a.name) AS names"
+                )
+            ),
+            [["josh"], ["josh", "marko", "peter"], ["marko"], ["marko"]],
+        )
+        # aggregating no rows returns a single row without groups.
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a:nothing) RETURN count(*), sum(a.age), "
+                "avg(a.age), collect(a)"
+            ),
+            [{0: 0, 1: 0, 2: None, 3: []}],
+        )
+        self.assertEqual(
+            self.graph.query("MATCH (a:nothing) RETURN a.name, count(*)"),
+            [],
+        )
+
+    def test_distinct(self):
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a)-->(b) RETURN DISTINCT a.name ORDER BY a.name"
+            ),
+            [{"a.name": "josh"}, {"a.name": "marko"}, {"a.name": "peter"}],
+        )
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a)-->(b) RETURN DISTINCT a.name ORDER BY a.name "
+                "SKIP 1 LIMIT 1"
+            ),
+            [{"a.name": "marko"}],
+        )
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a)-->(b:app) RETURN DISTINCT b.lang, [b.lang] AS x"
+            ),
+            [{"b.lang": "java", "x": ["java"]}],
+        )
+
+    def test_hash_key(self):
+        keys = set(
+            cypher_parser._hash_key(each)
+            for each in [1, 1.0, True, [1], [True], {"a": [1]}, {"a": [1]}]
+        )
+        self.assertEqual(len(keys), 5)
+
+    def test_variable_length(self):
+        self.assertEqual(
+            sorted(
+                row["b.name"] for row in self.graph.query(
+                    "MATCH (a {name: 'marko'})-[*]->(b) RETURN b.name"
+                )
+            ),
+            ["josh", "lop", "lop", "ripple", "vadas"],
+        )
+        self.assertEqual(
+            sorted(
+                row["b.name"] for row in self.graph.query(
+                    "MATCH (a {name: 'marko'})-[:knows*2]->(b) RETURN b.name"
+                )
+            ),
+            [],
+        )
+        self.assertEqual(
+            sorted(
+                row["b.name"] for row in self.graph.query(
+                    "MATCH (a {name: 'marko'})-[*2]->(b) RETURN b.name"
+                )
+            ),
+            ["lop", "ripple"],
+        )
+        self.assertEqual(
+            sorted(
+                (row["a.name"], row[0]) for row in self.graph.query(
+                    "MATCH (b {name: 'lop'})<-[r*0..1]-(a) "
+                    "RETURN a.name, size(r)"
+                )
+            ),
+            [("josh", 1), ("lop", 0), ("marko", 1), ("peter", 1)],
+        )
+        # every path is matched, not only the shortest one.
+        self.assertEqual(
+            sorted(
+                (row["r"] for row in self.graph.query(
+                    "MATCH (a {name: 'vadas'})-[r*]-(b {name: 'lop'}) "
+                    "RETURN r"
+                )),
+                key=len,
+            ),
+            [[self.marko_knows_vadas, self.marko_created_lop],
+             [self.marko_knows_vadas, self.marko_knows_josh,
+              self.josh_created_lop]],
+        )
+        self.assertEqual(
+            self.graph.query(
+                "EXPLAIN MATCH (a {name: 'vadas'})-[r:knows*1..3]-(b) "
+                "RETURN r"
+            )[1]["pattern"],
+            "-[r:knows*1..3]-(b)",
+        )
+
+    def test_variable_length_rows(self):
+        a, b, c, d = [
+            self.graph.add_vertex("node", name=name) for name in "abcd"
+        ]
+        for head, tail in [(a, b), (b, c), (a, c), (c, d)]:
+            self.graph.add_edge(head, "link", tail)
+
+        # a row for each path, a->b, a->c, a->b->c, a->c->d and a->b->c->d.
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a {name: 'a'})-[:link*1..3]->(x) RETURN count(*)"
+            ),
+            [{0: 5}],
+        )
+        self.assertEqual(
+            sorted(
+                row["x.name"] for row in self.graph.query(
+                    "MATCH (a {name: 'a'})-[:link*1..3]->(x) RETURN x.name"
+                )
+            ),
+            ["b", "c", "c", "d", "d"],
+        )
+        self.assertEqual(
+            sorted(
+                row["x.name"] for row in self.graph.query(
+                    "MATCH (a {name: 'a'})-[:link*1..3]->(x) "
+                    "RETURN DISTINCT x.name"
+                )
+            ),
+            ["b", "c", "d"],
+        )
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a {name: 'a'})-[:link*2..]->(x {name: 'd'}) "
+                "RETURN count(*)"
+            ),
+            [{0: 2}],
+        )
+
+        # paths may go through a vertex again, but not a relationship.
+        self.graph.add_edge(b, "link", a)
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a {name: 'a'})-[:link*]->(x {name: 'a'}) "
+                "RETURN count(*)"
+            ),
+            [{0: 1}],
+        )
+        # the empty path, two paths through b and four around the
+        # triangle, through either relationship between a and b.
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a {name: 'a'})-[:link*0..]-(x {name: 'a'}) "
+                "RETURN count(*)"
+            ),
+            [{0: 7}],
+        )
+
+    def test_variable_length_between_bound_vertices(self):
+        self.assertEqual(
+            sorted(
+                (row["p"] for row in self.graph.query(
+                    "MATCH (a {name: 'vadas'}), (b {name: 'ripple'}), "
+                    "p = (a)-[*]-(b) RETURN p"
+                )),
+                key=len,
+            ),
+            [[self.vadas, self.marko_knows_vadas, self.marko,
+              self.marko_knows_josh, self.josh, self.josh_created_ripple,
+              self.ripple],
+             [self.vadas, self.marko_knows_vadas, self.marko,
+              self.marko_created_lop, self.lop, self.josh_created_lop,
+              self.josh, self.josh_created_ripple, self.ripple]],
+        )
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a {name: 'vadas'}), (b {name: 'ripple'}), "
+                "p = (b)-[*..2]-(a) RETURN p"
+            ),
+            [],
+        )
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a {name: 'vadas'}), (b {name: 'ripple'}), "
+                "p = (a)-[*]->(b) RETURN p"
+            ),
+            [],
+        )
+
+    def test_paths_to_target(self):
+        # the search towards a target finds the same paths as searching all
+        # of them, in the same order.
+        vertices = [self.marko, self.vadas, self.lop, self.josh,
+                    self.ripple, self.peter]
+        for length in [slice(None, None), slice(0, 2), slice(2, 3),
+                       slice(3, None)]:
+            for left, right in [(None, None), (None, ">"), ("<", None)]:
+                for source in vertices:
+                    for target in vertices:
+                        self.assertEqual(
+                            list(cypher_parser._paths(
+                                source, left, right, [None], {}, (), length,
+                                target,
+                            )),
+                            [
+                                hops for hops in cypher_parser._paths(
+                                    source, left, right, [None], {}, (),
+                                    length,
+                                )
+                                if (hops[-1][1] if hops else source) is
+                                target
+                            ],
+                        )
+
+    def test_distances(self):
+        self.assertEqual(
+            cypher_parser._distances(
+                self.ripple, None, None, [None], {}, (), None
+            ),
+            {self.ripple: 0, self.josh: 1, self.marko: 2, self.lop: 2,
+             self.vadas: 3, self.peter: 3},
+        )
+        self.assertEqual(
+            cypher_parser._distances(
+                self.ripple, "<", None, [None], {}, (), 1
+            ),
+            {self.ripple: 0, self.josh: 1},
+        )
+        # relationships matched by the pattern are not followed again.
+        self.assertEqual(
+            cypher_parser._distances(
+                self.ripple, None, None, [None], {},
+                (self.marko_knows_josh,), None
+            ),
+            {self.ripple: 0, self.josh: 1, self.lop: 2, self.marko: 3,
+             self.peter: 3, self.vadas: 4},
+        )
+
+    def test_sort_key(self):
+        values = [None, 2, 1.5, True, "b", "a", [1, "a"], [1], self.marko,
+                  self.marko_knows_josh, {"a": 1}]
+        self.assertEqual(
+            sorted(values, key=cypher_parser._sort_key),
+            [{"a": 1}, self.marko, self.marko_knows_josh, [1], [1, "a"],
+             "a", "b", True, 1.5, 2, None],
+        )
+
+    def test_stream(self):
+        rows = cypher_parser.stream(
+            self.graph, "MATCH (a:person)-[:knows]->(b) RETURN b"
+        )
+        self.assertIn(next(rows), [{"b": self.vadas}, {"b": self.josh}])
+        self.assertEqual(len(list(rows)), 1)
+        self.assertEqual(
+            list(
+                cypher_parser.stream(self.graph, "EXPLAIN MATCH (a) RETURN a")
+            )[0]["operator"],
+            "AllNodesScan",
+        )
+
+    def test_compile_query(self):
+        run = cypher_parser.compile_query(
+            cypher_parser.parse(
+                "MATCH (a:person) WHERE a.age > {age} RETURN a.name"
+            )
+        )
+        self.assertEqual(len(list(run(self.graph, {"age": 30}))), 2)
+        self.assertEqual(len(list(run(self.graph, {"age": 0}))), 4)
+
+    def test_errors(self):
+        for query_string in [
+                "MATCH (a RETURN a",
+                "MATCH (a) RETURN b",
+                "MATCH (a) RETURN count(count(a))",
+                "MATCH (a) WHERE count(*) > 1 RETURN a",
+                "MATCH (a) RETURN sum(a.name)",
+                "MATCH (a) RETURN unknown(a)",
+                "MATCH (a) RETURN a.name.first",
+        ]:
+            self.assertRaises(
+                interfaces.QueryError,
+                self.graph.query,
+                query_string,
+            )
+
+
+class TestPlanCache(base.TestBase):
+    def test_normalize(self):
+        self.assertEqual(
+            cypher_parser.normalize(
+                "  MATCH  (a)\n\n  WHERE a.name = 'x  y'\tRETURN a ; "
+            ),
+            "MATCH (a) WHERE a.name = 'x  y' RETURN a",
+        )
+        self.assertEqual(
+            cypher_parser.normalize(
+                "MATCH (a) // all\n  RETURN /* name */ a.name"
+            ),
+            "MATCH (a) RETURN a.name",
+        )
+        self.assertEqual(
+            cypher_parser.normalize('RETURN "a\\"  b",  `x  y`'),
+            'RETURN "a\\"  b", `x  y`',
+        )
+
+    def test_get(self):
+        cache = cypher_parser.PlanCache()
+        plan = cache.get("MATCH (a:person) RETURN a.name")
+        self.assertIs(cache.get("MATCH  (a:person)\n RETURN a.name;"), plan)
+        self.assertIsNot(cache.get("MATCH (a:app) RETURN a.name"), plan)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 2, 2))
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertIsNot(cache.get("MATCH (a:person) RETURN a.name"), plan)
+
+    def test_parameters_bound_when_run(self):
+        cache = cypher_parser.PlanCache()
+        query_string = "MATCH (a:person) WHERE a.age > {age} RETURN a.name"
+        self.assertEqual(
+            len(list(cache.get(query_string)(self.graph, {"age": 30}))), 2
+        )
+        self.assertEqual(
+            len(list(cache.get(query_string)(self.graph, {"age": 0}))), 4
+        )
+        self.assertEqual(cache.misses, 1)
+
+    def test_least_recently_used_evicted(self):
+        cache = cypher_parser.PlanCache(size=2)
+        first = cache.get("RETURN 1")
+        cache.get("RETURN 2")
+        cache.get("RETURN 1")
+        cache.get("RETURN 3")
+        self.assertIs(cache.get("RETURN 1"), first)
+        self.assertEqual(cache.misses, 3)
+        cache.get("RETURN 2")
+        self.assertEqual(cache.misses, 4)
+
+    def test_invalid_queries_not_cached(self):
+        cache = cypher_parser.PlanCache()
+        self.assertRaises(
+            interfaces.QueryError,
+            cache.get,
+            "MATCH (a RETURN a",
+        )
+        self.assertEqual(len(cache), 0)
+
+    def test_invalid_size(self):
+        self.assertRaises(ValueError, cypher_parser.PlanCache, 0)
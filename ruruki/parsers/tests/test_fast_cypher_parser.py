@@ -0,0 +1,195 @@
+#pylint: skip-file
+import unittest
+import parsley
+from ruruki.parsers import cypher_parser, fast_cypher_parser
+from ruruki.parsers.fast_cypher_parser import UnsupportedSyntax
+from ruruki.test_utils import cypher_benchmark
+
+
+class TestTokenize(unittest.TestCase):
+    def test_tokens(self):
+        self.assertEqual(
+            [
+                (kind, value, spaced)
+                for kind, _, value, spaced in fast_cypher_parser.tokenize(
+                    "MATCH (a)-->(`b c`) // all\nRETURN a.x <= 'it\\'s'"
+                )
+            ],
+            [
+                ("name", "MATCH", False),
+                ("operator", "(", True),
+                ("name", "a", False),
+                ("operator", ")", False),
+                ("operator", "-", False),
+                ("operator", "-", False),
+                ("operator", ">", False),
+                ("operator", "(", False),
+                ("escaped", "b c", False),
+                ("operator", ")", False),
+                ("name", "RETURN", True),
+                ("name", "a", True),
+                ("operator", ".", False),
+                ("name", "x", False),
+                ("operator", "<=", True),
+                ("string", "it's", True),
+                ("end", None, False),
+            ],
+        )
+
+    def test_numbers(self):
+        self.assertEqual(
+            [
+                value
+                for _, _, value, _ in fast_cypher_parser.tokenize(
+                    "12 1.5 1e3 0x1F 017 08 0 1..2"
+                )
+            ],
+            [12, 1.5, 1000.0, 31, 15, 8, 0, 1, "..", 2, None],
+        )
+
+    def test_invalid(self):
+        for query_string in [
+                "RETURN 'a", "RETURN '\\q'", "RETURN a\rb", "RETURN 1.5e3"
+        ]:
+            self.assertRaises(
+                UnsupportedSyntax,
+                fast_cypher_parser.tokenize,
+                query_string,
+            )
+
+
+class TestParse(unittest.TestCase):
+    def assertSameTree(self, query_string):
+        self.assertEqual(
+            fast_cypher_parser.parse(query_string),
+            cypher_parser.Parser(query_string).Cypher(),
+        )
+
+    def test_expressions(self):
+        for query_string in [
+                "RETURN 1 + 2 as a;",
+                "RETURN -1 - -2 + +3, 1 - 2 - 3, 2 ^ 3 * 4 / 2 % 3",
+                "RETURN 1 = 2 <> 3, 1 != 2, 1 < 2, 1 > 2, 1 <= 2, 1 >= 2",
+                "RETURN true AND false OR NOT true XOR null",
+                "RETURN [1, [2]], [], {a: 1, b: [2]}, {}, {p}, {0}",
+                "RETURN a.b.c, a:x:y, a[1], a[1..2], a[..2], a[1][2]",
+                "RETURN a IN [1], a STARTS WITH 'x', a ENDS WITH 'y', "
+                "a CONTAINS 'z', a =~ 'r.*', a IS NULL, a IS NOT NULL",
+                "RETURN CASE WHEN a THEN 1 ELSE 2 END, "
+                "CASE a WHEN 1 THEN 'x' END",
+                "RETURN count(*), count(DISTINCT a), f(), g(1, 2)",
+                "RETURN `weird name`, (1 + 2) * 3, NOT(a)",
+        ]:
+            self.assertSameTree(query_string)
+
+    def test_patterns(self):
+        for query_string in [
+                "MATCH (a:person:app {name: 'x'}), (b {p}), () RETURN a",
+                "MATCH (a)-->(b)<--(c)--(d) RETURN a",
+                "MATCH (a)-[r:x|y|:z]->(b)<-[s?]-(c) RETURN a",
+                "MATCH (a)-[*]->(b)-[*2]->(c)-[r:x*1..3 {w: 1}]->(d) "
+                "RETURN a",
+                "MATCH p = ((a)-[*..3]->(b)) RETURN p",
+                "MATCH (a) WHERE a:person AND a.age > {age} RETURN a",
+        ]:
+            self.assertSameTree(query_string)
+
+    def test_return(self):
+        for query_string in [
+                "RETURN distinct a AS b, c AS `d e`",
+                "RETURN *",
+                "RETURN a ORDER BY a SKIP {s} LIMIT 10",
+                "RETURN a ORDER BY a DESC, b , c ASCENDING LIMIT 1",
+                "RETURN /* comment */ a // comment",
+        ]:
+            self.assertSameTree(query_string)
+
+    def test_sort_direction(self):
+        self.assertEqual(
+            fast_cypher_parser.parse(
+                "RETURN a ORDER BY a DESC, b, c ASCENDING"
+            )[3][2][2],
+            ["Order", [
+                ["sort", ["Variable", "a"], "desc"],
+                ["sort", ["Variable", "b"], "asc"],
+                ["sort", ["Variable", "c"], "asc"],
+            ]],
+        )
+
+    def test_range(self):
+        self.assertEqual(
+            [
+                fast_cypher_parser.parse(
+                    "MATCH (a)-[{0}]->(b) RETURN a".format(length)
+                )[1][1][0][2][2][0][1][2][4]
+                for length in ["*", "*2", "*2..", "*..3", "*1..3"]
+            ],
+            [slice(None, None), slice(2, 2), slice(2, None),
+             slice(None, 3), slice(1, 3)],
+        )
+
+    def test_unsupported(self):
+        for query_string in [
+                "RETURN 1 UNION RETURN 2",
+                "MATCH (a) WITH a RETURN a",
+                "OPTIONAL MATCH (a) RETURN a",
+                "RETURN [x IN [1, 2] WHERE x > 1 | x]",
+                "RETURN filter(x IN [1] WHERE x)",
+                "RETURN (a)-->(b)",
+                "RETURN count(distinctx)",
+                "MATCH (a RETURN a",
+                "MATCH (a) RETURN",
+        ]:
+            self.assertRaises(
+                UnsupportedSyntax,
+                fast_cypher_parser.parse,
+                query_string,
+            )
+
+    def test_fall_back_to_grammar(self):
+        query_string = "RETURN 1 UNION RETURN 2"
+        self.assertEqual(
+            cypher_parser.parse(query_string),
+            cypher_parser.Parser(query_string).Cypher(),
+        )
+
+    def test_rejected_by_grammar(self):
+        for query_string in [
+                "RETURN 1.5e3",
+                "RETURN trueish, nullx(1)",
+                "RETURN distincta",
+                "RETURN distinct(a)",
+                "RETURN f(a , b)",
+                "RETURN a[ 1], a[1 ..2], [ ]",
+                "MATCH (a) , (b) RETURN a",
+                "MATCH ( (a)) RETURN a",
+                "MATCH (a: x) RETURN a",
+                "MATCH (a)-[ r]->(b) RETURN a",
+                "MATCH (a)-[r :x| :y]->(b) RETURN a",
+                "MATCH (a)-[r *2]->(b) RETURN a",
+                "MATCH (a)-[r {p: 1} ]->(b) RETURN a",
+        ]:
+            self.assertRaises(
+                UnsupportedSyntax,
+                fast_cypher_parser.parse,
+                query_string,
+            )
+            self.assertRaises(
+                parsley.ParseError,
+                cypher_parser.Parser(query_string).Cypher,
+            )
+
+    def test_whitespace(self):
+        for query_string in [
+                "RETURN f( a, b ), [ 1 , 2 ], { }, a [1], a.b . c",
+                "MATCH (a :x :y)-[r ]- > (b)<-[s {p: 1}]-(c) RETURN a",
+                "MATCH (a)-[:x |y|: z]->(b) RETURN a",
+                "MATCH (a)-[r* 2 .. 3 ]->(b) RETURN a",
+        ]:
+            self.assertSameTree(query_string)
+
+    def test_benchmark(self):
+        results = cypher_benchmark.benchmark(["RETURN 1"], number=1)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0], "RETURN 1")
+        self.assertEqual(results[0][3], True)
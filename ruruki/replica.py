@@ -0,0 +1,300 @@
+"""
+Read-only replicas following the replication log of a
+:class:`~.PersistentGraph`.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from ruruki import interfaces
+from ruruki.graphs import Graph
+from ruruki.replication import LogTailer
+
+
+class ReplicaGraph(Graph):
+    """
+    Read-only in-memory graph following the replication log of a
+    :class:`~.PersistentGraph` opened with ``replication`` enabled, usually
+    in another process on the same host.
+
+    The replica never takes the lock on the path, so any number of
+    replicas can follow the one leader. The changes made by the leader are
+    applied when :meth:`poll` is called, or by a background thread started
+    with :meth:`start`. Changing the replica raises
+    :class:`~.DatabaseReadOnly`.
+
+    .. note::
+
+        Reads are not blocked while the changes are being applied, so a
+        reader on another thread can see a partly applied poll. Call
+        :meth:`poll` from the reading thread for consistent reads. When the
+        replica is rebuilt from a snapshot, the snapshot is built aside
+        and replaces the vertices and edges of the replica in one step.
+
+    See :class:`~.IGraph` for doco.
+
+    :param path: Path of the persistent graph being replicated.
+    :type path: :class:`str`
+    """
+
+    def __init__(self, path):
+        super(ReplicaGraph, self).__init__()
+        self.path = path
+        self._tailer = LogTailer(os.path.join(path, "replication.log"))
+        self._poll_lock = threading.Lock()
+        self._applier = None
+        self._epoch = None
+        self._seq = None
+        self._building = None
+        self._skip_snapshot = False
+        self._thread = None
+        self._stopping = threading.Event()
+        self.poll()
+
+    @property
+    def seq(self):
+        """
+        Sequence number of the last change applied, or :obj:`None` if the
+        replica has not read a snapshot yet.
+        """
+        return self._seq
+
+    @property
+    def replication_lag(self):
+        """
+        Seconds since the leader made the oldest change which has not been
+        applied yet, or ``0.0`` if the replica is up to date.
+        """
+        pending = self._tailer.oldest_pending_time()
+        if pending is None:
+            return 0.0
+        return max(0.0, time.time() - pending)
+
+    def _check_writable(self):
+        """
+        Check that the calling thread is allowed to change the graph.
+
+        :raises DatabaseReadOnly: If the graph is changed by anything other
+            than :meth:`poll`.
+        """
+        if self._applier is not threading.current_thread():
+            raise interfaces.DatabaseReadOnly(
+                "Replica of {0!r} is read-only.".format(self.path)
+            )
+
+    def poll(self):
+        """
+        Apply the changes the leader has made since the last poll.
+
+        :returns: Number of changes applied, including the records of any
+            snapshot the replica was rebuilt from.
+        :rtype: :class:`int`
+        """
+        with self._poll_lock:
+            self._applier = threading.current_thread()
+            try:
+                count = 0
+                for entry in self._tailer.read():
+                    if self._apply_entry(entry) is True:
+                        count += 1
+                return count
+            finally:
+                self._applier = None
+
+    def _apply_entry(self, entry):
+        """
+        Apply a replication log entry.
+
+        :param entry: Replication log entry.
+        :type entry: :class:`dict`
+        :returns: True if a record was applied.
+        :rtype: :class:`bool`
+        """
+        if "snapshot" in entry:
+            self._apply_marker(entry)
+            return False
+
+        if self._building is not None:
+            self._apply_record(entry["record"], self._building[0])
+            return True
+
+        if self._skip_snapshot is True or self._epoch is None:
+            return False
+
+        if "seq" in entry:
+            if entry["seq"] <= self._seq:
+                return False
+            self._seq = entry["seq"]
+
+        self._apply_record(entry["record"])
+        return True
+
+    def _apply_marker(self, entry):
+        """
+        Start or finish reading a snapshot.
+
+        :param entry: Begin or end marker of a snapshot.
+        :type entry: :class:`dict`
+        """
+        if entry["snapshot"] == "begin":
+            if entry["epoch"] == self._epoch and entry["seq"] == self._seq:
+                # the replica is already up to date with the new log.
+                self._skip_snapshot = True
+            else:
+                # readers keep the current graph until the snapshot is done.
+                self._building = (Graph(), entry["epoch"], entry["seq"])
+        else:
+            self._skip_snapshot = False
+            if self._building is not None:
+                graph, self._epoch, self._seq = self._building
+                self._building = None
+                self._take_over(graph)
+
+    def _take_over(self, graph):
+        """
+        Replace the vertices, edges and constraints of the replica with
+        those of a graph rebuilt from a snapshot.
+
+        :param graph: Graph rebuilt from a snapshot.
+        :type graph: :class:`~.Graph`
+        """
+        for label in set(self._vcolumns) | set(self._ecolumns):
+            graph.add_column_store(label)
+        for entity in itertools.chain(graph.vertices, graph.edges):
+            entity.graph = self
+
+        # the graph was built by the replica and is not used after this.
+        # pylint: disable=protected-access
+        self._id_tracker = graph._id_tracker
+        self._vconstraints = graph._vconstraints
+        self._econstraints = graph._econstraints
+        self._vcolumns = graph._vcolumns
+        self._ecolumns = graph._ecolumns
+        self._symbols = graph._symbols
+        self.vertices = graph.vertices
+        self.edges = graph.edges
+
+    def _apply_record(self, record, graph=None):
+        """
+        Apply a mutation record shipped by the leader.
+
+        :param record: Mutation record.
+        :type record: :class:`dict`
+        :param graph: Graph being rebuilt from a snapshot to apply the
+            record to, or :obj:`None` to apply it to the replica.
+        :type graph: :class:`~.Graph` or :obj:`None`
+        :raises DatabaseException: If the record is not known.
+        """
+        # the identity numbers of the leader are kept, also in the graph
+        # being rebuilt by the replica.
+        # pylint: disable=protected-access
+        if graph is None:
+            graph = self
+        operation = record["op"]
+        if operation == "add_vertex":
+            graph._id_tracker.vid = record["id"]
+            graph.add_vertex(record["label"], **record["properties"])
+        elif operation == "add_edge":
+            graph._id_tracker.eid = record["id"]
+            graph.add_edge(
+                graph.get_vertex(record["head_id"]),
+                record["label"],
+                graph.get_vertex(record["tail_id"]),
+                **record["properties"]
+            )
+        elif operation in ("set_property", "update_properties"):
+            if record.get("entity", "vertex") == "vertex":
+                entity = graph.get_vertex(record["id"])
+            else:
+                entity = graph.get_edge(record["id"])
+            graph.set_property(entity, **record["properties"])
+        elif operation == "remove_vertex":
+            graph.remove_vertex(graph.get_vertex(record["id"]))
+        elif operation == "remove_edge":
+            graph.remove_edge(graph.get_edge(record["id"]))
+        elif operation == "constraints":
+            existing = set(graph.get_vertex_constraints())
+            for each in record["constraints"]:
+                if (each["label"], each["key"]) not in existing:
+                    graph.add_vertex_constraint(each["label"], each["key"])
+        else:
+            raise interfaces.DatabaseException(
+                "Unknown mutation record {0!r}".format(record)
+            )
+
+    def start(self, interval=0.1):
+        """
+        Start a background thread polling the replication log.
+
+        :param interval: Seconds to wait between polls.
+        :type interval: :class:`float`
+        """
+        if self._thread is not None:
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(interval,),
+            name="ruruki-replica",
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, interval):
+        """
+        Background thread loop polling the replication log.
+
+        :param interval: Seconds to wait between polls.
+        :type interval: :class:`float`
+        """
+        while not self._stopping.wait(interval):
+            try:
+                self.poll()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Failed to apply the replication log.")
+
+    def stop(self):
+        """
+        Stop the background polling thread, if it was started.
+        """
+        if self._thread is None:
+            return
+
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def load(self, file_handler):
+        raise interfaces.DatabaseReadOnly(
+            "Replica of {0!r} is read-only.".format(self.path)
+        )
+
+    def add_vertex_constraint(self, label, key):
+        self._check_writable()
+        super(ReplicaGraph, self).add_vertex_constraint(label, key)
+
+    def append_edge(self, edge):
+        self._check_writable()
+        return super(ReplicaGraph, self).append_edge(edge)
+
+    def append_vertex(self, vertex):
+        self._check_writable()
+        return super(ReplicaGraph, self).append_vertex(vertex)
+
+    def set_property(self, entity, **kwargs):
+        self._check_writable()
+        super(ReplicaGraph, self).set_property(entity, **kwargs)
+
+    def remove_edge(self, edge):
+        self._check_writable()
+        super(ReplicaGraph, self).remove_edge(edge)
+
+    def remove_vertex(self, vertex):
+        self._check_writable()
+        super(ReplicaGraph, self).remove_vertex(vertex)
+
+    def close(self):
+        self.stop()
+        self._tailer.close()
@@ -0,0 +1,298 @@
+"""
+Log shipping used to replicate a persistent graph to read-only replicas in
+other processes on the same host.
+
+The leader appends every mutation record to a replication log file, as a
+JSON encoded line holding the sequence number, the time and the record::
+
+    {"record": {"id": 0, "label": "person", ...}, "seq": 1, "time": ...}
+
+Every log starts with a snapshot of the whole graph, surrounded by a begin
+marker, holding the sequence number of the last record included in the
+snapshot and the epoch of the leader, and an end marker::
+
+    {"epoch": "...", "seq": 0, "snapshot": "begin", "time": ...}
+    {"record": {"op": "add_vertex", ...}}
+    {"snapshot": "end"}
+
+Once the log grows too large the leader writes a new log, starting with a
+new snapshot, and renames it over the old one. Replicas which have read the
+old log up to the snapshot skip the snapshot, and the others rebuild their
+graph from it.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from ruruki.journal import constraints_record, edge_record, vertex_record
+
+
+def snapshot_records(graph):
+    """
+    Generate the mutation records which rebuild a graph from scratch.
+
+    :param graph: Graph to snapshot.
+    :type graph: :class:`~.IGraph`
+    :returns: Yields the constraints, vertices and edges records.
+    :rtype: Iterator of :class:`dict`
+    """
+    yield constraints_record(graph.get_vertex_constraints())
+
+    for vertex in sorted(graph.vertices, key=lambda x: x.ident):
+        yield vertex_record(vertex)
+
+    for edge in sorted(graph.edges, key=lambda x: x.ident):
+        yield edge_record(edge)
+
+
+class LogShipper(object):
+    """
+    Leader side of the replication, appending mutation records to the
+    replication log.
+
+    .. note::
+
+        The records are written to the operating system straight away but
+        are not synced to disk, because the replicas are on the same host.
+
+    :param filename: Replication log file.
+    :type filename: :class:`str`
+    :param max_size: Start a new log once the log grows beyond this many
+        bytes.
+    :type max_size: :class:`int`
+    """
+
+    def __init__(self, filename, max_size=64 * 1024 * 1024):
+        self.filename = filename
+        self.max_size = max_size
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self._fh = None
+
+    def start(self, records):
+        """
+        Start a new log with a snapshot, replacing the current log.
+
+        :param records: Records rebuilding the graph as of the last shipped
+            record, see :func:`snapshot_records`.
+        :type records: Iterable of :class:`dict`
+        """
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "w") as log_fh:
+            log_fh.write(
+                _encode(
+                    {
+                        "snapshot": "begin",
+                        "seq": self.seq,
+                        "epoch": self.epoch,
+                        "time": time.time(),
+                    }
+                )
+            )
+            for record in records:
+                log_fh.write(_encode({"record": record}))
+            log_fh.write(_encode({"snapshot": "end"}))
+
+        if self._fh is not None:
+            self._fh.close()
+        os.rename(temp_filename, self.filename)
+        self._fh = open(self.filename, "a")
+
+    def ship(self, record):
+        """
+        Append a mutation record to the log.
+
+        :param record: Mutation record.
+        :type record: :class:`dict`
+        """
+        self.seq += 1
+        self._fh.write(
+            _encode({"seq": self.seq, "time": time.time(), "record": record})
+        )
+        self._fh.flush()
+
+    def is_full(self):
+        """
+        Check if the log has grown beyond :attr:`max_size`.
+
+        :returns: True if a new log should be started.
+        :rtype: :class:`bool`
+        """
+        return self._fh.tell() > self.max_size
+
+    def close(self):
+        """
+        Close the log file.
+        """
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+class LogTailer(object):
+    """
+    Replica side of the replication, reading the entries appended to the
+    replication log and following the leader to new logs.
+
+    :param filename: Replication log file.
+    :type filename: :class:`str`
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._fh = None
+        self._offset = 0
+
+    def _open(self):
+        """
+        Open the current log, if it exists.
+
+        :returns: True if the log has been opened.
+        :rtype: :class:`bool`
+        """
+        try:
+            self._fh = open(self.filename, "rb")
+        except IOError:
+            return False
+        self._offset = 0
+        return True
+
+    def _replaced(self):
+        """
+        Check if the leader has started a new log.
+
+        :returns: True if the log file is not the open log any more.
+        :rtype: :class:`bool`
+        """
+        try:
+            current = os.stat(self.filename)
+        except OSError:
+            return False
+        return current.st_ino != os.fstat(self._fh.fileno()).st_ino
+
+    def _read_complete_lines(self):
+        """
+        Read the complete lines appended since the last read.
+
+        :returns: Decoded entries.
+        :rtype: :class:`list` of :class:`dict`
+        """
+        self._fh.seek(self._offset)
+        data = self._fh.read()
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+
+        entries = []
+        for line in data[:end].splitlines():
+            try:
+                entries.append(json.loads(line.decode("utf-8")))
+            except ValueError:
+                logging.warning("Ignoring corrupt replication log entry.")
+        return entries
+
+    def read(self):
+        """
+        Read the entries appended to the log since the last read. If the
+        leader started a new log, the rest of the old log is read first.
+
+        :returns: Decoded entries, in the order they were written.
+        :rtype: :class:`list` of :class:`dict`
+        """
+        if self._fh is None and self._open() is False:
+            return []
+
+        entries = self._read_complete_lines()
+        if self._replaced():
+            # the leader finished writing the old log before replacing it.
+            entries.extend(self._read_complete_lines())
+            self._fh.close()
+            if self._open() is True:
+                entries.extend(self._read_complete_lines())
+        return entries
+
+    def pending_bytes(self):
+        """
+        Return the number of bytes written to the log which have not been
+        read yet.
+
+        :returns: Number of unread bytes.
+        :rtype: :class:`int`
+        """
+        if self._fh is None:
+            try:
+                return os.path.getsize(self.filename)
+            except OSError:
+                return 0
+
+        pending = os.fstat(self._fh.fileno()).st_size - self._offset
+        if self._replaced():
+            pending += os.path.getsize(self.filename)
+        return pending
+
+    def oldest_pending_time(self):
+        """
+        Return the time at which the oldest entry which has not been read
+        yet was written to the log.
+
+        :returns: Seconds since the epoch, or :obj:`None` if every entry
+            has been read.
+        :rtype: :class:`float` or :obj:`None`
+        """
+        if self._fh is not None:
+            pending = _first_time(self._fh, self._offset)
+            if pending is not None or not self._replaced():
+                return pending
+
+        try:
+            log_fh = open(self.filename, "rb")
+        except IOError:
+            return None
+        with log_fh:
+            return _first_time(log_fh, 0)
+
+    def close(self):
+        """
+        Close the log file.
+        """
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+def _first_time(log_fh, offset):
+    """
+    Find the time of the first complete entry with a time in a log.
+
+    :param log_fh: Log file opened in binary mode.
+    :type log_fh: file
+    :param offset: Offset to start reading at.
+    :type offset: :class:`int`
+    :returns: Seconds since the epoch, or :obj:`None` if there is no such
+        entry.
+    :rtype: :class:`float` or :obj:`None`
+    """
+    log_fh.seek(offset)
+    for line in log_fh:
+        if not line.endswith(b"\n"):
+            return None
+        try:
+            entry = json.loads(line.decode("utf-8"))
+        except ValueError:
+            continue
+        # only the records of a snapshot have no time.
+        if "time" in entry:
+            return entry["time"]
+    return None
+
+
+def _encode(entry):
+    """
+    Encode a log entry as a line.
+
+    :param entry: Log entry.
+    :type entry: :class:`dict`
+    :returns: JSON encoded line.
+    :rtype: :class:`str`
+    """
+    return json.dumps(entry, sort_keys=True) + "\n"
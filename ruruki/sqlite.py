@@ -0,0 +1,289 @@
+"""
+Graph implementation persisted to a SQLite database.
+"""
+from collections import defaultdict
+import json
+import logging
+import sqlite3
+from ruruki import interfaces
+from ruruki.graphs import Graph
+from ruruki.locks import FileLock
+
+
+class SQLiteGraph(Graph):
+    """
+    Persistent Graph database storing data in a single SQLite database
+    file, using only the standard library :mod:`sqlite3` module.
+
+    See :class:`~.IGraph` for doco.
+
+    The graph is held in memory like :class:`Graph`, and every change is
+    mirrored to the following tables, which are keyed on their primary keys
+    only.
+
+    .. code::
+
+        vertices (id, label)
+        edges (id, label, head_id, tail_id)
+        vertex_properties (vertex_id, key, value)
+        edge_properties (edge_id, key, value)
+        vertex_constraints (label, key)
+
+    Property values are stored JSON encoded, and :meth:`set_property` only
+    writes the keys being set.
+
+    .. note::
+
+        The database uses write-ahead logging and changes are written in
+        batched transactions. A transaction is committed once it holds
+        ``commit_size`` changes, when :meth:`commit` is called and when the
+        graph is closed. Changes which are not committed yet are lost if
+        the process dies, but the database is never left half written.
+
+    .. note::
+
+        Opening the graph reads every table in full into memory, so opens
+        take time in proportion to the size of the graph. Queries are
+        served from memory and never read the tables, which is why no
+        secondary indexes are kept.
+
+    :param filename: SQLite database file. It is created if it does not
+        exist.
+    :type filename: :class:`str`
+    :param commit_size: Maximum number of changes in a transaction.
+    :type commit_size: :class:`int`
+    :raises DatabasePathLocked: If the database is already locked by another
+        SQLite graph instance.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS vertices (
+            id INTEGER PRIMARY KEY,
+            label TEXT
+        );
+        CREATE TABLE IF NOT EXISTS edges (
+            id INTEGER PRIMARY KEY,
+            label TEXT,
+            head_id INTEGER NOT NULL REFERENCES vertices (id),
+            tail_id INTEGER NOT NULL REFERENCES vertices (id)
+        );
+        CREATE TABLE IF NOT EXISTS vertex_properties (
+            vertex_id INTEGER NOT NULL REFERENCES vertices (id),
+            key TEXT NOT NULL,
+            value TEXT,
+            PRIMARY KEY (vertex_id, key)
+        );
+        CREATE TABLE IF NOT EXISTS edge_properties (
+            edge_id INTEGER NOT NULL REFERENCES edges (id),
+            key TEXT NOT NULL,
+            value TEXT,
+            PRIMARY KEY (edge_id, key)
+        );
+        CREATE TABLE IF NOT EXISTS vertex_constraints (
+            label TEXT NOT NULL,
+            key TEXT NOT NULL,
+            PRIMARY KEY (label, key)
+        );
+    """
+
+    def __init__(self, filename, commit_size=1000):
+        super(SQLiteGraph, self).__init__()
+        self._lock = FileLock(filename + ".lock")
+        try:
+            self._lock.acquire()
+        except interfaces.AcquireError:
+            logging.exception(
+                "Database %r is already owned by another graph.",
+                filename
+            )
+            raise interfaces.DatabasePathLocked(
+                "Database {0!r} is already locked by another SQLite graph "
+                "instance.".format(filename)
+            )
+
+        self.filename = filename
+        self.commit_size = commit_size
+        self._changes = 0
+        self._in_transaction = False
+        self._connection = sqlite3.connect(
+            filename,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(self.SCHEMA)
+        self._load_from_database()
+
+    def _load_properties(self, table, column):
+        """
+        Read all the properties from a properties table.
+
+        :param table: Properties table to read.
+        :type table: :class:`str`
+        :param column: Column holding the vertex or edge id.
+        :type column: :class:`str`
+        :returns: Properties keyed by the vertex or edge id.
+        :rtype: :class:`dict`
+        """
+        properties = defaultdict(dict)
+        cursor = self._connection.execute(
+            "SELECT {0}, key, value FROM {1}".format(column, table)
+        )
+        for ident, key, value in cursor:
+            properties[ident][key] = json.loads(value)
+        return properties
+
+    def _load_from_database(self):
+        """
+        Load all the vertices constraints, vertices and edges from the
+        database.
+        """
+        logging.info("Loading graph data from %r", self.filename)
+        cursor = self._connection.execute(
+            "SELECT label, key FROM vertex_constraints"
+        )
+        for label, key in cursor:
+            super(SQLiteGraph, self).add_vertex_constraint(label, key)
+
+        properties = self._load_properties("vertex_properties", "vertex_id")
+        cursor = self._connection.execute(
+            "SELECT id, label FROM vertices ORDER BY id"
+        )
+        for ident, label in cursor:
+            vertex = self._vclass(label)
+            vertex.properties = properties.pop(ident, {})
+            # reset the id to the id being loaded.
+            self._id_tracker.vid = ident
+            super(SQLiteGraph, self).append_vertex(vertex)
+
+        properties = self._load_properties("edge_properties", "edge_id")
+        cursor = self._connection.execute(
+            "SELECT id, label, head_id, tail_id FROM edges ORDER BY id"
+        )
+        for ident, label, head_id, tail_id in cursor:
+            edge = self._eclass(
+                self.get_vertex(head_id),
+                label,
+                self.get_vertex(tail_id),
+            )
+            edge.properties = properties.pop(ident, {})
+            # reset the id to the id being loaded.
+            self._id_tracker.eid = ident
+            super(SQLiteGraph, self).append_edge(edge)
+        logging.info("Completed %r graph import", self.filename)
+
+    def _execute(self, statement, parameters=()):
+        """
+        Execute a statement in the current transaction, starting a new
+        transaction if needed, and commit once the transaction holds
+        :attr:`commit_size` changes.
+
+        :param statement: SQL statement to execute.
+        :type statement: :class:`str`
+        :param parameters: Statement parameters.
+        :type parameters: :class:`tuple`
+        """
+        if self._in_transaction is False:
+            self._connection.execute("BEGIN")
+            self._in_transaction = True
+
+        self._connection.execute(statement, parameters)
+        self._changes += 1
+        if self._changes >= self.commit_size:
+            self.commit()
+
+    def _write_properties(self, table, ident, properties):
+        """
+        Insert or replace the given properties of a vertex or edge.
+
+        :param table: Properties table to write to.
+        :type table: :class:`str`
+        :param ident: Vertex or edge identity number.
+        :type ident: :class:`int`
+        :param properties: Properties to write.
+        :type properties: :class:`dict`
+        """
+        statement = "INSERT OR REPLACE INTO {0} VALUES (?, ?, ?)".format(
+            table
+        )
+        for key, value in properties.items():
+            self._execute(
+                statement,
+                (ident, key, json.dumps(value, sort_keys=True)),
+            )
+
+    def commit(self):
+        """
+        Commit the current transaction. Does nothing if there are no
+        changes waiting to be committed.
+        """
+        if self._in_transaction is True:
+            self._connection.execute("COMMIT")
+            self._in_transaction = False
+        self._changes = 0
+
+    def add_vertex_constraint(self, label, key):
+        super(SQLiteGraph, self).add_vertex_constraint(label, key)
+        self._execute(
+            "INSERT OR IGNORE INTO vertex_constraints VALUES (?, ?)",
+            (label, key),
+        )
+
+    def append_vertex(self, vertex):
+        if vertex in self:
+            return vertex
+
+        super(SQLiteGraph, self).append_vertex(vertex)
+        self._execute(
+            "INSERT INTO vertices VALUES (?, ?)",
+            (vertex.ident, vertex.label),
+        )
+        self._write_properties(
+            "vertex_properties",
+            vertex.ident,
+            vertex.properties,
+        )
+        return vertex
+
+    def append_edge(self, edge):
+        if edge in self:
+            return edge
+
+        super(SQLiteGraph, self).append_edge(edge)
+        self._execute(
+            "INSERT INTO edges VALUES (?, ?, ?, ?)",
+            (edge.ident, edge.label, edge.head.ident, edge.tail.ident),
+        )
+        self._write_properties("edge_properties", edge.ident, edge.properties)
+        return edge
+
+    def set_property(self, entity, **kwargs):
+        super(SQLiteGraph, self).set_property(entity, **kwargs)
+        if isinstance(entity, interfaces.IVertex):
+            self._write_properties("vertex_properties", entity.ident, kwargs)
+        else:
+            self._write_properties("edge_properties", entity.ident, kwargs)
+
+    def remove_edge(self, edge):
+        super(SQLiteGraph, self).remove_edge(edge)
+        self._execute(
+            "DELETE FROM edge_properties WHERE edge_id = ?",
+            (edge.ident,),
+        )
+        self._execute("DELETE FROM edges WHERE id = ?", (edge.ident,))
+
+    def remove_vertex(self, vertex):
+        super(SQLiteGraph, self).remove_vertex(vertex)
+        self._execute(
+            "DELETE FROM vertex_properties WHERE vertex_id = ?",
+            (vertex.ident,),
+        )
+        self._execute("DELETE FROM vertices WHERE id = ?", (vertex.ident,))
+
+    def close(self):
+        try:
+            self.commit()
+            self._connection.close()
+        finally:
+            self._lock.release()
@@ -0,0 +1,976 @@
+"""
+Directory layout written by :class:`~.PersistentGraph`, the options a
+persistent graph is opened with, and the cache bounding the properties read
+from it.
+"""
+from collections import namedtuple, OrderedDict
+import errno
+import json
+import logging
+import os
+import shutil
+from ruruki import interfaces
+from ruruki.compression import PropertyCodec
+from ruruki.fsck import TEMP_PREFIX, _read_link_id
+from ruruki.journal import ChangedPaths, Journal, read_records
+
+
+def _search_for_edge_ids(path):
+    """
+    Internal helper function to search for edges identity numbers
+    based in the directories and the head and tail vertices identity
+    numbers.
+
+    :param path: Edges Path to find number directories.
+    :type path: :class:`str`
+    :return: Yields the integer number, head id, label and tail id.
+    :rtype: Iterator of :class:`tuple`
+        (:class:`int`, :class:`int`, :class:`str`, :class:`int`)
+    """
+    for label in os.listdir(path):
+
+        label_path = os.path.join(path, label)
+
+        # skip over files because we are only looking for directories.
+        if os.path.isfile(label_path):
+            continue
+
+        # run over all the edge id's that we can find.
+        for each in os.listdir(label_path):
+            # skip over entities which are being created or removed.
+            if each.startswith(TEMP_PREFIX):
+                continue
+
+            try:
+                ident = int(each)
+            except ValueError:
+                logging.error(
+                    "%r is not a expected edge id number, skipping edge import",
+                    each
+                )
+                continue
+
+            head = _read_link_id(os.path.join(label_path, each, "head"))
+            if head is None:
+                logging.error(
+                    "Edge %r has no valid head vertex, skipping edge import",
+                    os.path.join(label_path, each)
+                )
+                continue
+
+            tail = _read_link_id(os.path.join(label_path, each, "tail"))
+            if tail is None:
+                logging.error(
+                    "Edge %r has no valid tail vertex, skipping edge import",
+                    os.path.join(label_path, each)
+                )
+                continue
+
+            yield ident, head[0], label, tail[0]
+
+
+def _search_for_vertex_id(path):
+    """
+    Internal helper function to search for vertices identity numbers
+    based in the directories.
+
+    :param path: Vertice path to find number directories.
+    :type path: :class:`str`
+    :return: Yields the integer number and label.
+    :rtype: Iterator of :class:`tuple` (:class:`int`, :class:`str`)
+    """
+    for label in os.listdir(path):
+        label_path = os.path.join(path, label)
+
+        # skip over files because we are only looking for directories.
+        if os.path.isfile(label_path):
+            continue
+
+        # run over all the vertice id's that we can find.
+        for each in os.listdir(label_path):
+            # skip over entities which are being created or removed.
+            if each.startswith(TEMP_PREFIX):
+                continue
+
+            try:
+                ident = int(each)
+            except ValueError:
+                logging.error(
+                    "%r is not a expected vertex id number, skipping",
+                    each
+                )
+                continue
+
+            yield ident, label
+
+
+def _makedirs(path):
+    """
+    Internal helper function to create a directory and its parents,
+    ignoring the directory if it already exists.
+
+    :param path: Directory to create.
+    :type path: :class:`str`
+    """
+    try:
+        os.makedirs(path)
+    except OSError as error:
+        if error.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def _symlink(source, link_name):
+    """
+    Internal helper function to create a symlink, ignoring the symlink if
+    it already exists.
+
+    :param source: Path the symlink points to.
+    :type source: :class:`str`
+    :param link_name: Path of the symlink.
+    :type link_name: :class:`str`
+    """
+    try:
+        os.symlink(source, link_name)
+    except OSError as error:
+        if error.errno != errno.EEXIST:
+            raise
+
+
+def _rmtree(path):
+    """
+    Internal helper function to remove a directory tree, ignoring the
+    directory if it does not exist.
+
+    The directory is first renamed to a temporary name so that it
+    disappears in one step, and a crash can not leave a half removed
+    entity behind.
+
+    :param path: Directory to remove.
+    :type path: :class:`str`
+    """
+    if not os.path.lexists(path):
+        return
+
+    temp_path = os.path.join(
+        os.path.dirname(path),
+        TEMP_PREFIX + os.path.basename(path)
+    )
+    _rmtree_temp(temp_path)
+    os.rename(path, temp_path)
+    shutil.rmtree(temp_path)
+
+
+def _rmtree_temp(path):
+    """
+    Internal helper function to remove a left over temporary directory.
+
+    :param path: Temporary directory to remove.
+    :type path: :class:`str`
+    """
+    if os.path.lexists(path):
+        shutil.rmtree(path)
+
+
+def _write_json(filename, data, indent=None):
+    """
+    Internal helper function to atomically replace a JSON file by writing
+    a temporary file and renaming it over the file.
+
+    :param filename: File to write.
+    :type filename: :class:`str`
+    :param data: Data to JSON encode.
+    :type data: :class:`dict` or :class:`list`
+    :param indent: JSON indentation.
+    :type indent: :class:`int` or :obj:`None`
+    """
+    with open(filename + ".tmp", "w") as json_fh:
+        json.dump(data, json_fh, indent=indent)
+    os.rename(filename + ".tmp", filename)
+
+
+_DEFAULT_OPTIONS = {
+    "lazy_properties": False,
+    "property_cache_size": 10000,
+    "write_behind": False,
+    "group_commit": False,
+    "commit_interval": 0.002,
+    "commit_size": 1000,
+    "incremental_properties": False,
+    "delta_compact_size": 4096,
+    "reuse_ids": False,
+    "replication": False,
+    "replication_log_size": 64 * 1024 * 1024,
+    "read_only": False,
+    "lock_timeout": 0,
+    "compression": None,
+    "intern_values": False,
+}
+
+
+class PersistentOptions(namedtuple("PersistentOptions", [
+        "lazy_properties",
+        "property_cache_size",
+        "write_behind",
+        "group_commit",
+        "commit_interval",
+        "commit_size",
+        "incremental_properties",
+        "delta_compact_size",
+        "reuse_ids",
+        "replication",
+        "replication_log_size",
+        "read_only",
+        "lock_timeout",
+        "compression",
+        "intern_values",
+])):
+    """
+    Options a :class:`~.PersistentGraph` is opened with. Options which are
+    not given keep their default value, and a copy with other options is
+    made with ``_replace``.
+
+    .. code-block:: python
+
+        >>> options = PersistentOptions(lazy_properties=True)
+        >>> graph = PersistentGraph("/tmp/graph", options=options)
+
+    :param lazy_properties: If True, defer reading the properties until
+        they are accessed. A filter on properties reads the properties
+        which have not been read yet, see :class:`~.PersistentGraph`.
+    :type lazy_properties: :class:`bool`
+    :param property_cache_size: Maximum number of entities with resident
+        properties when ``lazy_properties`` is enabled.
+    :type property_cache_size: :class:`int`
+    :param write_behind: If True, changes are applied in memory straight
+        away and written to disk by a background thread. Repeated property
+        writes to the same entity are coalesced. Use
+        :meth:`~.PersistentGraph.flush` to wait for the queued writes.
+    :type write_behind: :class:`bool`
+    :param group_commit: If True, enables write-behind and commits the
+        changes in groups to a journal, ``journal.log``, before they are
+        written to the vertices and edges directories. Each group is made
+        durable with a single write and ``fsync``. After
+        :meth:`~.PersistentGraph.flush` returns every change made before it
+        is durable, and otherwise a change is durable at most
+        ``commit_interval`` seconds after it was made. Once a change fails
+        to be committed or written, later changes raise
+        :class:`~.DatabaseException` until the path is opened again. The
+        journal is replayed when the path is loaded after a crash, and any
+        record which fails to be replayed is logged and moved to
+        ``journal.quarantine``.
+    :type group_commit: :class:`bool`
+    :param commit_interval: Seconds to gather changes into a group before
+        committing it.
+    :type commit_interval: :class:`float`
+    :param commit_size: Maximum number of changes in a group.
+    :type commit_size: :class:`int`
+    :param incremental_properties: If True,
+        :meth:`~.PersistentGraph.set_property` appends only the changed
+        keys to a ``properties.delta`` file next to the ``properties.json``
+        file instead of rewriting the whole properties file. The deltas are
+        merged when the properties are read, and compacted into
+        ``properties.json`` once the delta file grows larger than the
+        properties file and ``delta_compact_size``, or by calling
+        :meth:`~.PersistentGraph.compact`.
+    :type incremental_properties: :class:`bool`
+    :param delta_compact_size: Size in bytes a delta file can always grow
+        to before it is compacted.
+    :type delta_compact_size: :class:`int`
+    :param reuse_ids: If True, the ids of removed vertices and edges are
+        reused, see :class:`~.IDGenerator`.
+    :type reuse_ids: :class:`bool`
+    :param replication: If True, every change is also appended to a
+        replication log, ``replication.log``, which is followed by
+        :class:`~.ReplicaGraph` instances in other processes.
+    :type replication: :class:`bool`
+    :param replication_log_size: Start a new replication log, beginning
+        with a snapshot of the graph, once the log grows beyond this many
+        bytes.
+    :type replication_log_size: :class:`int`
+    :param read_only: If True, open the path for reading only. Any number
+        of read-only graphs, in any number of processes, can have the same
+        path open at the same time, together with the one graph which has
+        it open for writing. Read-only graphs never lock the path, and see
+        the changes made since they were loaded once
+        :meth:`~.PersistentGraph.refresh` is called. The write-behind,
+        group commit and replication options are ignored, and changing the
+        graph raises :class:`~.DatabaseReadOnly`.
+    :type read_only: :class:`bool`
+    :param lock_timeout: Seconds to keep retrying, with exponential
+        backoff, while the path is locked by another persistent graph
+        opened for writing, for example while the previous writer is
+        shutting down.
+    :type lock_timeout: :class:`float`
+    :param compression: Compress the properties files with ``zlib`` or
+        ``lzma``, see :class:`~.PropertyCodec`. Properties files written
+        without compression are still read, and the other way around.
+    :type compression: :class:`str` or :obj:`None`
+    :param intern_values: If True, the string values of the properties
+        read from disk are interned, so that values repeated across
+        vertices and edges are only held in memory once.
+    :type intern_values: :class:`bool`
+    :raises TypeError: If a option is not known.
+    """
+    __slots__ = ()
+
+    def __new__(cls, **options):
+        unknown = set(options) - set(cls._fields)
+        if unknown:
+            raise TypeError("Unknown options {0!r}".format(sorted(unknown)))
+        return cls._make(
+            options.get(name, _DEFAULT_OPTIONS[name]) for name in cls._fields
+        )
+
+
+class GraphStore(object):
+    """
+    Vertices, edges and constraints of a :class:`~.PersistentGraph` stored
+    in a directory.
+
+    .. code::
+
+        path
+           |_ vertices
+           |     |_ constraints.json (file)
+           |     |_ label
+           |     |     |_ 0
+           |     |        |_ properties.json (file)
+           |     |        |_ in-edges
+           |     |        |     |_ 0 -> ../../../../edges/label/0 (symlink)
+           |     |        |_ out-edges
+           |     |              |_
+           |     |
+           |     |_ label
+           |     |    |_ 1
+           |     |         |_ properties.json (file)
+           |     |          |_ in-edges
+           |     |          |     |_
+           |     |          |_ out-edges
+           |     |                |_ 0 -> ../../../../edges/label/0 (symlink)
+           |
+           |_ edges
+                 |_ label
+                       |
+                       |_0
+                         |_ properties.json (file)
+                         |_ head
+                         |   |_ 0 -> ../../../vertices/0 (symlink)
+                         |_ tail
+                             |_ 1 -> ../../../vertices/1 (symlink)
+
+    Every change is made by applying a mutation record, see :meth:`apply`.
+    Vertices and edges are created under a temporary name and renamed into
+    place, so a crash can not leave half created entities behind, and the
+    files and directories changed are recorded so that they can be flushed
+    to disk before the journal is checkpointed.
+
+    :param path: Path to ruruki graph data on disk.
+    :type path: :class:`str`
+    :param compression: Compression of the properties files, see
+        :class:`~.PropertyCodec`.
+    :type compression: :class:`str` or :obj:`None`
+    :param delta_compact_size: Size in bytes a property delta file can
+        always grow to before it is compacted.
+    :type delta_compact_size: :class:`int`
+    """
+
+    def __init__(self, path, compression=None, delta_compact_size=4096):
+        self.path = path
+        self.delta_compact_size = delta_compact_size
+        self.changed = ChangedPaths()
+        self.codec = PropertyCodec(
+            os.path.join(path, "dictionaries"),
+            compression,
+        )
+
+    @property
+    def vertices_path(self):
+        """
+        Directory holding the vertices.
+        """
+        return os.path.join(self.path, "vertices")
+
+    @property
+    def edges_path(self):
+        """
+        Directory holding the edges.
+        """
+        return os.path.join(self.path, "edges")
+
+    @property
+    def vertices_constraints_path(self):
+        """
+        File holding the vertices constraints.
+        """
+        return os.path.join(self.vertices_path, "constraints.json")
+
+    @property
+    def journal_path(self):
+        """
+        File holding the journal written with ``group_commit``.
+        """
+        return os.path.join(self.path, "journal.log")
+
+    @property
+    def state_path(self):
+        """
+        File holding the state of the graph.
+        """
+        return os.path.join(self.path, "state.json")
+
+    def create(self):
+        """
+        Check that ``vertices`` and ``edges`` directories exists, and if
+        not create them and all the other required files and folders.
+
+        :returns: True if the directories were created.
+        :rtype: :class:`bool`
+        """
+        if (os.path.exists(self.vertices_path) and
+                os.path.exists(self.edges_path)):
+            return False
+
+        os.makedirs(self.vertices_path)
+        with open(self.vertices_constraints_path, "w") as constraint_fh:
+            constraint_fh.write("[]")
+        os.makedirs(self.edges_path)
+        return True
+
+    def vertex_path(self, label, ident):
+        """
+        Return the path of a vertex.
+
+        :param label: Vertex label.
+        :type label: :class:`str`
+        :param ident: Vertex identity number.
+        :type ident: :class:`int`
+        :returns: Path of the vertex.
+        :rtype: :class:`str`
+        """
+        return os.path.join(self.vertices_path, label, str(ident))
+
+    def edge_path(self, label, ident):
+        """
+        Return the path of a edge.
+
+        :param label: Edge label.
+        :type label: :class:`str`
+        :param ident: Edge identity number.
+        :type ident: :class:`int`
+        :returns: Path of the edge.
+        :rtype: :class:`str`
+        """
+        return os.path.join(self.edges_path, label, str(ident))
+
+    def iter_vertices(self):
+        """
+        Scan through the vertices directory.
+
+        .. code::
+
+            path
+               |_ vertices
+                    |_ constraints.json (file)
+                    |_ labelA
+                    |     |_ 0
+                    |        |_ properties.json (file)
+                    |
+                    |_ labelB
+                         |_ 1
+                            |_ properties.json (file)
+
+        :returns: Yields the identity number and label of the vertices.
+        :rtype: Iterator of :class:`tuple` (:class:`int`, :class:`str`)
+        """
+        return _search_for_vertex_id(self.vertices_path)
+
+    def iter_edges(self):
+        """
+        Scan through the edges directory.
+
+        .. code::
+
+            path
+               |_ edges
+                     |_ label
+                          |_0
+                            |_ properties.json (file)
+                            |_ head
+                            |   |_ 0 -> ../../../vertices/0 (symlink)
+                            |_ tail
+                                |_ 1 -> ../../../vertices/1 (symlink)
+
+        :returns: Yields the identity number, head id, label and tail id
+            of the edges.
+        :rtype: Iterator of :class:`tuple`
+            (:class:`int`, :class:`int`, :class:`str`, :class:`int`)
+        """
+        return _search_for_edge_ids(self.edges_path)
+
+    def read_vconstraints(self):
+        """
+        Read the vertices constraints file.
+
+        :returns: Label and key dictionaries.
+        :rtype: :class:`list` of :class:`dict`
+        """
+        logging.info(
+            "Loading vertices constraints %r", self.vertices_constraints_path
+        )
+        with open(self.vertices_constraints_path) as vconstraints_fh:
+            return json.load(vconstraints_fh)
+
+    def read_properties(self, path):
+        """
+        Read the properties file of a vertex or edge, and merge in the
+        changes recorded in its delta file.
+
+        :param path: Vertex or edge path.
+        :type path: :class:`str`
+        :returns: The properties, or an empty :class:`dict` if there is no
+            properties file.
+        :rtype: :class:`dict`
+        """
+        try:
+            prop_fh = open(os.path.join(path, "properties.json"), "rb")
+        except IOError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            properties = {}
+        else:
+            with prop_fh:
+                properties = self.codec.decode(prop_fh.read())
+
+        try:
+            delta_fh = open(os.path.join(path, "properties.delta"))
+        except IOError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            return properties
+
+        with delta_fh:
+            for line in delta_fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    properties.update(json.loads(line))
+                except ValueError:
+                    logging.warning(
+                        "Ignoring corrupt property delta in %r", path
+                    )
+        return properties
+
+    def read_state(self):
+        """
+        Read the state file.
+
+        :returns: The state, or an empty :class:`dict` if there is no
+            readable state file.
+        :rtype: :class:`dict`
+        """
+        try:
+            with open(self.state_path) as state_fh:
+                return json.load(state_fh)
+        except (IOError, ValueError):
+            return {}
+
+    def write_state(self, state):
+        """
+        Atomically replace the state file.
+
+        :param state: State to write.
+        :type state: :class:`dict`
+        """
+        _write_json(self.state_path, state)
+
+    def apply(self, record):
+        """
+        Apply a mutation record to the files on disk.
+
+        .. note::
+
+            Applying a record is idempotent, so records from the journal
+            can safely be applied again when recovering from a crash.
+
+        :param record: Mutation record.
+        :type record: :class:`dict`
+        :raises DatabaseException: If the record is not known.
+        """
+        operation = record["op"]
+        if operation == "add_vertex":
+            self._create_vertex_path(
+                self.vertex_path(record["label"], record["id"]),
+                record["properties"],
+            )
+        elif operation == "add_edge":
+            self._create_edge_path(
+                self.edge_path(record["label"], record["id"]),
+                record["properties"],
+                self.vertex_path(record["head_label"], record["head_id"]),
+                self.vertex_path(record["tail_label"], record["tail_id"]),
+            )
+        elif operation in ("set_property", "update_properties"):
+            if record["entity"] == "vertex":
+                path = self.vertex_path(record["label"], record["id"])
+            else:
+                path = self.edge_path(record["label"], record["id"])
+            if operation == "set_property":
+                self._write_properties(path, record["properties"])
+            else:
+                self._append_properties(path, record["properties"])
+        elif operation == "remove_vertex":
+            path = self.vertex_path(record["label"], record["id"])
+            _rmtree(path)
+            self.changed.add(path)
+        elif operation == "remove_edge":
+            self._remove_edge_path(
+                self.edge_path(record["label"], record["id"])
+            )
+        elif operation == "constraints":
+            _write_json(
+                self.vertices_constraints_path,
+                record["constraints"],
+                indent=4,
+            )
+            self.changed.add(self.vertices_constraints_path)
+        else:
+            raise interfaces.DatabaseException(
+                "Unknown mutation record {0!r}".format(record)
+            )
+
+    def recover_journal(self):
+        """
+        Apply the records left in the journal by a graph which did not
+        close cleanly, and then empty the journal.
+
+        Records which fail to be applied are logged and moved to the
+        ``journal.quarantine`` file, so that a record which can never be
+        applied does not stop the path from being opened.
+        """
+        if not os.path.isfile(self.journal_path):
+            return
+
+        count = 0
+        quarantine = []
+        for record in read_records(self.journal_path):
+            count += 1
+            try:
+                self.apply(record)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception(
+                    "Quarantined journal record %r of %r",
+                    record,
+                    self.journal_path
+                )
+                quarantine.append(record)
+
+        if quarantine:
+            quarantine_journal = Journal(
+                os.path.join(self.path, "journal.quarantine")
+            )
+            try:
+                quarantine_journal.write(quarantine)
+            finally:
+                quarantine_journal.close()
+
+        if count > 0:
+            logging.warning(
+                "Recovered %d records from journal %r",
+                count - len(quarantine),
+                self.journal_path
+            )
+            # the journal is kept if the changes can not be made durable.
+            if self.changed.sync():
+                open(self.journal_path, "w").close()
+
+    def compact_properties(self, path):
+        """
+        Merge the delta file of a vertex or edge into its properties file.
+
+        :param path: Vertex or edge path.
+        :type path: :class:`str`
+        :returns: True if the vertex or edge had a delta file.
+        :rtype: :class:`bool`
+        """
+        if not os.path.exists(os.path.join(path, "properties.delta")):
+            return False
+
+        # replacing the properties file is atomic, and merging the deltas
+        # again after a crash before they are removed is harmless.
+        self._write_properties_file(path, self.read_properties(path))
+        os.remove(os.path.join(path, "properties.delta"))
+        return True
+
+    def _create_vertex_path(self, path, properties):
+        """
+        Create the directory structure and properties file of a vertex.
+
+        The vertex is created under a temporary name and renamed into place,
+        so a crash never leaves a half created vertex behind. Nothing is
+        done if the vertex already exists.
+
+        :param path: Vertex path to create.
+        :type path: :class:`str`
+        :param properties: Vertex properties.
+        :type properties: :class:`dict`
+        """
+        if os.path.isdir(path):
+            return
+
+        temp_path = os.path.join(
+            os.path.dirname(path),
+            TEMP_PREFIX + os.path.basename(path)
+        )
+        _rmtree_temp(temp_path)
+        _makedirs(os.path.join(temp_path, "in-edges"))
+        _makedirs(os.path.join(temp_path, "out-edges"))
+        self._write_properties_file(temp_path, properties)
+
+        os.rename(temp_path, path)
+        # the label directory may have been created with the vertex.
+        self.changed.add(os.path.join(path, "properties.json"), parents=3)
+
+    def _create_edge_path(self, path, properties, head_path, tail_path):
+        """
+        Create the directory structure, properties file and the symlinks
+        between a edge and its head and tail vertices.
+
+        The edge is created under a temporary name and renamed into place,
+        so a crash never leaves a edge without a head or tail behind. The
+        links from the head and tail vertices back to the edge are created
+        afterwards, and are recreated by :func:`~.fsck` if they are missing.
+
+        :param path: Edge path to create.
+        :type path: :class:`str`
+        :param properties: Edge properties.
+        :type properties: :class:`dict`
+        :param head_path: Path of the head vertex.
+        :type head_path: :class:`str`
+        :param tail_path: Path of the tail vertex.
+        :type tail_path: :class:`str`
+        """
+        if not os.path.isdir(path):
+            temp_path = os.path.join(
+                os.path.dirname(path),
+                TEMP_PREFIX + os.path.basename(path)
+            )
+            edge_head_path = os.path.join(temp_path, "head")
+            edge_tail_path = os.path.join(temp_path, "tail")
+
+            _rmtree_temp(temp_path)
+            _makedirs(edge_head_path)
+            _makedirs(edge_tail_path)
+            self._write_properties_file(temp_path, properties)
+
+            # the last part of the vertex and edge paths are the identity
+            # numbers
+            _symlink(
+                head_path,
+                os.path.join(edge_head_path, os.path.basename(head_path))
+            )
+            _symlink(
+                tail_path,
+                os.path.join(edge_tail_path, os.path.basename(tail_path))
+            )
+
+            os.rename(temp_path, path)
+            self.changed.add(os.path.join(path, "head"))
+            self.changed.add(os.path.join(path, "tail"))
+            self.changed.add(os.path.join(path, "properties.json"), parents=3)
+
+        _symlink(
+            path,
+            os.path.join(
+                head_path,
+                "out-edges",
+                os.path.basename(path)
+            )
+        )
+
+        _symlink(
+            path,
+            os.path.join(
+                tail_path,
+                "in-edges",
+                os.path.basename(path)
+            )
+        )
+        self.changed.add(os.path.join(head_path, "out-edges"), parents=0)
+        self.changed.add(os.path.join(tail_path, "in-edges"), parents=0)
+
+    def _remove_edge_path(self, path):
+        """
+        Remove a edge and the links from its head and tail vertices.
+
+        :param path: Edge path to remove.
+        :type path: :class:`str`
+        """
+        for direction, back_link in [("head", "out-edges"),
+                                     ("tail", "in-edges")]:
+            try:
+                names = os.listdir(os.path.join(path, direction))
+            except OSError:
+                continue
+
+            for name in names:
+                try:
+                    # restored backups use relative symlinks.
+                    vertex_path = os.path.join(
+                        path,
+                        direction,
+                        os.readlink(os.path.join(path, direction, name))
+                    )
+                    os.remove(
+                        os.path.join(
+                            vertex_path,
+                            back_link,
+                            os.path.basename(path)
+                        )
+                    )
+                    self.changed.add(
+                        os.path.join(vertex_path, back_link),
+                        parents=0,
+                    )
+                except OSError as error:
+                    if error.errno not in (errno.ENOENT, errno.EINVAL):
+                        raise
+        _rmtree(path)
+        self.changed.add(path)
+
+    def _write_properties(self, path, properties):
+        """
+        Rewrite the properties file of a vertex or edge.
+
+        :param path: Vertex or edge path.
+        :type path: :class:`str`
+        :param properties: Properties to write.
+        :type properties: :class:`dict`
+        """
+        # compact any deltas first so that a crash can never leave stale
+        # deltas to be merged over the new properties.
+        self.compact_properties(path)
+        self._write_properties_file(path, properties)
+
+    def _write_properties_file(self, path, properties):
+        """
+        Atomically replace the properties file of a vertex or edge, encoded
+        with the compression of the graph.
+
+        :param path: Vertex or edge path.
+        :type path: :class:`str`
+        :param properties: Properties to write.
+        :type properties: :class:`dict`
+        """
+        # the vertex or edge path ends with the kind, label and id.
+        label_path = os.path.dirname(path)
+        name = "{0}/{1}".format(
+            os.path.basename(os.path.dirname(label_path)),
+            os.path.basename(label_path),
+        )
+        filename = os.path.join(path, "properties.json")
+        with open(filename + ".tmp", "wb") as prop_fh:
+            prop_fh.write(self.codec.encode(name, properties))
+        os.rename(filename + ".tmp", filename)
+        self.changed.add(filename)
+
+    def _append_properties(self, path, properties):
+        """
+        Append the changed properties of a vertex or edge to its delta
+        file, and compact the delta file once it has grown larger than the
+        properties file.
+
+        :param path: Vertex or edge path.
+        :type path: :class:`str`
+        :param properties: Changed properties.
+        :type properties: :class:`dict`
+        """
+        delta = json.dumps(properties, sort_keys=True) + "\n"
+        with open(os.path.join(path, "properties.delta"), "ab+") as delta_fh:
+            delta_fh.seek(0, os.SEEK_END)
+            if delta_fh.tell() > 0:
+                # start on a new line if a previous append was torn.
+                delta_fh.seek(-1, os.SEEK_END)
+                if delta_fh.read(1) != b"\n":
+                    delta = "\n" + delta
+            delta_fh.write(delta.encode("utf-8"))
+            size = delta_fh.tell()
+        self.changed.add(os.path.join(path, "properties.delta"))
+
+        try:
+            prop_size = os.path.getsize(os.path.join(path, "properties.json"))
+        except OSError:
+            prop_size = 0
+
+        if size > max(prop_size, self.delta_compact_size):
+            self.compact_properties(path)
+
+
+class PropertyCache(object):
+    """
+    Least recently used bound on the number of entities that have their
+    properties resident in memory.
+
+    Entities which had their properties deferred with
+    :meth:`~.DeferredPropertiesMixin.defer_properties` load them through the
+    cache, and the least recently used entity has its properties evicted
+    once the cache is full.
+
+    :param loader: Callable which takes an entity and returns its
+        properties.
+    :type loader: callable
+    :param size: Maximum number of entities with resident properties.
+    :type size: :class:`int`
+    """
+
+    def __init__(self, loader, size=10000):
+        if size < 1:
+            raise ValueError("Cache size needs to be at least 1.")
+        self.loader = loader
+        self.size = size
+        self._resident = OrderedDict()
+
+    def __len__(self):
+        return len(self._resident)
+
+    def __contains__(self, entity):
+        return entity in self._resident
+
+    def load(self, entity):
+        """
+        Read the entity properties and mark them as the most recently used,
+        evicting the least recently used properties if the cache is full.
+
+        :param entity: Entity to load the properties for.
+        :type entity: :class:`~.IEntity`
+        :returns: Loaded properties.
+        :rtype: :class:`dict`
+        """
+        properties = self.loader(entity)
+        resident = self._resident
+        resident[entity] = None
+        while len(resident) > self.size:
+            evicted, _ = resident.popitem(last=False)
+            evicted.evict_properties()
+        return properties
+
+    def touch(self, entity):
+        """
+        Mark the entity properties as the most recently used.
+
+        :param entity: Entity with resident properties.
+        :type entity: :class:`~.IEntity`
+        """
+        resident = self._resident
+        if entity in resident:
+            del resident[entity]
+            resident[entity] = None
+
+    def discard(self, entity):
+        """
+        Stop tracking the entity without evicting its properties.
+
+        :param entity: Entity to stop tracking.
+        :type entity: :class:`~.IEntity`
+        """
+        self._resident.pop(entity, None)
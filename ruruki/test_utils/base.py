@@ -11,8 +11,17 @@ class TestBase(unittest.TestCase):
     """
     Base test class.
     """
+    def create_graph(self):  # pylint: disable=no-self-use
+        """
+        Create the graph that the test graph data is loaded into.
+
+        :returns: New empty graph.
+        :rtype: :class:`~.IGraph`
+        """
+        return graphs.Graph()
+
     def setUp(self):
-        self.graph = graphs.Graph()
+        self.graph = self.create_graph()
         self.graph.load(helpers.get_test_dump_graph_file_handler())
 
         # See test_utils/small_people_graph.dump
@@ -0,0 +1,102 @@
+"""
+Benchmark of the fast Cypher parser against the parsley grammar, which
+checks that they return the same syntax trees, from the command line::
+
+    python -m ruruki.test_utils.cypher_benchmark [--number 100]
+"""
+import argparse
+import functools
+import sys
+import timeit
+from ruruki.parsers import fast_cypher_parser
+from ruruki.parsers.cypher_parser import Parser
+
+
+BENCHMARK_QUERIES = [
+    "MATCH (a:person) RETURN a",
+    "MATCH (a:person {name: 'Marko'})-[r:knows]->(b:person) "
+    "RETURN b.name AS name, r.weight",
+    "MATCH (a:person)-[:created]->(b)<-[:created]-(c) "
+    "WHERE a.age > {age} AND NOT c.name STARTS WITH 'M' "
+    "RETURN DISTINCT c.name ORDER BY c.name SKIP 1 LIMIT 10",
+    "MATCH p = (a)-[*1..3]-(b) WHERE id(a) = 1 OR a.name IN ['x', 'y'] "
+    "RETURN CASE WHEN a.age < 30 THEN 'young' ELSE 'old' END, length(p)",
+]
+
+
+def _grammar_parse(query_string):
+    """
+    Parse a Cypher query with the parsley grammar.
+
+    :param query_string: Cypher query.
+    :type query_string: :class:`str`
+    :returns: Abstract syntax tree of the query.
+    :rtype: :class:`list`
+    """
+    return Parser(query_string).Cypher()
+
+
+def benchmark(queries=None, number=100):
+    """
+    Time the fast parser against the parsley grammar.
+
+    :param queries: Queries to parse, defaults to :data:`BENCHMARK_QUERIES`.
+    :type queries: :class:`list` of :class:`str`
+    :param number: Number of times each query is parsed.
+    :type number: :class:`int`
+    :returns: The query, the seconds taken by the fast parser and by the
+        grammar to parse it once, and whether they returned the same syntax
+        tree, for each query.
+    :rtype: :class:`list` of :class:`tuple`
+    """
+    results = []
+    for query_string in queries or BENCHMARK_QUERIES:
+        fast = functools.partial(fast_cypher_parser.parse, query_string)
+        grammar = functools.partial(_grammar_parse, query_string)
+        results.append(
+            (
+                query_string,
+                timeit.timeit(fast, number=number) / number,
+                timeit.timeit(grammar, number=number) / number,
+                fast() == grammar(),
+            )
+        )
+    return results
+
+
+def main(argv=None):
+    """
+    Command line entry point running :func:`benchmark`.
+
+    :param argv: Command line arguments, defaults to :data:`sys.argv`.
+    :type argv: :class:`list` of :class:`str`
+    :returns: Exit status, 0 if both parsers agree on every query.
+    :rtype: :class:`int`
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare the fast Cypher parser with the grammar."
+    )
+    parser.add_argument(
+        "--number",
+        type=int,
+        default=100,
+        help="Number of times each query is parsed.",
+    )
+    args = parser.parse_args(argv)
+
+    results = benchmark(number=args.number)
+    for query_string, fast, grammar, same in results:
+        sys.stdout.write(
+            "{0:10.1f}us {1:10.1f}us {2:8.1f}x {3} {4}\n".format(
+                fast * 1e6,
+                grammar * 1e6,
+                grammar / fast,
+                "same" if same else "DIFFERENT",
+                query_string,
+            )
+        )
+    return 0 if all(each[3] for each in results) else 1
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+
+import unittest
+from ruruki import columns
+from ruruki.columns import ColumnStore
+from ruruki.entities import Vertex
+
+
+class TestColumnStore(unittest.TestCase):
+    def setUp(self):
+        self.store = ColumnStore()
+        self.marko = Vertex("person")
+        self.josh = Vertex("person")
+        self.marko_props = self.store.allocate(
+            self.marko, {"name": "Marko", "age": 29}
+        )
+        self.josh_props = self.store.allocate(self.josh, {"name": "Josh"})
+
+    def test_mapping(self):
+        self.assertEqual(self.marko_props, {"name": "Marko", "age": 29})
+        self.assertEqual(self.josh_props, {"name": "Josh"})
+        self.assertEqual(len(self.josh_props), 1)
+        self.assertNotIn("age", self.josh_props)
+        self.assertRaises(KeyError, lambda: self.josh_props["age"])
+        self.assertEqual(self.josh_props.get("age"), None)
+
+        self.josh_props.update(age=32, city="Sydney")
+        self.assertEqual(
+            self.josh_props.copy(),
+            {"name": "Josh", "age": 32, "city": "Sydney"},
+        )
+        self.assertEqual(self.marko_props, {"name": "Marko", "age": 29})
+
+        del self.josh_props["city"]
+        self.assertRaises(KeyError, self.josh_props.__delitem__, "city")
+        self.assertEqual(sorted(self.josh_props), ["age", "name"])
+
+    def test_release_reuses_row(self):
+        self.assertEqual(len(self.store), 2)
+        self.store.release(self.marko_props.row)
+        self.assertEqual(len(self.store), 1)
+
+        sue = Vertex("person")
+        sue_props = self.store.allocate(sue, {"city": "Sydney"})
+        self.assertEqual(sue_props.row, self.marko_props.row)
+        self.assertEqual(sue_props, {"city": "Sydney"})
+
+    def test_scan(self):
+        self.assertEqual(self.store.scan("name", None, "Josh"), {self.josh})
+        self.assertEqual(
+            self.store.scan("name", "istartswith", "m"),
+            {self.marko},
+        )
+        self.assertEqual(self.store.scan("age", "lt", 30), {self.marko})
+        self.assertEqual(self.store.scan("unknown", None, 1), set())
+
+    @unittest.skipIf(columns.numpy is None, "needs numpy")
+    def test_array(self):
+        array, present = self.store.array("age")
+        self.assertEqual(list(present), [True, False])
+        self.assertEqual(array[0], 29)
+        self.assertIs(self.store.array("age")[0], array)
+        self.assertEqual(self.store.array("name"), None)
+        self.assertEqual(self.store.array("unknown"), None)
+
+        # the array is rebuilt once the column changes.
+        self.josh_props["age"] = 32
+        array, present = self.store.array("age")
+        self.assertEqual(list(present), [True, True])
+        self.assertEqual(list(array), [29, 32])
+
+        del self.josh_props["age"]
+        self.assertEqual(list(self.store.array("age")[1]), [True, False])
+
+        sue = Vertex("person")
+        self.store.allocate(sue, {"age": 1.5})
+        self.assertEqual(self.store.array("age"), None)
+
+        self.josh_props["age"] = 2 ** 70
+        self.store.release(self.store.allocate(Vertex("person"), {}).row)
+        self.assertEqual(self.store.array("age"), None)
+
+    @unittest.skipIf(columns.numpy is None, "needs numpy")
+    def test_vectorized_scan(self):
+        self.josh_props["age"] = 32
+        sue = Vertex("person")
+        self.store.allocate(sue, {"age": None})
+        for verb, value, expected in [
+                (None, 29, {self.marko}),
+                ("eq", 32, {self.josh}),
+                ("ne", 32, {self.marko}),
+                ("gt", 29, {self.josh}),
+                ("ge", 29, {self.marko, self.josh}),
+                ("lt", 29.5, {self.marko}),
+                ("le", 2 ** 70, {self.marko, self.josh}),
+                ("eq", "29", set()),
+        ]:
+            self.assertEqual(self.store.scan("age", verb, value), expected)
+        self.assertEqual(len(self.store._arrays), 1)
@@ -0,0 +1,170 @@
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+from ruruki import compression
+from ruruki.compression import Interner, MissingDictionary, PropertyCodec
+from ruruki.compression import SymbolTable
+
+
+class TestPropertyCodec(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "dictionaries")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.path))
+        self.properties = {"name": "Marko", "age": 29, "city": "Sydney"}
+
+    def test_plain(self):
+        codec = PropertyCodec(self.path)
+        data = codec.encode("vertices/person", self.properties)
+        self.assertEqual(data[:1], b"{")
+        self.assertEqual(codec.decode(data), self.properties)
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, PropertyCodec, self.path, "snappy")
+
+    def test_available_codecs(self):
+        self.assertIn("zlib", compression.available_codecs())
+
+    def test_compression_round_trip(self):
+        for codec_name in compression.available_codecs():
+            codec = PropertyCodec(self.path, codec_name)
+            data = codec.encode("vertices/person", self.properties)
+            self.assertEqual(data[:3], compression.MAGIC)
+            # every codec decodes every format.
+            self.assertEqual(
+                PropertyCodec(self.path).decode(data),
+                self.properties,
+            )
+
+    def test_corrupt(self):
+        codec = PropertyCodec(self.path, "zlib")
+        data = codec.encode("vertices/person", self.properties)
+        for corrupt in [data[:-4], data[:5], b"[1, 2]", b"{"]:
+            self.assertRaises(ValueError, codec.decode, corrupt)
+
+    @unittest.skipIf(not compression.ZDICT_SUPPORTED, "needs Python 3.3")
+    def test_shared_dictionary(self):
+        codec = PropertyCodec(self.path, "zlib", sample_size=4)
+        sizes = []
+        for each in range(8):
+            properties = dict(self.properties, ident=each)
+            data = codec.encode("vertices/person", properties)
+            sizes.append(len(data))
+            self.assertEqual(codec.decode(data), properties)
+
+        self.assertLess(sizes[-1], sizes[0])
+        self.assertEqual(sorted(os.listdir(self.path))[-1], "labels.json")
+        self.assertEqual(len(codec.dictionaries()), 2)
+
+        # the dictionary is read back from disk.
+        reopened = PropertyCodec(self.path, "zlib")
+        self.assertEqual(reopened.decode(data), properties)
+        self.assertEqual(
+            len(reopened.encode("vertices/person", properties)),
+            sizes[-1],
+        )
+
+        # other labels have their own dictionary.
+        data = codec.encode("vertices/city", {"name": "Sydney"})
+        self.assertEqual(compression.HEADER.unpack_from(data)[2], 0)
+
+        os.remove(os.path.join(self.path, codec.dictionaries()[0][0]))
+        self.assertRaises(
+            MissingDictionary,
+            PropertyCodec(self.path).decode,
+            reopened.encode("vertices/person", properties),
+        )
+
+    @unittest.skipIf(not compression.ZDICT_SUPPORTED, "needs Python 3.3")
+    def test_dictionary_id_collision(self):
+        dictionary = json.dumps(self.properties, sort_keys=True).encode()
+        ident = zlib.adler32(dictionary) & 0xffffffff or 1
+
+        # another label already has a different dictionary with the id.
+        os.makedirs(self.path)
+        other_path = os.path.join(self.path, "{0:08x}".format(ident))
+        with open(other_path, "wb") as dict_fh:
+            dict_fh.write(b"another dictionary")
+
+        codec = PropertyCodec(self.path, "zlib", sample_size=1)
+        codec.encode("vertices/person", self.properties)
+        data = codec.encode("vertices/person", self.properties)
+        self.assertNotIn(compression.HEADER.unpack_from(data)[2], [0, ident])
+        with open(other_path, "rb") as dict_fh:
+            self.assertEqual(dict_fh.read(), b"another dictionary")
+        self.assertEqual(
+            PropertyCodec(self.path).decode(data),
+            self.properties,
+        )
+
+        # the same dictionary built again keeps its id.
+        self.assertEqual(
+            PropertyCodec(self.path)._dictionary_id(dictionary),
+            compression.HEADER.unpack_from(data)[2],
+        )
+
+    def test_has_header(self):
+        codec = PropertyCodec(self.path, "zlib")
+        data = codec.encode("vertices/person", self.properties)
+        self.assertEqual(compression.has_header(data), True)
+        self.assertEqual(compression.has_header(data[:4]), False)
+        self.assertEqual(compression.has_header(b'{"name": 1}'), False)
+        self.assertEqual(
+            compression.has_header(
+                compression.HEADER.pack(compression.MAGIC, b"?", 0)
+            ),
+            False,
+        )
+
+    @unittest.skipIf(not compression.ZDICT_SUPPORTED, "needs Python 3.3")
+    def test_no_learning(self):
+        codec = PropertyCodec(self.path, "zlib", sample_size=1)
+        codec.encode("vertices/person", self.properties, learn=False)
+        self.assertEqual(codec.dictionaries(), [])
+        self.assertEqual(os.path.exists(self.path), False)
+
+
+class TestInterner(unittest.TestCase):
+    def test_intern(self):
+        interner = Interner(max_length=8)
+        first = "".join(["Syd", "ney"])
+        second = "".join(["Sy", "dney"])
+        self.assertIsNot(first, second)
+        self.assertIs(interner.intern(first), first)
+        self.assertIs(interner.intern(second), first)
+        self.assertEqual(interner.intern(1), 1)
+        self.assertEqual(len(interner), 1)
+
+    def test_long_strings_not_interned(self):
+        interner = Interner(max_length=4)
+        interner.intern("Sydney")
+        self.assertEqual(len(interner), 0)
+
+    def test_intern_properties(self):
+        interner = Interner()
+        first = interner.intern_properties({"city": "".join(["a", "b"])})
+        second = interner.intern_properties({"city": "".join(["a", "b"])})
+        self.assertIs(first["city"], second["city"])
+
+
+class TestSymbolTable(unittest.TestCase):
+    def test_intern(self):
+        symbols = SymbolTable()
+        first = "".join(["na", "me"])
+        self.assertIsNot(first, "name")
+        # symbols are the same objects as the identifiers in code.
+        self.assertIs(symbols.intern(first), "name")
+        self.assertIs(symbols.intern("".join(["n", "ame"])), "name")
+        self.assertEqual(symbols.intern(None), None)
+        self.assertEqual(len(symbols), 1)
+
+    def test_intern_keys(self):
+        symbols = SymbolTable()
+        properties = {"".join(["na", "me"]): "Marko"}
+        interned = symbols.intern_keys(properties)
+        self.assertEqual(interned, properties)
+        self.assertIs(list(interned)[0], "name")
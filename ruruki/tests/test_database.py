@@ -5,15 +5,25 @@
 # pylint: disable=too-many-statements
 # pylint: disable=too-many-lines
 
+import io
 import json
 import os
 import shutil
+import sqlite3
+import tarfile
 import tempfile
+import threading
 import unittest
-from ruruki import interfaces
+from ruruki import compression, interfaces
 from ruruki.graphs import Graph, PersistentGraph
+from ruruki.graphs import IDGenerator
+from ruruki.columns import ColumnProperties
 from ruruki.entities import Entity, Edge, Vertex
+from ruruki.fsck import fsck
+from ruruki.journal import read_records
 from ruruki.entities import PersistentVertex, PersistentEdge
+from ruruki.sqlite import SQLiteGraph
+from ruruki.storage import PersistentOptions, _search_for_edge_ids
 from ruruki.test_utils import base, helpers
 
 
@@ -231,6 +241,28 @@ class TestGraph(base.TestBase):
             }
         )
 
+    def test_load_interns_labels_and_keys(self):
+        graph = Graph()
+        graph.load(helpers.get_test_dump_graph_file_handler())
+        marko = graph.get_vertex(0)
+        vadas = graph.get_vertex(1)
+        self.assertIs(marko.label, vadas.label)
+        self.assertEqual(
+            [a is b for a, b in zip(sorted(marko.properties),
+                                    sorted(vadas.properties))],
+            [True, True],
+        )
+        self.assertIs(graph.get_edge(3).label, graph.get_edge(4).label)
+
+    def test_set_property_interns_keys(self):
+        self.graph.set_property(self.marko, **{"".join(["ci", "ty"]): "x"})
+        self.graph.set_property(self.josh, **{"".join(["c", "ity"]): "y"})
+        keys = [
+            key for each in [self.marko, self.josh]
+            for key in each.properties if key == "city"
+        ]
+        self.assertIs(keys[0], keys[1])
+
     def test_append_vertex(self):
         node = Vertex(label="NODE")
         self.graph.append_vertex(node)
@@ -316,6 +348,16 @@ class TestGraph(base.TestBase):
         node = self.graph.add_vertex(label="NODE")
         self.assertEqual(node.ident, last + 1)
 
+    def test_query(self):
+        self.assertEqual(
+            self.graph.query(
+                "MATCH (a:person)-[:knows]->(b) WHERE b.age > {age} "
+                "RETURN a, b.name",
+                {"age": 30},
+            ),
+            [{"a": self.marko, "b.name": "josh"}],
+        )
+
     def test_get_vertex(self):
         self.assertEqual(self.graph.get_vertex(1), self.vadas)
 
@@ -655,6 +697,72 @@ class TestGraph(base.TestBase):
         )
 
 
+class TestColumnarGraph(TestGraph):
+    def create_graph(self):
+        graph = Graph()
+        for label in ["person", "app", "knows", "created"]:
+            graph.add_column_store(label)
+        return graph
+
+    def assertDictEqual(self, first, second, msg=None):
+        # the properties are mapping views over the columns.
+        super(TestColumnarGraph, self).assertDictEqual(
+            dict(first), dict(second), msg
+        )
+
+    def test_properties_are_column_views(self):
+        self.assertIsInstance(self.marko.properties, ColumnProperties)
+        self.assertIsInstance(
+            self.marko_knows_josh.properties,
+            ColumnProperties,
+        )
+        self.assertEqual(self.marko.properties["name"], "marko")
+        self.assertEqual(self.marko.prop__name, "marko")
+
+    def test_add_column_store_to_existing_label(self):
+        graph = Graph()
+        marko = graph.add_vertex("person", name="Marko", age=29)
+        graph.add_column_store("person")
+        graph.add_column_store("person")
+        self.assertIsInstance(marko.properties, ColumnProperties)
+        self.assertEqual(marko.properties, {"name": "Marko", "age": 29})
+        self.assertEqual(graph.get_vertices("person", age__gt=20).all(),
+                         [marko])
+
+    def test_removed_entity_keeps_properties(self):
+        properties = self.marko_knows_josh.properties.copy()
+        self.graph.remove_edge(self.marko_knows_josh)
+        self.assertIsInstance(self.marko_knows_josh.properties, dict)
+        self.assertEqual(self.marko_knows_josh.properties, properties)
+
+        sue = self.graph.add_vertex("person", name="sue")
+        self.graph.add_edge(self.marko, "knows", sue, weight=0.1)
+        self.assertEqual(self.marko_knows_josh.properties, properties)
+
+    def test_lazy_persistent_properties_are_pinned(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("person", name="Marko")
+        graph.close()
+
+        graph = PersistentGraph(
+            path, lazy_properties=True, property_cache_size=1
+        )
+        graph.add_column_store("person")
+        vertex = graph.get_vertex(0)
+        self.assertEqual(vertex.is_loaded(), True)
+        self.assertEqual(graph.get_vertices(name="Marko").all(), [vertex])
+        graph.set_property(vertex, age=29)
+        graph.close()
+
+        graph = PersistentGraph(path)
+        self.assertEqual(
+            graph.get_vertex(0).properties,
+            {"name": "Marko", "age": 29},
+        )
+        graph.close()
+
+
 class TestGraphGetOrCreateVertices(base.TestBase):
     def test_add_new(self):
         vertices = self.graph.get_vertices().all()
@@ -922,6 +1030,42 @@ def create_graph_mock_path():
     return path
 
 
+class TestIDGenerator(unittest.TestCase):
+    def test_ids(self):
+        generator = IDGenerator()
+        generator.release_vertex_id(generator.get_vertex_id())
+        generator.release_edge_id(generator.get_edge_id())
+        self.assertEqual(generator.get_vertex_id(), 1)
+        self.assertEqual(generator.get_edge_id(), 1)
+
+    def test_reuse_ids(self):
+        generator = IDGenerator(reuse_ids=True)
+        for _ in range(4):
+            generator.get_vertex_id()
+            generator.get_edge_id()
+        generator.release_vertex_id(2)
+        generator.release_vertex_id(0)
+        generator.release_edge_id(3)
+
+        self.assertEqual(generator.get_vertex_id(), 0)
+        self.assertEqual(generator.get_vertex_id(), 2)
+        self.assertEqual(generator.get_vertex_id(), 4)
+        self.assertEqual(generator.get_edge_id(), 3)
+        self.assertEqual(generator.get_edge_id(), 4)
+
+    def test_get_state(self):
+        generator = IDGenerator(reuse_ids=True)
+        for _ in range(3):
+            generator.get_vertex_id()
+        generator.get_edge_id()
+        generator.release_vertex_id(2)
+        generator.release_vertex_id(0)
+        self.assertEqual(
+            generator.get_state(),
+            {"vid": 3, "eid": 1, "free_vids": [0, 2], "free_eids": []},
+        )
+
+
 class TestPersistentGraph(unittest.TestCase):
     def setUp(self):
         path = tempfile.mkdtemp()
@@ -961,7 +1105,7 @@ class TestPersistentGraph(unittest.TestCase):
         # check the top level directories have been created.
         self.assertEqual(
             sorted(os.listdir(graph.path)),
-            sorted([".lock", "vertices", "edges"]),
+            sorted([".active", ".lock", "vertices", "edges", "state.json"]),
         )
 
         # check the vertices directory and other files have been created.
@@ -1260,10 +1404,967 @@ class TestPersistentGraph(unittest.TestCase):
         spot = graph.add_vertex("dog", name="Spot")
         self.assertEqual(spot.ident, 2)
 
+    def test_import_with_lazy_properties(self):
+        path = create_graph_mock_path()
+        graph = PersistentGraph(path, lazy_properties=True)
+        marko_josh = graph.get_edge(0)
+
+        # person has a constraint, so it is loaded eagerly
+        self.assertEqual(graph.get_vertex(0).is_loaded(), True)
+        self.assertEqual(marko_josh.is_loaded(), False)
+        self.assertEqual(marko_josh.head, graph.get_vertex(0))
+        self.assertEqual(marko_josh.tail, graph.get_vertex(1))
+
+        self.assertDictEqual(marko_josh.properties, {"since": "school"})
+        self.assertEqual(marko_josh.is_loaded(), True)
+
+    def test_options(self):
+        path = create_graph_mock_path()
+        options = PersistentOptions(lazy_properties=True)
+        graph = PersistentGraph(path, options=options)
+        self.assertIs(graph.options, options)
+        self.assertEqual(graph.get_edge(0).is_loaded(), False)
+        self.assertEqual(options.read_only, False)
+        graph.close()
+
+    def test_unknown_option(self):
+        path = tempfile.mkdtemp()
+        self.assertRaises(TypeError, PersistentOptions, lazy=True)
+        self.assertRaises(TypeError, PersistentGraph, path, lazy=True)
+        self.assertRaises(
+            TypeError,
+            PersistentGraph,
+            path,
+            options=PersistentOptions(),
+            lazy_properties=True,
+        )
+
+    def test_import_interns_labels_and_keys(self):
+        path = create_graph_mock_path()
+        graph = PersistentGraph(path, lazy_properties=True)
+        marko_josh = graph.get_edge(0)
+        self.assertIs(graph.get_vertex(0).label, graph.get_vertex(1).label)
+        self.assertIs(
+            list(marko_josh.properties)[0],
+            graph._symbols.intern(u"since"),
+        )
+
+    def test_lazy_properties_filter(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        spot = graph.add_vertex("dog", name="Spot")
+        graph.add_vertex("dog", name="Rex")
+        graph.close()
+
+        graph = PersistentGraph(path, lazy_properties=True)
+        self.assertEqual(
+            [each.is_loaded() for each in graph.vertices],
+            [False, False],
+        )
+        self.assertEqual(
+            graph.get_vertices("dog", name="Spot").all(),
+            [graph.get_vertex(spot.ident)],
+        )
+        self.assertEqual(len(graph.get_vertices("dog", age=3)), 0)
+        self.assertEqual(len(graph.get_vertices("dog")), 2)
+
+    def test_lazy_properties_cache_size(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("dog", name="Spot")
+        graph.add_vertex("dog", name="Rex")
+        graph.close()
+
+        graph = PersistentGraph(
+            path, lazy_properties=True, property_cache_size=1
+        )
+        spot = graph.get_vertex(0)
+        rex = graph.get_vertex(1)
+
+        self.assertEqual(spot.properties, {"name": "Spot"})
+        self.assertEqual(rex.properties, {"name": "Rex"})
+        self.assertEqual(spot.is_loaded(), False)
+        self.assertEqual(rex.is_loaded(), True)
+        self.assertEqual(len(graph._property_cache), 1)
+
+    def test_lazy_properties_set_property_survives_eviction(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("dog", name="Spot")
+        graph.add_vertex("dog", name="Rex")
+        graph.close()
+
+        graph = PersistentGraph(
+            path, lazy_properties=True, property_cache_size=1
+        )
+        spot = graph.get_vertex(0)
+        graph.set_property(spot, age=3)
+        graph.get_vertex(1).properties  # pylint: disable=pointless-statement
+
+        self.assertEqual(spot.is_loaded(), False)
+        self.assertEqual(spot.properties, {"name": "Spot", "age": 3})
+
+    def test_lazy_remove_loaded_vertex(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("dog", name="Spot")
+        graph.add_vertex("dog", name="Rex")
+        graph.close()
+
+        graph = PersistentGraph(path, lazy_properties=True)
+        spot = graph.get_vertex(0)
+        self.assertEqual(spot.properties, {"name": "Spot"})
+        graph.remove_vertex(spot)
+
+        self.assertEqual(graph.get_vertices("dog", name="Spot").all(), [])
+        self.assertEqual(
+            graph.get_vertices("dog", name="Rex").all(),
+            [graph.get_vertex(1)],
+        )
+
+    def test_lazy_properties_indexed_once_read(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("dog", name="Spot")
+        graph.add_vertex("dog", name="Rex")
+        graph.close()
+
+        graph = PersistentGraph(path, lazy_properties=True)
+        self.assertEqual(graph.vertices.count("dog", "age"), 2)
+        for vertex in graph.vertices:
+            vertex.properties  # pylint: disable=pointless-statement
+
+        # the read vertices are no longer candidates of every filter.
+        self.assertEqual(graph.vertices.count("dog", "age"), 0)
+        self.assertEqual(graph.vertices.count("dog", "name"), 2)
+
+    def test_lazy_properties_filter_reads_label(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("dog", name="Spot")
+        graph.add_vertex("dog", name="Rex")
+        tom = graph.add_vertex("cat", name="Tom")
+        graph.close()
+
+        graph = PersistentGraph(
+            path, lazy_properties=True, property_cache_size=1
+        )
+        self.assertEqual(len(graph.get_vertices("dog", age=3)), 0)
+
+        # every dog was read to be filtered, and stays indexed once evicted.
+        self.assertEqual(graph.vertices.count("dog", "age"), 0)
+        self.assertEqual(graph.vertices.count("dog", "name"), 2)
+        self.assertEqual(len(graph._property_cache), 1)
+        self.assertEqual(graph.get_vertex(tom.ident).is_loaded(), False)
+        self.assertEqual(graph.vertices.count("cat", "age"), 1)
+
+    def test_lazy_properties_remove_vertex(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("dog", name="Spot")
+        graph.close()
+
+        graph = PersistentGraph(path, lazy_properties=True)
+        spot = graph.get_vertex(0)
+        graph.remove_vertex(spot)
+
+        self.assertEqual(len(graph.get_vertices("dog")), 0)
+        self.assertEqual(spot.properties, {"name": "Spot"})
+        self.assertEqual(len(graph._property_cache), 0)
+
+    def test_write_behind(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path, write_behind=True)
+        marko = graph.add_vertex("person", name="Marko")
+        josh = graph.add_vertex("person", name="Josh")
+        edge = graph.add_edge(marko, "knows", josh)
+        for count in range(10):
+            graph.set_property(marko, count=count)
+        graph.flush()
+
+        self.assertDictEqual(
+            json.load(open(os.path.join(marko.path, "properties.json"))),
+            {"name": "Marko", "count": 9},
+        )
+        self.assertEqual(
+            os.path.islink(os.path.join(marko.path, "out-edges", "0")),
+            True,
+        )
+
+        graph.remove_edge(edge)
+        graph.close()
+        self.assertEqual(os.path.exists(edge.path), False)
+
+        graph = PersistentGraph(path)
+        self.assertEqual(len(graph.vertices), 2)
+        self.assertEqual(len(graph.edges), 0)
+        self.assertEqual(graph.get_vertex(0).properties["count"], 9)
+
+    def test_write_behind_lazy_properties_pending_write(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("dog", name="Spot")
+        graph.add_vertex("dog", name="Rex")
+        graph.close()
+
+        graph = PersistentGraph(
+            path,
+            lazy_properties=True,
+            property_cache_size=1,
+            write_behind=True,
+        )
+        spot = graph.get_vertex(0)
+        gate = threading.Event()
+        apply_record = graph._writer.apply
+
+        def gated_apply(record):
+            gate.wait()
+            apply_record(record)
+
+        graph._writer.apply = gated_apply
+        graph.set_property(spot, age=3)
+        graph.get_vertex(1).properties  # pylint: disable=pointless-statement
+
+        # the evicted properties are read back from the queued write
+        # because it has not been written yet.
+        self.assertEqual(spot.is_loaded(), False)
+        self.assertEqual(spot.properties, {"name": "Spot", "age": 3})
+        gate.set()
+        graph.close()
+
+    def test_group_commit(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path, group_commit=True, commit_interval=60)
+        marko = graph.add_vertex("person", name="Marko")
+        josh = graph.add_vertex("person", name="Josh")
+        graph.add_edge(marko, "knows", josh)
+        graph.set_property(josh, age=32)
+
+        # flush commits the group without waiting for the commit interval.
+        graph.flush()
+        self.assertDictEqual(
+            json.load(open(os.path.join(josh.path, "properties.json"))),
+            {"name": "Josh", "age": 32},
+        )
+        self.assertEqual(
+            os.path.islink(os.path.join(josh.path, "in-edges", "0")),
+            True,
+        )
+
+        graph.close()
+        self.assertEqual(os.path.getsize(graph.store.journal_path), 0)
+
+        graph = PersistentGraph(path)
+        self.assertEqual(len(graph.vertices), 2)
+        self.assertEqual(len(graph.edges), 1)
+        self.assertEqual(graph.get_vertex(1).properties["age"], 32)
+
+    def test_group_commit_recovers_journal(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("person", name="Marko")
+        graph.close()
+
+        # records committed to the journal by a graph which died before
+        # applying them, with a torn write at the end.
+        records = [
+            {
+                "op": "add_vertex",
+                "id": 1,
+                "label": "person",
+                "properties": {"name": "Josh"},
+            },
+            {
+                "op": "add_edge",
+                "id": 0,
+                "label": "knows",
+                "head_id": 0,
+                "head_label": "person",
+                "tail_id": 1,
+                "tail_label": "person",
+                "properties": {},
+            },
+            {
+                "op": "set_property",
+                "entity": "vertex",
+                "id": 0,
+                "label": "person",
+                "properties": {"name": "Marko", "age": 29},
+            },
+        ]
+        with open(os.path.join(path, "journal.log"), "w") as journal_fh:
+            for record in records:
+                journal_fh.write(json.dumps(record) + "\n")
+            # replaying a record which was already applied is harmless.
+            journal_fh.write(json.dumps(records[0]) + "\n")
+            journal_fh.write('{"op": "remove_vertex", "id"')
+
+        graph = PersistentGraph(path, group_commit=True)
+        self.assertEqual(len(graph.vertices), 2)
+        self.assertEqual(len(graph.edges), 1)
+        self.assertEqual(graph.get_vertex(0).properties["age"], 29)
+        self.assertEqual(os.path.getsize(graph.store.journal_path), 0)
+        graph.close()
+
+    def test_group_commit_quarantines_journal(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("person", name="Marko")
+        graph.close()
+
+        # the vertex of the first record does not exist, so it can never
+        # be applied.
+        records = [
+            {
+                "op": "set_property",
+                "entity": "vertex",
+                "id": 7,
+                "label": "person",
+                "properties": {"name": "Nobody"},
+            },
+            {
+                "op": "set_property",
+                "entity": "vertex",
+                "id": 0,
+                "label": "person",
+                "properties": {"name": "Marko", "age": 29},
+            },
+        ]
+        with open(os.path.join(path, "journal.log"), "w") as journal_fh:
+            for record in records:
+                journal_fh.write(json.dumps(record) + "\n")
+
+        graph = PersistentGraph(path, group_commit=True)
+        self.assertEqual(graph.get_vertex(0).properties["age"], 29)
+        self.assertEqual(os.path.getsize(graph.store.journal_path), 0)
+        graph.close()
+
+        self.assertEqual(
+            list(read_records(os.path.join(path, "journal.quarantine"))),
+            records[:1],
+        )
+        graph = PersistentGraph(path)
+        self.assertEqual(len(graph.vertices), 1)
+        graph.close()
+
+    def test_group_commit_stops_on_failure(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path, group_commit=True)
+        marko = graph.add_vertex("person", name="Marko")
+        graph.flush()
+
+        def broken(records):
+            raise IOError("journal on fire")
+
+        graph._writer.journal.write = broken
+        graph.add_vertex("person", name="Josh")
+        self.assertRaises(interfaces.DatabaseException, graph.flush)
+
+        # later changes are refused rather than persisted without the
+        # change which was lost.
+        self.assertRaises(
+            interfaces.DatabaseException,
+            graph.add_edge,
+            marko, "knows", marko,
+        )
+        self.assertRaises(interfaces.DatabaseException, graph.flush)
+        self.assertRaises(interfaces.DatabaseException, graph.close)
+
+        graph = PersistentGraph(path)
+        self.assertEqual(len(graph.vertices), 1)
+        self.assertEqual(len(graph.edges), 0)
+        graph.close()
+
+    def test_incremental_properties(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path, incremental_properties=True)
+        marko = graph.add_vertex("person", name="Marko", bio="x" * 100)
+        for count in range(3):
+            graph.set_property(marko, count=count)
+
+        self.assertDictEqual(
+            json.load(open(os.path.join(marko.path, "properties.json"))),
+            {"name": "Marko", "bio": "x" * 100},
+        )
+        self.assertEqual(
+            open(os.path.join(marko.path, "properties.delta")).readlines(),
+            ['{"count": 0}\n', '{"count": 1}\n', '{"count": 2}\n'],
+        )
+        graph.close()
+
+        graph = PersistentGraph(path)
+        self.assertDictEqual(
+            graph.get_vertex(0).properties,
+            {"name": "Marko", "bio": "x" * 100, "count": 2},
+        )
+
+        # a full rewrite compacts the deltas first.
+        graph.set_property(graph.get_vertex(0), name="Mark")
+        self.assertEqual(
+            os.path.exists(os.path.join(marko.path, "properties.delta")),
+            False,
+        )
+        self.assertDictEqual(
+            json.load(open(os.path.join(marko.path, "properties.json"))),
+            {"name": "Mark", "bio": "x" * 100, "count": 2},
+        )
+        graph.close()
+
+    def test_incremental_properties_compaction(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(
+            path, incremental_properties=True, delta_compact_size=0
+        )
+        marko = graph.add_vertex("person", name="Marko")
+        josh = graph.add_vertex("person", name="Josh", bio="x" * 100)
+        graph.set_property(marko, age=29, alive=True)
+        graph.set_property(josh, age=32)
+
+        # the delta of marko is larger than the properties file.
+        delta_path = os.path.join(marko.path, "properties.delta")
+        self.assertEqual(os.path.exists(delta_path), False)
+        self.assertDictEqual(
+            json.load(open(os.path.join(marko.path, "properties.json"))),
+            {"name": "Marko", "age": 29, "alive": True},
+        )
+
+        self.assertEqual(graph.compact(), 1)
+        self.assertEqual(
+            os.path.exists(os.path.join(josh.path, "properties.delta")),
+            False,
+        )
+        self.assertDictEqual(
+            json.load(open(os.path.join(josh.path, "properties.json"))),
+            {"name": "Josh", "bio": "x" * 100, "age": 32},
+        )
+        graph.close()
+
+    def test_incremental_properties_torn_delta(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path, incremental_properties=True)
+        marko = graph.add_vertex("person", name="Marko")
+        with open(os.path.join(marko.path, "properties.delta"), "w") as fh:
+            fh.write('{"age": 2')
+        graph.set_property(marko, age=29)
+        graph.close()
+
+        graph = PersistentGraph(path)
+        self.assertDictEqual(
+            graph.get_vertex(0).properties,
+            {"name": "Marko", "age": 29},
+        )
+        graph.close()
+
+    def test_incremental_properties_write_behind(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("dog", name="Spot")
+        graph.add_vertex("dog", name="Rex")
+        graph.close()
+
+        graph = PersistentGraph(
+            path,
+            lazy_properties=True,
+            property_cache_size=1,
+            write_behind=True,
+            incremental_properties=True,
+        )
+        spot = graph.get_vertex(0)
+        gate = threading.Event()
+        apply_record = graph._writer.apply
+
+        def gated_apply(record):
+            gate.wait()
+            apply_record(record)
+
+        graph._writer.apply = gated_apply
+        graph.set_property(spot, age=3)
+        graph.set_property(spot, colour="brown")
+        graph.get_vertex(1).properties  # pylint: disable=pointless-statement
+
+        # the queued changes are merged and read back over the properties
+        # on disk.
+        self.assertEqual(spot.is_loaded(), False)
+        self.assertEqual(
+            spot.properties,
+            {"name": "Spot", "age": 3, "colour": "brown"},
+        )
+        gate.set()
+        graph.close()
+
+        graph = PersistentGraph(path)
+        self.assertEqual(
+            graph.get_vertex(0).properties,
+            {"name": "Spot", "age": 3, "colour": "brown"},
+        )
+        graph.close()
+
+    def test_search_for_edge_ids_skips_broken_edges(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        marko = graph.add_vertex("person", name="Marko")
+        josh = graph.add_vertex("person", name="Josh")
+        graph.add_edge(marko, "knows", josh)
+        edge = graph.add_edge(josh, "knows", marko)
+        graph.close()
+
+        # a edge half created by an older version.
+        shutil.rmtree(os.path.join(edge.path, "tail"))
+        os.makedirs(os.path.join(edge.path, "tail"))
+        self.assertEqual(
+            list(_search_for_edge_ids(graph.edges_path)),
+            [(0, 0, "knows", 1)],
+        )
+
+    def test_clean_shutdown_state(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        marko = graph.add_vertex("person", name="Marko")
+        josh = graph.add_vertex("person", name="Josh")
+        edge = graph.add_edge(marko, "knows", josh)
+        self.assertEqual(
+            json.load(open(graph.store.state_path))["clean"],
+            False,
+        )
+
+        # the ids of the removed entities are not handed out again.
+        graph.remove_edge(edge)
+        graph.remove_vertex(josh)
+        graph.close()
+        self.assertDictEqual(
+            json.load(open(graph.store.state_path)),
+            {
+                "clean": True,
+                "vid": 2,
+                "eid": 1,
+                "free_vids": [],
+                "free_eids": [],
+            },
+        )
+        self.assertEqual(
+            os.listdir(os.path.join(marko.path, "out-edges")),
+            [],
+        )
+
+        graph = PersistentGraph(path)
+        self.assertEqual(graph.add_vertex("person", name="Sue").ident, 2)
+        sue = graph.get_vertex(2)
+        self.assertEqual(graph.add_edge(sue, "knows", sue).ident, 1)
+        graph.close()
+
+    def test_reuse_ids(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path, reuse_ids=True)
+        vertices = [graph.add_vertex("person", name=i) for i in range(4)]
+        edge = graph.add_edge(vertices[0], "knows", vertices[1])
+        graph.remove_edge(edge)
+        graph.remove_vertex(vertices[2])
+        graph.remove_vertex(vertices[1])
+        graph.close()
+        self.assertEqual(
+            json.load(open(graph.store.state_path))["free_vids"],
+            [1, 2],
+        )
+
+        # the free lists are restored without scanning for gaps.
+        graph = PersistentGraph(path, reuse_ids=True)
+        self.assertEqual(graph.add_vertex("person", name="a").ident, 1)
+        self.assertEqual(graph.add_vertex("person", name="b").ident, 2)
+        self.assertEqual(graph.add_vertex("person", name="c").ident, 4)
+        marko = graph.get_vertex(0)
+        self.assertEqual(graph.add_edge(marko, "knows", marko).ident, 0)
+        graph.close()
+
+    def test_reuse_ids_after_crash(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path, reuse_ids=True)
+        for name in range(4):
+            graph.add_vertex("person", name=name)
+        graph.remove_vertex(graph.get_vertex(1))
+        graph.remove_vertex(graph.get_vertex(3))
+
+        # simulate a crash, the free ids are worked out from the gaps
+        # below the highest loaded id.
+        graph._lock.release()
+        graph = PersistentGraph(path, reuse_ids=True)
+        self.assertEqual(graph._id_tracker.free_vids, [1])
+        self.assertEqual(graph._id_tracker.vid, 3)
+        graph.close()
+
+    def test_recover_after_crash(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        marko = graph.add_vertex("person", name="Marko")
+        josh = graph.add_vertex("person", name="Josh")
+        edge = graph.add_edge(marko, "knows", josh)
+
+        # simulate a crash which left a edge half created, a temporary
+        # vertex and a missing link to a edge.
+        graph._lock.release()
+        shutil.rmtree(os.path.join(edge.path, "head"))
+        os.makedirs(os.path.join(path, "vertices", "person", ".tmp-2"))
+
+        graph = PersistentGraph(path)
+        self.assertEqual(len(graph.vertices), 2)
+        self.assertEqual(len(graph.edges), 0)
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(path, "vertices", "person"))),
+            ["0", "1"],
+        )
+        self.assertEqual(
+            os.listdir(os.path.join(marko.path, "out-edges")),
+            [],
+        )
+        graph.close()
+
+    def test_no_recovery_after_clean_shutdown(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("person", name="Marko")
+        graph.close()
+
+        temp_path = os.path.join(path, "vertices", "person", ".tmp-1")
+        os.makedirs(temp_path)
+        graph = PersistentGraph(path)
+        self.assertEqual(os.path.exists(temp_path), True)
+        self.assertEqual(len(graph.vertices), 1)
+        graph.close()
+
+    def backup_and_restore(self, graph, dest=None, **kwargs):
+        if dest is None:
+            dest = io.BytesIO()
+        count = graph.backup(dest, **kwargs)
+        dest.seek(0)
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        archive = tarfile.open(fileobj=dest)
+        archive.extractall(path)
+        archive.close()
+        return count, path
+
+    def test_backup(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex_constraint("person", "name")
+        marko = graph.add_vertex("person", name="Marko")
+        josh = graph.add_vertex("person", name="Josh")
+        lop = graph.add_vertex("software", name="lop")
+        graph.add_edge(marko, "knows", josh, weight=0.5)
+        graph.add_edge(josh, "created", lop)
+        graph.remove_vertex(graph.add_vertex("person", name="Sue"))
+
+        count, restore_path = self.backup_and_restore(graph)
+        self.assertEqual(count, 5)
+        self.assertEqual(fsck(restore_path), [])
+
+        restored = PersistentGraph(restore_path)
+        self.assertEqual(
+            restored.get_vertex_constraints(),
+            [("person", "name")],
+        )
+        self.assertEqual(
+            dict((v.ident, v.properties) for v in restored.vertices),
+            {0: {"name": "Marko"}, 1: {"name": "Josh"}, 2: {"name": "lop"}},
+        )
+        edge = restored.get_edge(0)
+        self.assertEqual(edge.head, restored.get_vertex(0))
+        self.assertEqual(edge.tail, restored.get_vertex(1))
+        self.assertEqual(edge.properties, {"weight": 0.5})
+        self.assertEqual(restored.add_vertex("person", name="Sue").ident, 4)
+
+        # the relative symlinks of the backup are followed when removing.
+        restored.remove_edge(edge)
+        self.assertEqual(
+            os.listdir(restored.get_vertex(0).path + "/out-edges"),
+            [],
+        )
+        restored.close()
+        graph.close()
+
+    def test_backup_is_point_in_time(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path, lazy_properties=True)
+        marko = graph.add_vertex("person", name="Marko")
+        josh = graph.add_vertex("person", name="Josh")
+        edge = graph.add_edge(marko, "knows", josh)
+
+        class ChangingFile(io.BytesIO):
+            changed = False
+
+            def write(self, data):
+                # change the graph while the backup is being written.
+                if self.changed is False:
+                    self.changed = True
+                    graph.set_property(marko, name="Mark")
+                    graph.remove_edge(edge)
+                    graph.add_vertex("person", name="Sue")
+                return io.BytesIO.write(self, data)
+
+        dest = ChangingFile()
+        count, restore_path = self.backup_and_restore(graph, dest)
+        self.assertEqual(dest.changed, True)
+        self.assertEqual(count, 3)
+
+        restored = PersistentGraph(restore_path)
+        self.assertEqual(len(restored.vertices), 2)
+        self.assertEqual(len(restored.edges), 1)
+        self.assertEqual(restored.get_vertex(0).properties["name"], "Marko")
+        self.assertEqual(graph.get_vertex(0).properties["name"], "Mark")
+        restored.close()
+        graph.close()
+
+    def test_backup_to_file_without_compression(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex("person", name="Marko")
+        filename = os.path.join(tempfile.mkdtemp(), "backup.tar")
+        self.assertEqual(graph.backup(filename, compress=False), 1)
+        graph.close()
+
+        archive = tarfile.open(filename, "r:")
+        self.assertIn("vertices/person/0/properties.json", archive.getnames())
+        archive.close()
+
+    def create_read_only_path(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        graph.add_vertex_constraint("person", "name")
+        marko = graph.add_vertex("person", name="Marko")
+        josh = graph.add_vertex("person", name="Josh")
+        graph.add_edge(marko, "knows", josh, since=2010)
+        graph.close()
+        return path
+
+    def test_read_only(self):
+        path = self.create_read_only_path()
+        with open(os.path.join(path, "state.json")) as state_fh:
+            state = state_fh.read()
+
+        readers = [
+            PersistentGraph(path, read_only=True),
+            PersistentGraph(path, read_only=True, lazy_properties=True),
+        ]
+        for graph in readers:
+            self.assertEqual(len(graph.vertices), 2)
+            self.assertEqual(
+                graph.get_edge(0).properties,
+                {"since": 2010},
+            )
+            self.assertEqual(
+                graph.get_vertex_constraints(),
+                [("person", "name")],
+            )
+        for graph in readers:
+            graph.close()
+
+        # readers never change anything on disk.
+        with open(os.path.join(path, "state.json")) as state_fh:
+            self.assertEqual(state_fh.read(), state)
+        self.assertEqual(
+            os.path.isfile(os.path.join(path, "journal.log")),
+            False,
+        )
+
+    def test_read_only_changes_raise(self):
+        graph = PersistentGraph(self.create_read_only_path(), read_only=True)
+        vertex = graph.get_vertex(0)
+        for func, args in [
+                (graph.add_vertex, ("person",)),
+                (graph.add_edge, (vertex, "knows", vertex)),
+                (graph.add_vertex_constraint, ("person", "age")),
+                (graph.set_property, (vertex,)),
+                (graph.remove_edge, (graph.get_edge(0),)),
+                (graph.remove_vertex, (vertex,)),
+                (graph.compact, ()),
+        ]:
+            self.assertRaises(interfaces.DatabaseReadOnly, func, *args)
+        self.assertRaises(
+            interfaces.DatabaseReadOnly,
+            vertex.set_property,
+            name="Mark",
+        )
+        self.assertEqual(vertex.properties, {"name": "Marko"})
+        graph.close()
+
+    def test_read_only_with_writer(self):
+        path = self.create_read_only_path()
+        reader = PersistentGraph(path, read_only=True)
+
+        # readers never keep the writer from opening the path.
+        writer = PersistentGraph(path)
+        josh = writer.get_vertex(1)
+        peter = writer.add_vertex("person", name="Peter")
+        writer.add_edge(josh, "knows", peter)
+        writer.set_property(josh, age=32)
+
+        other = PersistentGraph(path, read_only=True, lazy_properties=True)
+        self.assertEqual(len(other.vertices), 3)
+        self.assertEqual(other.get_vertex(1).properties["age"], 32)
+        other.close()
+
+        self.assertEqual(len(reader.vertices), 2)
+        reader.refresh()
+        self.assertEqual(len(reader.vertices), 3)
+        self.assertEqual(len(reader.edges), 2)
+        self.assertEqual(
+            reader.get_vertices("person", name="Peter").all(),
+            [reader.get_vertex(2)],
+        )
+        self.assertRaises(interfaces.DatabaseException, writer.refresh)
+        self.assertRaises(interfaces.DatabasePathLocked, PersistentGraph, path)
+
+        writer.close()
+        reader.close()
+
+    def test_read_only_skips_new_edges(self):
+        path = self.create_read_only_path()
+        writer = PersistentGraph(path)
+        peter = writer.add_vertex("person", name="Peter")
+        writer.add_edge(writer.get_vertex(0), "knows", peter)
+
+        # as if the vertex was added after the reader read the vertices.
+        peter_path = peter.path
+        shutil.move(peter_path, peter_path + ".moved")
+        reader = PersistentGraph(path, read_only=True)
+        self.assertEqual(len(reader.vertices), 2)
+        self.assertEqual(len(reader.edges), 1)
+        reader.close()
+
+        shutil.move(peter_path + ".moved", peter_path)
+        writer.close()
+
+    def test_refresh_keeps_column_stores(self):
+        path = self.create_read_only_path()
+        reader = PersistentGraph(path, read_only=True, lazy_properties=True)
+        reader.add_column_store("person")
+        reader.refresh()
+        self.assertIsInstance(
+            reader.get_vertex(0).properties,
+            ColumnProperties,
+        )
+        self.assertEqual(reader.get_vertex(0).properties["name"], "Marko")
+        reader.close()
+
+    def test_read_only_not_closed_cleanly(self):
+        path = self.create_read_only_path()
+        graph = PersistentGraph(path)
+        graph._lock.release()
+
+        self.assertRaises(
+            interfaces.DatabaseException,
+            PersistentGraph,
+            path,
+            read_only=True,
+        )
+
+        # opening it for writing recovers it.
+        PersistentGraph(path).close()
+        PersistentGraph(path, read_only=True).close()
+
+    def test_lock_timeout_waits_for_previous_writer(self):
+        path = tempfile.mkdtemp()
+        previous = PersistentGraph(path)
+        previous.add_vertex("person", name="Marko")
+        timer = threading.Timer(0.05, previous.close)
+        timer.start()
+
+        graph = PersistentGraph(path, lock_timeout=5)
+        timer.join()
+        self.assertEqual(len(graph.vertices), 1)
+        graph.close()
+
+    def test_compression(self):
+        for codec_name in compression.available_codecs():
+            path = tempfile.mkdtemp()
+            graph = PersistentGraph(path, compression=codec_name)
+            marko = graph.add_vertex("person", name="Marko")
+            josh = graph.add_vertex("person", name="Josh")
+            edge = graph.add_edge(marko, "knows", josh, since=2010)
+            graph.set_property(marko, age=29)
+            graph.close()
+
+            with open(os.path.join(marko.path, "properties.json"), "rb") as fh:
+                self.assertEqual(fh.read(3), compression.MAGIC)
+
+            # compressed files are read whatever the compression setting.
+            graph = PersistentGraph(path)
+            self.assertEqual(
+                graph.get_vertex(0).properties,
+                {"name": "Marko", "age": 29},
+            )
+            self.assertEqual(graph.get_edge(0).properties, {"since": 2010})
+            graph.set_property(graph.get_vertex(1), age=32)
+            graph.close()
+            self.assertEqual(fsck(path), [])
+
+            with open(os.path.join(josh.path, "properties.json"), "rb") as fh:
+                self.assertEqual(fh.read(1), b"{")
+            self.assertEqual(os.path.isdir(edge.path), True)
+
+    @unittest.skipIf(not compression.ZDICT_SUPPORTED, "needs Python 3.3")
+    def test_compression_shared_dictionary(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(
+            path, compression="zlib", incremental_properties=True
+        )
+        graph.store.codec.sample_size = 4
+        for each in range(6):
+            graph.add_vertex("person", name="Person {0}".format(each))
+        self.assertEqual(
+            json.load(open(os.path.join(path, "dictionaries", "labels.json"))),
+            {"vertices/person": graph.store.codec._labels["vertices/person"]},
+        )
+
+        vertex = graph.get_vertex(5)
+        graph.set_property(vertex, age=5)
+        self.assertEqual(graph.compact(), 1)
+
+        dest = io.BytesIO()
+        graph.backup(dest)
+        graph.close()
+
+        dest.seek(0)
+        restore_path = tempfile.mkdtemp()
+        archive = tarfile.open(fileobj=dest, mode="r:gz")
+        archive.extractall(restore_path)
+        archive.close()
+
+        for each in [path, restore_path]:
+            self.assertEqual(fsck(each), [])
+            graph = PersistentGraph(each, lazy_properties=True)
+            self.assertEqual(
+                graph.get_vertex(5).properties,
+                {"name": "Person 5", "age": 5},
+            )
+            graph.close()
+
+        shutil.rmtree(os.path.join(path, "dictionaries"))
+        problems = fsck(path, repair=True)
+        self.assertEqual(len(problems), 2)
+        self.assertEqual([each.repaired for each in problems], [False] * 2)
+
+    def test_intern_values(self):
+        path = tempfile.mkdtemp()
+        graph = PersistentGraph(path)
+        for name in ["Marko", "Josh"]:
+            graph.add_vertex("person", name=name, city="Sydney")
+        graph.close()
+
+        graph = PersistentGraph(path, intern_values=True)
+        first, second = graph.get_vertex(0), graph.get_vertex(1)
+        self.assertIs(first.properties["city"], second.properties["city"])
+        self.assertEqual(first.properties["name"], "Marko")
+        graph.close()
+
+    def test_flush_without_write_behind(self):
+        self.graph.add_vertex("person", name="Marko")
+        self.graph.flush()
+
     def test_create_persistent_graph_with_no_path(self):
         self.assertEqual(
             sorted(os.listdir(self.graph.path)),
-            sorted([".lock", "edges", "vertices"]),
+            sorted([".active", ".lock", "edges", "vertices", "state.json"]),
         )
 
         # check for the constraints files
@@ -1501,3 +2602,139 @@ class TestPersistentGraph(unittest.TestCase):
             self.graph._lock.locked,
             False
         )
+
+
+class TestSQLiteGraphBehaviour(TestGraph):
+    def create_graph(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        graph = SQLiteGraph(os.path.join(self.tmpdir, "graph.db"))
+        self.addCleanup(graph.close)
+        return graph
+
+
+class TestSQLiteGraph(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, "graph.db")
+        self.graph = SQLiteGraph(self.filename)
+
+    def tearDown(self):
+        if self.graph._lock.locked is True:
+            self.graph.close()
+
+    def reopen(self):
+        self.graph.close()
+        self.graph = SQLiteGraph(self.filename)
+        return self.graph
+
+    def test_reopen(self):
+        self.graph.add_vertex_constraint("person", "name")
+        marko = self.graph.add_vertex("person", name="Marko", age=29)
+        josh = self.graph.add_vertex("person", name="Josh", tags=["a", 1])
+        lop = self.graph.add_vertex("software", name="lop")
+        self.graph.add_edge(marko, "knows", josh, weight=0.5)
+        self.graph.add_edge(josh, "created", lop)
+
+        graph = self.reopen()
+        self.assertEqual(graph.get_vertex_constraints(), [("person", "name")])
+        self.assertEqual(len(graph.vertices), 3)
+        self.assertEqual(len(graph.edges), 2)
+        self.assertEqual(
+            graph.get_vertex(1).properties,
+            {"name": "Josh", "tags": ["a", 1]},
+        )
+
+        edge = graph.get_edge(0)
+        self.assertEqual(edge.head, graph.get_vertex(0))
+        self.assertEqual(edge.tail, graph.get_vertex(1))
+        self.assertEqual(edge.properties, {"weight": 0.5})
+        self.assertEqual(
+            graph.get_vertices("person", name="Marko").all(),
+            [graph.get_vertex(0)],
+        )
+
+        # the identity numbers carry on from the loaded ones.
+        self.assertEqual(graph.add_vertex("person", name="Sue").ident, 3)
+        self.assertEqual(graph.add_edge(edge.tail, "knows", edge.head).ident, 2)
+
+    def test_set_property(self):
+        marko = self.graph.add_vertex("person", name="Marko")
+        josh = self.graph.add_vertex("person", name="Josh")
+        edge = self.graph.add_edge(marko, "knows", josh)
+        marko.set_property(age=29)
+        self.graph.set_property(edge, since=2010)
+
+        graph = self.reopen()
+        self.assertEqual(
+            graph.get_vertex(0).properties,
+            {"name": "Marko", "age": 29},
+        )
+        self.assertEqual(graph.get_edge(0).properties, {"since": 2010})
+
+    def test_remove(self):
+        marko = self.graph.add_vertex("person", name="Marko")
+        josh = self.graph.add_vertex("person", name="Josh")
+        edge = self.graph.add_edge(marko, "knows", josh)
+        self.graph.remove_edge(edge)
+        self.graph.remove_vertex(josh)
+
+        graph = self.reopen()
+        self.assertEqual(len(graph.vertices), 1)
+        self.assertEqual(len(graph.edges), 0)
+        self.assertEqual(
+            graph._connection.execute(
+                "SELECT count(*) FROM vertex_properties"
+            ).fetchone()[0],
+            1,
+        )
+
+    def test_batched_transactions(self):
+        # each vertex is a row in the vertices and the properties tables.
+        self.graph.commit_size = 4
+        self.graph.add_vertex("person", name="Marko")
+        self.graph.add_vertex("person", name="Josh")
+        self.graph.add_vertex("person", name="Sue")
+
+        other = sqlite3.connect(self.filename)
+        count = "SELECT count(*) FROM vertices"
+
+        # the first transaction was committed after four changes.
+        self.assertEqual(other.execute(count).fetchone()[0], 2)
+
+        self.graph.commit()
+        self.assertEqual(other.execute(count).fetchone()[0], 3)
+        other.close()
+
+    def test_uncommitted_changes_are_rolled_back(self):
+        self.graph.add_vertex("person", name="Marko")
+        self.graph.commit()
+        self.graph.add_vertex("person", name="Josh")
+
+        # simulate the process dying before the transaction is committed.
+        self.graph._connection.close()
+        self.graph._lock.release()
+
+        graph = SQLiteGraph(self.filename)
+        self.assertEqual(len(graph.vertices), 1)
+        self.graph = graph
+
+    def test_wal_journal_mode(self):
+        self.assertEqual(
+            self.graph._connection.execute(
+                "PRAGMA journal_mode"
+            ).fetchone()[0],
+            "wal",
+        )
+
+    def test_locked(self):
+        self.assertRaises(
+            interfaces.DatabasePathLocked,
+            SQLiteGraph,
+            self.filename,
+        )
+
+    def test_close(self):
+        self.graph.close()
+        self.assertEqual(self.graph._lock.locked, False)
@@ -5,7 +5,7 @@
 # pylint: disable=no-member
 
 import unittest
-from ruruki.graphs import IDGenerator
+from ruruki.graphs import Graph, IDGenerator
 from ruruki.entities import Vertex, EntitySet, Edge
 from ruruki.test_utils import base
 
@@ -59,6 +59,15 @@ class TestEntitySet(base.TestBase):
             ),
         )
 
+    def test_count(self):
+        self.container.add(self.lop)
+        self.container.update_index(self.marko, surname="Foo")
+        self.assertEqual(self.container.count(), 4)
+        self.assertEqual(self.container.count("person"), 3)
+        self.assertEqual(self.container.count("person", "surname"), 1)
+        self.assertEqual(self.container.count(key="name"), 4)
+        self.assertEqual(self.container.count("dog"), 0)
+
     def test_update_index(self):
         self.container.update_index(self.marko, surname="Foo")
         self.assertEqual(
@@ -204,6 +213,16 @@ class TestFiltering(FilteringBase):
             [self.marko],
         )
 
+    def test_iter_filter(self):
+        entities = self.container.iter_filter("Father", age__gt=25)
+        self.assertNotIsInstance(entities, EntitySet)
+        self.assertEqual(list(entities), [self.marko])
+        self.assertEqual(
+            sorted(self.container.iter_filter(surname="Jones")),
+            sorted([self.marko, self.john]),
+        )
+        self.assertEqual(list(self.container.iter_filter("Dog")), [])
+
     def test_filter_for_only_labels(self):
         self.assertEqual(
             self.container.filter("Father").sorted(),
@@ -749,3 +768,50 @@ class TestEqualFiltering(FilteringBase):
             self.container.filter(name__ieq="marko").sorted(),
             sorted([self.marko]),
         )
+
+
+class TestColumnFiltering(unittest.TestCase):
+    def setUp(self):
+        self.graph = Graph()
+        self.columns = Graph()
+        for graph in [self.graph, self.columns]:
+            for each in range(20):
+                graph.add_vertex(
+                    "person",
+                    name="Person {0}".format(each),
+                    age=each if each % 3 else None,
+                    even=each % 2 == 0,
+                )
+            graph.add_vertex("city", name="Person 1")
+        self.columns.add_column_store("person")
+
+    def assertSameFilter(self, label, **kwargs):  # pylint: disable=invalid-name
+        self.assertEqual(
+            sorted(x.ident for x in self.columns.get_vertices(label, **kwargs)),
+            sorted(x.ident for x in self.graph.get_vertices(label, **kwargs)),
+        )
+
+    def test_filter(self):
+        for kwargs in [
+                {"name": "Person 1"},
+                {"name__startswith": "Person 1"},
+                {"name__icontains": "SON 1"},
+                {"age__gt": 10},
+                {"age__le": 10, "even": True},
+                {"age__ne": 4},
+                {"age": 5, "name": "Person 4"},
+                {"age__ge": 9.5},
+                {"even": 1},
+                {"even__ne": False},
+                {"unknown": 1},
+        ]:
+            self.assertSameFilter("person", **kwargs)
+            self.assertSameFilter(None, **kwargs)
+
+    def test_filter_after_changes(self):
+        for graph in [self.graph, self.columns]:
+            graph.set_property(graph.get_vertex(4), age=100)
+            graph.remove_vertex(graph.get_vertex(5))
+            graph.add_vertex("person", name="Sue", age=101)
+        self.assertSameFilter("person", age__gt=50)
+        self.assertSameFilter("person", name="Sue")
@@ -0,0 +1,167 @@
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from ruruki import compression
+from ruruki import fsck as fsck_module
+from ruruki.fsck import fsck, main
+from ruruki.graphs import PersistentGraph
+from ruruki.locks import DirectoryLock
+
+
+class TestFsck(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        graph = PersistentGraph(self.path)
+        self.marko = graph.add_vertex("person", name="Marko")
+        self.josh = graph.add_vertex("person", name="Josh")
+        self.edge = graph.add_edge(self.marko, "knows", self.josh)
+        graph.close()
+
+    def descriptions(self, problems):
+        return [
+            (os.path.relpath(each.path, self.path), each.description)
+            for each in problems
+        ]
+
+    def test_clean(self):
+        self.assertEqual(fsck(self.path), [])
+
+    def test_edge_without_head(self):
+        os.remove(os.path.join(self.edge.path, "head", "0"))
+        self.assertEqual(
+            self.descriptions(fsck(self.path)),
+            [
+                (
+                    os.path.join("edges", "knows", "0"),
+                    "edge without a valid head or tail",
+                ),
+            ],
+        )
+
+        problems = fsck(self.path, repair=True)
+        self.assertEqual([each.repaired for each in problems], [True] * 3)
+        self.assertEqual(os.path.exists(self.edge.path), False)
+        self.assertEqual(
+            os.listdir(os.path.join(self.marko.path, "out-edges")),
+            [],
+        )
+        self.assertEqual(
+            os.listdir(os.path.join(self.josh.path, "in-edges")),
+            [],
+        )
+        self.assertEqual(fsck(self.path), [])
+
+    def test_missing_link_to_edge(self):
+        link = os.path.join(self.josh.path, "in-edges", "0")
+        os.remove(link)
+        self.assertEqual(
+            self.descriptions(fsck(self.path, repair=True)),
+            [
+                (
+                    os.path.join("vertices", "person", "1", "in-edges", "0"),
+                    "missing link to edge",
+                ),
+            ],
+        )
+        self.assertEqual(os.readlink(link), self.edge.path)
+        self.assertEqual(fsck(self.path), [])
+
+    def test_left_over_temporary_files(self):
+        temp_path = os.path.join(self.path, "vertices", "person", ".tmp-2")
+        os.makedirs(temp_path)
+        open(
+            os.path.join(self.marko.path, "properties.json.tmp"), "w"
+        ).close()
+
+        problems = fsck(self.path, repair=True)
+        self.assertEqual(
+            self.descriptions(problems),
+            [
+                (
+                    os.path.join("vertices", "person", ".tmp-2"),
+                    "left over temporary entity",
+                ),
+                (
+                    os.path.join(
+                        "vertices", "person", "0", "properties.json.tmp"
+                    ),
+                    "left over temporary file",
+                ),
+            ],
+        )
+        self.assertEqual(os.path.exists(temp_path), False)
+        self.assertEqual(fsck(self.path), [])
+
+    def test_unreadable_properties(self):
+        with open(os.path.join(self.marko.path, "properties.json"), "w") as fh:
+            fh.write('{"name": ')
+
+        problems = fsck(self.path, repair=True)
+        self.assertEqual(len(problems), 1)
+        self.assertEqual(problems[0].repaired, True)
+        self.assertEqual(
+            json.load(open(os.path.join(self.marko.path, "properties.json"))),
+            {},
+        )
+
+    def test_corrupt_compressed_properties_kept(self):
+        prop_path = os.path.join(self.marko.path, "properties.json")
+        data = compression.HEADER.pack(compression.MAGIC, b"z", 0) + b"junk"
+        with open(prop_path, "wb") as prop_fh:
+            prop_fh.write(data)
+
+        problems = fsck(self.path, repair=True)
+        self.assertEqual(len(problems), 1)
+        self.assertEqual(problems[0].repaired, False)
+        with open(prop_path, "rb") as prop_fh:
+            self.assertEqual(prop_fh.read(), data)
+
+    def test_unreadable_constraints(self):
+        constraints_path = os.path.join(
+            self.path, "vertices", "constraints.json"
+        )
+        os.remove(constraints_path)
+        problems = fsck(self.path, repair=True)
+        self.assertEqual(len(problems), 1)
+        self.assertEqual(problems[0].repaired, False)
+        self.assertEqual(os.path.exists(constraints_path), False)
+
+    def test_parallel(self):
+        self.addCleanup(
+            setattr,
+            fsck_module,
+            "PARALLEL_THRESHOLD",
+            fsck_module.PARALLEL_THRESHOLD,
+        )
+        fsck_module.PARALLEL_THRESHOLD = 0
+        os.remove(os.path.join(self.josh.path, "in-edges", "0"))
+        os.remove(os.path.join(self.marko.path, "out-edges", "0"))
+        self.assertEqual(len(fsck(self.path, repair=True, jobs=2)), 2)
+        self.assertEqual(fsck(self.path, jobs=2), [])
+
+    def test_main(self):
+        self.addCleanup(setattr, sys, "stdout", sys.stdout)
+        sys.stdout = open(os.devnull, "w")
+        self.addCleanup(sys.stdout.close)
+
+        self.assertEqual(main([self.path]), 0)
+        os.remove(os.path.join(self.josh.path, "in-edges", "0"))
+        self.assertEqual(main([self.path]), 1)
+        self.assertEqual(main(["--repair", self.path]), 0)
+        self.assertEqual(main([self.path]), 0)
+
+    def test_main_with_open_graph(self):
+        self.addCleanup(setattr, sys, "stderr", sys.stderr)
+        sys.stderr = open(os.devnull, "w")
+        self.addCleanup(sys.stderr.close)
+
+        lock = DirectoryLock(self.path)
+        lock.acquire()
+        self.addCleanup(lock.release)
+        self.assertEqual(main([self.path]), 2)
@@ -1,7 +1,12 @@
 # pylint: disable=missing-docstring
+# pylint: disable=protected-access
+import json
 import os.path
 import os
+import socket
 import tempfile
+import threading
+import time
 import unittest
 from ruruki import interfaces
 from ruruki import locks
@@ -194,3 +199,124 @@ class TestDirectoryLock(unittest.TestCase):
             os.path.isfile(lock.filename),
             False,
         )
+
+
+class TestDirectoryLockHeld(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.lock = locks.DirectoryLock(self.path)
+
+    def tearDown(self):
+        if self.lock.locked is True:
+            self.lock.release()
+
+    def test_not_held(self):
+        self.assertEqual(self.lock.is_held(), False)
+        # checking never creates the lock files.
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_held(self):
+        self.lock.acquire()
+        self.assertEqual(self.lock.is_held(), True)
+        self.assertEqual(locks.DirectoryLock(self.path).is_held(), True)
+
+        self.lock.release()
+        self.assertEqual(locks.DirectoryLock(self.path).is_held(), False)
+
+    @unittest.skipIf(os.name == "nt", "Windows has no shared locks")
+    def test_check_does_not_exclude_holder(self):
+        # a reader checking the lock at the same time as it is acquired.
+        self.lock.acquire()
+        self.lock.release()
+        probe = locks.FileLock(self.lock.active_filename, shared=True)
+        probe.acquire()
+        threading.Timer(0.05, probe.release).start()
+
+        self.lock.acquire()
+        self.assertEqual(self.lock.locked, True)
+
+
+@unittest.skipIf(os.name == "nt", "Windows locks are not per file object")
+class TestLockOwnership(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.lock = locks.DirectoryLock(self.path)
+        self.addCleanup(self.release, self.lock)
+
+    @staticmethod
+    def release(lock):
+        if lock.locked is True:
+            lock.release()
+
+    def test_owner(self):
+        self.assertEqual(self.lock.owner(), None)
+        self.lock.acquire()
+        owner = self.lock.owner()
+        self.assertEqual(owner["pid"], os.getpid())
+        self.assertEqual(owner["host"], socket.gethostname())
+        self.assertEqual(self.lock.stale_owner, None)
+
+    def test_stale_owner(self):
+        stale = {"pid": 0, "host": "crashed", "time": 0}
+        with open(self.lock.filename, "w") as lock_fh:
+            json.dump(stale, lock_fh)
+        self.lock.acquire()
+        self.assertEqual(self.lock.stale_owner, stale)
+        self.assertEqual(self.lock.owner()["pid"], os.getpid())
+
+    def test_error_names_owner(self):
+        self.lock.acquire()
+        try:
+            locks.DirectoryLock(self.path).acquire()
+        except interfaces.AcquireError as error:
+            self.assertIn("process {0}".format(os.getpid()), str(error))
+        else:
+            self.fail("AcquireError not raised")
+
+    def test_timeout(self):
+        self.lock.acquire()
+        other = locks.DirectoryLock(self.path, timeout=0.05)
+        start = time.time()
+        self.assertRaises(interfaces.AcquireError, other.acquire)
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+    def test_timeout_waits_for_release(self):
+        self.lock.acquire()
+        timer = threading.Timer(0.05, self.lock.release)
+        timer.start()
+        self.addCleanup(timer.join)
+
+        other = locks.DirectoryLock(self.path, timeout=5)
+        other.acquire()
+        self.addCleanup(self.release, other)
+        self.assertEqual(other.locked, True)
+        self.assertEqual(os.path.isfile(other.filename), True)
+
+        # the lock file removed by the previous holder is not locked.
+        self.assertRaises(
+            interfaces.AcquireError,
+            locks.DirectoryLock(self.path).acquire,
+        )
+
+    def test_removed_lock_file(self):
+        lock = locks.FileLock(self.lock.filename, timeout=1)
+        self.addCleanup(self.release, lock)
+        flock = locks.fcntl.flock
+        calls = []
+
+        def replace_then_flock(handle, operation):
+            # the previous holder removes the file after it was opened.
+            if not calls:
+                os.remove(lock.filename)
+                open(lock.filename, "w").close()
+            calls.append(operation)
+            return flock(handle, operation)
+
+        self.addCleanup(setattr, locks.fcntl, "flock", flock)
+        locks.fcntl.flock = replace_then_flock
+        lock.acquire()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(
+            os.fstat(lock._fd.fileno()).st_ino,
+            os.stat(lock.filename).st_ino,
+        )
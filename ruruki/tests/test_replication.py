@@ -0,0 +1,303 @@
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from ruruki import interfaces
+from ruruki.graphs import PersistentGraph
+from ruruki.locks import DirectoryLock
+from ruruki.replica import ReplicaGraph
+from ruruki.replication import LogShipper, LogTailer, snapshot_records
+
+
+class TestLogShipper(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, "replication.log")
+        self.shipper = LogShipper(self.filename)
+        self.addCleanup(self.shipper.close)
+        self.tailer = LogTailer(self.filename)
+        self.addCleanup(self.tailer.close)
+
+    def test_ship(self):
+        self.shipper.start([{"op": "a"}])
+        self.shipper.ship({"op": "b"})
+        entries = self.tailer.read()
+        self.assertEqual(
+            [each.get("snapshot") for each in entries],
+            ["begin", None, "end", None],
+        )
+        self.assertEqual(entries[1], {"record": {"op": "a"}})
+        self.assertEqual(entries[3]["seq"], 1)
+        self.assertEqual(entries[3]["record"], {"op": "b"})
+        self.assertEqual(self.tailer.read(), [])
+
+    def test_read_ignores_partial_line(self):
+        self.shipper.start([])
+        self.tailer.read()
+        with open(self.filename, "a") as log_fh:
+            log_fh.write('{"seq": 1, ')
+        self.assertEqual(self.tailer.read(), [])
+        self.assertEqual(self.tailer.pending_bytes(), 11)
+
+        with open(self.filename, "a") as log_fh:
+            log_fh.write('"record": {}}\n')
+        self.assertEqual(self.tailer.read(), [{"seq": 1, "record": {}}])
+        self.assertEqual(self.tailer.pending_bytes(), 0)
+
+    def test_read_follows_new_log(self):
+        self.shipper.start([])
+        self.tailer.read()
+        self.shipper.ship({"op": "a"})
+        self.shipper.start([])
+        self.shipper.ship({"op": "b"})
+
+        entries = self.tailer.read()
+        self.assertEqual(
+            [each.get("record") for each in entries],
+            [{"op": "a"}, None, None, {"op": "b"}],
+        )
+        self.assertEqual(entries[1]["seq"], 1)
+
+    def test_oldest_pending_time(self):
+        self.assertEqual(self.tailer.oldest_pending_time(), None)
+        self.shipper.start([{"op": "a"}])
+        begin = self.tailer.oldest_pending_time()
+        self.assertIsNotNone(begin)
+
+        self.tailer.read()
+        self.assertEqual(self.tailer.oldest_pending_time(), None)
+        self.shipper.ship({"op": "b"})
+        self.shipper.ship({"op": "c"})
+        shipped = self.tailer.oldest_pending_time()
+        self.assertGreaterEqual(shipped, begin)
+        self.assertEqual(
+            shipped,
+            [each["time"] for each in self.tailer.read()][0],
+        )
+
+        # the first entry of a new log once the old log has been read.
+        self.shipper.start([])
+        self.assertGreaterEqual(self.tailer.oldest_pending_time(), shipped)
+
+    def test_is_full(self):
+        self.shipper.max_size = 200
+        self.shipper.start([])
+        self.assertEqual(self.shipper.is_full(), False)
+        self.shipper.ship({"op": "a" * 200})
+        self.assertEqual(self.shipper.is_full(), True)
+
+
+class TestReplicaGraph(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.leader = PersistentGraph(self.path, replication=True)
+        self.addCleanup(lambda: self.leader.close())
+        self.leader.add_vertex_constraint("person", "name")
+        self.marko = self.leader.add_vertex("person", name="Marko")
+        self.josh = self.leader.add_vertex("person", name="Josh")
+        self.leader.add_edge(self.marko, "knows", self.josh, since=2010)
+
+    def create_replica(self):
+        replica = ReplicaGraph(self.path)
+        self.addCleanup(replica.close)
+        return replica
+
+    def assertReplicated(self, replica):  # pylint: disable=invalid-name
+        self.assertEqual(
+            sorted(
+                (each.ident, each.label, each.properties)
+                for each in replica.vertices
+            ),
+            sorted(
+                (each.ident, each.label, each.properties)
+                for each in self.leader.vertices
+            ),
+        )
+        self.assertEqual(
+            sorted(
+                (each.ident, each.head.ident, each.label, each.tail.ident,
+                 each.properties)
+                for each in replica.edges
+            ),
+            sorted(
+                (each.ident, each.head.ident, each.label, each.tail.ident,
+                 each.properties)
+                for each in self.leader.edges
+            ),
+        )
+        self.assertEqual(
+            replica.get_vertex_constraints(),
+            self.leader.get_vertex_constraints(),
+        )
+
+    def test_replica_reads_leader(self):
+        replica = self.create_replica()
+        self.assertReplicated(replica)
+        self.assertEqual(replica.seq, 4)
+        self.assertEqual(
+            replica.get_vertices("person", name="Josh").all()[0].ident,
+            self.josh.ident,
+        )
+
+    def test_poll(self):
+        replica = self.create_replica()
+        peter = self.leader.add_vertex("person", name="Peter")
+        self.leader.add_edge(self.josh, "knows", peter)
+        self.leader.set_property(self.marko, age=29)
+        self.leader.remove_edge(self.leader.get_edge(0))
+        self.assertEqual(replica.poll(), 4)
+        self.assertReplicated(replica)
+        self.assertEqual(replica.poll(), 0)
+
+    def test_poll_property_changes(self):
+        self.leader.options = self.leader.options._replace(
+            incremental_properties=True
+        )
+        replica = self.create_replica()
+        self.leader.set_property(self.marko, age=29)
+        self.leader.remove_edge(self.leader.get_edge(0))
+        self.leader.remove_vertex(self.josh)
+        replica.poll()
+        self.assertReplicated(replica)
+
+    def test_up_to_date_skips_new_log(self):
+        self.leader._shipper.max_size = 0
+        replica = self.create_replica()
+        vertices = list(replica.vertices)
+
+        self.leader.add_vertex("person", name="Peter")
+        self.assertEqual(replica.poll(), 1)
+        self.assertReplicated(replica)
+        # the replica was not rebuilt from the new snapshot.
+        self.assertEqual(
+            [replica.get_vertex(each.ident) is each for each in vertices],
+            [True, True],
+        )
+
+    def test_behind_rebuilds_new_log(self):
+        replica = self.create_replica()
+        self.leader._shipper.max_size = 0
+        self.leader.add_vertex("person", name="Peter")
+        self.leader.add_vertex("person", name="Sam")
+        replica.poll()
+        self.assertReplicated(replica)
+
+    def test_rebuild_on_leader_reopen(self):
+        replica = self.create_replica()
+        self.leader.close()
+        self.leader = PersistentGraph(self.path, replication=True)
+        self.leader.add_vertex("person", name="Peter")
+        replica.poll()
+        self.assertEqual(replica.seq, 1)
+        self.assertReplicated(replica)
+
+    def test_replica_before_log(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        replica = ReplicaGraph(path)
+        self.assertEqual(replica.seq, None)
+        self.assertEqual(len(replica.vertices), 0)
+        self.assertEqual(replica.replication_lag, 0.0)
+
+    def test_read_only(self):
+        replica = self.create_replica()
+        vertex = replica.get_vertex(0)
+        for func, args in [
+                (replica.add_vertex, ("person",)),
+                (replica.add_edge, (vertex, "knows", vertex)),
+                (replica.add_vertex_constraint, ("person", "age")),
+                (replica.set_property, (vertex,)),
+                (replica.remove_edge, (replica.get_edge(0),)),
+                (replica.remove_vertex, (vertex,)),
+                (replica.get_or_create_vertex, ("dog",)),
+        ]:
+            self.assertRaises(interfaces.DatabaseReadOnly, func, *args)
+        self.assertReplicated(replica)
+
+    def test_replication_lag(self):
+        replica = self.create_replica()
+        self.assertEqual(replica.replication_lag, 0.0)
+        self.leader.add_vertex("person", name="Peter")
+        time.sleep(0.01)
+        self.assertGreater(replica.replication_lag, 0.0)
+        replica.poll()
+        self.assertEqual(replica.replication_lag, 0.0)
+
+    def test_lag_after_idle_leader(self):
+        replica = self.create_replica()
+        self.leader.add_vertex("person", name="Peter")
+        replica.poll()
+        time.sleep(0.2)
+
+        # the lag is measured from the change not applied yet, not from the
+        # last change which was.
+        self.leader.add_vertex("person", name="Sam")
+        self.assertLess(replica.replication_lag, 0.2)
+
+    def test_rebuild_swaps_graph(self):
+        replica = self.create_replica()
+        vertices = replica.vertices
+        self.leader.close()
+        self.leader = PersistentGraph(self.path, replication=True)
+
+        # the snapshot is built aside while the replica keeps its graph.
+        entries = replica._tailer.read()
+        self.assertEqual(entries[0]["snapshot"], "begin")
+        replica._applier = threading.current_thread()
+        for entry in entries[:-1]:
+            replica._apply_entry(entry)
+        self.assertIs(replica.vertices, vertices)
+        self.assertEqual(len(replica.vertices), 2)
+
+        replica._apply_entry(entries[-1])
+        self.assertIsNot(replica.vertices, vertices)
+        self.assertEqual(
+            set(each.graph for each in replica.vertices),
+            set([replica]),
+        )
+        self.assertReplicated(replica)
+
+    def test_load_raises(self):
+        replica = self.create_replica()
+        replica._applier = threading.current_thread()
+        self.assertRaises(
+            interfaces.DatabaseReadOnly,
+            replica.load,
+            io.StringIO(u"{}"),
+        )
+
+    def test_background_polling(self):
+        replica = self.create_replica()
+        replica.start(interval=0.001)
+        self.leader.add_vertex("person", name="Peter")
+        deadline = time.time() + 5
+        while replica.seq != 5 and time.time() < deadline:
+            time.sleep(0.001)
+        replica.stop()
+        self.assertReplicated(replica)
+
+    def test_leader_keeps_the_lock(self):
+        self.create_replica()
+        self.assertRaises(
+            interfaces.AcquireError,
+            DirectoryLock(self.path).acquire,
+        )
+
+    def test_snapshot_records(self):
+        records = list(snapshot_records(self.leader))
+        self.assertEqual(
+            [each["op"] for each in records],
+            ["constraints", "add_vertex", "add_vertex", "add_edge"],
+        )
+        self.assertEqual(
+            records[0]["constraints"],
+            [{"label": "person", "key": "name"}],
+        )
+        self.assertEqual(records[3]["properties"], {"since": 2010})
@@ -0,0 +1,341 @@
+# pylint: disable=missing-docstring
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from ruruki import interfaces, journal
+from ruruki.journal import ChangedPaths, Journal, read_records
+from ruruki.writers import WriteBehindWriter
+
+
+class TestWriteBehindWriter(unittest.TestCase):
+    def setUp(self):
+        self.applied = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.writer = self.create_writer()
+
+    def tearDown(self):
+        self.gate.set()
+        try:
+            self.writer.close()
+        except interfaces.DatabaseException:
+            pass
+
+    def create_writer(self):
+        return WriteBehindWriter(self.apply)
+
+    def apply(self, record):
+        if record.get("block") is True:
+            self.started.set()
+            self.gate.wait()
+            return
+        if record.get("fail") is True:
+            raise IOError("disk on fire")
+        self.applied.append(record["value"])
+
+    def block(self):
+        # keep the background thread busy until the gate is opened, so
+        # that the following submits stay queued.
+        self.writer.submit(None, {"block": True})
+        self.started.wait()
+
+    def test_submit_applies_in_order(self):
+        for each in range(5):
+            self.writer.submit(None, {"value": each})
+        self.writer.flush()
+        self.assertEqual(self.applied, [0, 1, 2, 3, 4])
+
+    def test_submit_coalesces_same_key(self):
+        self.block()
+        self.writer.submit("a", {"value": "a1"})
+        self.writer.submit("b", {"value": "b1"})
+        self.writer.submit("a", {"value": "a2"})
+        self.assertEqual(len(self.writer), 2)
+
+        self.gate.set()
+        self.writer.flush()
+        self.assertEqual(self.applied, ["a2", "b1"])
+
+    def test_pending(self):
+        self.block()
+        self.writer.submit("a", {"value": "a1"})
+        self.assertEqual(self.writer.pending("a"), {"value": "a1"})
+        self.assertEqual(self.writer.pending("b"), None)
+
+    def test_discard(self):
+        self.block()
+        self.writer.submit("a", {"value": "a1"})
+        self.writer.discard("a")
+        self.writer.discard("unknown")
+
+        self.gate.set()
+        self.writer.flush()
+        self.assertEqual(self.applied, [])
+
+    def test_flush_raises_failure(self):
+        self.writer.submit(None, {"fail": True})
+        self.writer.submit(None, {"value": 1})
+        self.assertRaises(
+            interfaces.DatabaseException,
+            self.writer.flush,
+        )
+
+        # the error is only reported once and the writer keeps going.
+        self.assertEqual(self.applied, [1])
+        self.writer.flush()
+
+    def test_submit_after_close(self):
+        self.writer.close()
+        self.assertRaises(
+            interfaces.DatabaseException,
+            self.writer.submit,
+            None,
+            {"value": 1},
+        )
+
+
+class RecordingJournal(Journal):
+    def __init__(self, filename):
+        super(RecordingJournal, self).__init__(filename)
+        self.groups = []
+        self.broken = False
+
+    def write(self, records):
+        if self.broken is True:
+            raise IOError("journal on fire")
+        self.groups.append([each.get("value") for each in records])
+        super(RecordingJournal, self).write(records)
+
+
+class TestGroupCommitWriter(TestWriteBehindWriter):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.tmpdir, "journal.log")
+        self.journal = RecordingJournal(self.journal_path)
+        super(TestGroupCommitWriter, self).setUp()
+
+    def tearDown(self):
+        super(TestGroupCommitWriter, self).tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def create_writer(self):
+        return WriteBehindWriter(
+            self.apply,
+            journal=self.journal,
+            commit_interval=0.05,
+            commit_size=3,
+        )
+
+    def test_commit_size_limits_group(self):
+        self.block()
+        for each in range(5):
+            self.writer.submit(None, {"value": each})
+
+        self.gate.set()
+        self.writer.flush()
+        self.assertEqual(self.applied, [0, 1, 2, 3, 4])
+        self.assertEqual(self.journal.groups, [[None], [0, 1, 2], [3, 4]])
+
+    def test_commit_interval_groups(self):
+        self.writer.close()
+        self.journal = RecordingJournal(self.journal_path)
+        self.writer = WriteBehindWriter(
+            self.apply,
+            journal=self.journal,
+            commit_interval=60,
+            commit_size=3,
+        )
+        self.writer.submit(None, {"value": 1})
+        self.writer.submit(None, {"value": 2})
+
+        # flush commits the group without waiting for the interval.
+        self.writer.flush()
+        self.assertEqual(self.journal.groups, [[1, 2]])
+
+    def test_journal_before_applying(self):
+        self.writer.submit(None, {"value": 1})
+        self.writer.submit(None, {"value": 2})
+        self.writer.flush()
+        self.assertEqual(self.applied, [1, 2])
+        self.assertEqual(
+            list(read_records(self.journal_path)),
+            [{"value": 1}, {"value": 2}],
+        )
+
+    def test_checkpoint_on_growth(self):
+        self.journal.max_size = 0
+        self.writer.submit(None, {"value": 1})
+        self.writer.flush()
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+
+    def test_close_checkpoints_journal(self):
+        self.writer.submit(None, {"value": 1})
+        self.writer.close()
+        self.assertEqual(self.applied, [1])
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+
+    def test_flush_raises_failure(self):
+        self.writer.submit(None, {"fail": True})
+        self.assertRaises(interfaces.DatabaseException, self.writer.flush)
+
+        # the writer stops, as the later records can only be applied after
+        # the failed one has been recovered from the journal.
+        self.assertRaises(interfaces.DatabaseException, self.writer.flush)
+        self.assertRaises(
+            interfaces.DatabaseException,
+            self.writer.submit,
+            None,
+            {"value": 1},
+        )
+        self.assertEqual(self.applied, [])
+
+    def test_failed_commit_not_applied(self):
+        self.journal.broken = True
+        self.writer.submit(None, {"value": 1})
+        self.assertRaises(interfaces.DatabaseException, self.writer.flush)
+        self.assertEqual(self.applied, [])
+
+        self.journal.broken = False
+        self.assertRaises(interfaces.DatabaseException, self.writer.flush)
+        self.assertRaises(interfaces.DatabaseException, self.writer.check)
+        self.assertRaises(
+            interfaces.DatabaseException,
+            self.writer.submit,
+            None,
+            {"value": 2},
+        )
+        self.assertEqual(self.journal.groups, [])
+
+    def test_failed_commit_drops_queue(self):
+        self.block()
+        self.journal.broken = True
+        self.writer.submit(None, {"value": 1})
+        self.writer.submit(None, {"value": 2})
+        self.writer.submit(None, {"value": 3})
+        self.writer.submit(None, {"value": 4})
+
+        self.gate.set()
+        self.assertRaises(interfaces.DatabaseException, self.writer.flush)
+        self.assertEqual(len(self.writer), 0)
+        self.assertEqual(self.applied, [])
+
+    def test_failed_apply_kept(self):
+        self.journal.max_size = 0
+        self.block()
+        self.writer.submit(None, {"fail": True})
+        self.writer.submit(None, {"value": 1})
+        self.gate.set()
+        self.assertRaises(interfaces.DatabaseException, self.writer.close)
+
+        # the failed group is left in the journal to be recovered.
+        self.assertEqual(self.applied, [])
+        self.assertEqual(
+            list(read_records(self.journal_path)),
+            [{"fail": True}, {"value": 1}],
+        )
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.tmpdir, "journal.log")
+        self.journal = Journal(self.journal_path)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_and_read_records(self):
+        self.journal.write([{"op": "a"}, {"op": "b"}])
+        self.journal.write([{"op": "c"}])
+        self.assertEqual(
+            list(read_records(self.journal_path)),
+            [{"op": "a"}, {"op": "b"}, {"op": "c"}],
+        )
+        self.assertEqual(
+            self.journal.size(),
+            os.path.getsize(self.journal_path),
+        )
+
+    def test_read_ignores_torn_write(self):
+        self.journal.write([{"op": "a"}])
+        with open(self.journal_path, "a") as journal_fh:
+            journal_fh.write('{"op": "b"')
+        self.assertEqual(
+            list(read_records(self.journal_path)),
+            [{"op": "a"}],
+        )
+
+    def test_read_stops_at_corruption(self):
+        with open(self.journal_path, "a") as journal_fh:
+            journal_fh.write('{"op": "a"}\nnot json\n{"op": "c"}\n')
+        self.assertEqual(
+            list(read_records(self.journal_path)),
+            [{"op": "a"}],
+        )
+
+    def test_checkpoint_without_sync(self):
+        self.addCleanup(
+            setattr, journal, "SYNC_DIRECTORIES", journal.SYNC_DIRECTORIES
+        )
+        journal.SYNC_DIRECTORIES = False
+        self.journal.changed = ChangedPaths()
+        self.journal.write([{"op": "a"}])
+        self.assertEqual(self.journal.checkpoint(), False)
+        self.assertEqual(
+            list(read_records(self.journal_path)),
+            [{"op": "a"}],
+        )
+
+    def test_is_full(self):
+        self.journal.max_size = 1
+        self.assertEqual(self.journal.is_full(), False)
+        self.journal.write([{"op": "a"}])
+        self.assertEqual(self.journal.is_full(), True)
+
+    def test_checkpoint(self):
+        self.journal.write([{"op": "a"}])
+        self.assertEqual(self.journal.checkpoint(), True)
+        self.assertEqual(self.journal.size(), 0)
+        self.journal.write([{"op": "b"}])
+        self.assertEqual(
+            list(read_records(self.journal_path)),
+            [{"op": "b"}],
+        )
+
+
+class TestChangedPaths(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.changed = ChangedPaths()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_add_parents(self):
+        path = os.path.join(self.tmpdir, "a", "b", "c")
+        self.changed.add(path, parents=2)
+        self.assertEqual(len(self.changed), 3)
+        self.changed.add(os.path.join(self.tmpdir, "a", "b"))
+        self.assertEqual(len(self.changed), 3)
+        self.changed.add(os.path.join(self.tmpdir, "d"))
+        self.assertEqual(len(self.changed), 5)
+
+    def test_sync(self):
+        filename = os.path.join(self.tmpdir, "properties.json")
+        with open(filename, "w") as prop_fh:
+            prop_fh.write("{}")
+        self.changed.add(filename)
+        # paths removed since they were changed are skipped.
+        self.changed.add(os.path.join(self.tmpdir, "removed"))
+        self.assertEqual(self.changed.sync(), journal.SYNC_DIRECTORIES)
+        self.assertEqual(len(self.changed), 0)
+
+    def test_sync_when_full(self):
+        self.changed.max_size = 2
+        self.changed.add(os.path.join(self.tmpdir, "a"))
+        self.assertEqual(len(self.changed), 2)
+        self.changed.add(os.path.join(self.tmpdir, "b"))
+        self.assertEqual(len(self.changed), 0)
@@ -0,0 +1,370 @@
+"""
+Background writers used by the persistent graphs.
+"""
+from collections import OrderedDict
+import logging
+import threading
+import time
+from ruruki import interfaces
+
+
+class _RecordQueue(object):
+    """
+    Queue of the records waiting to be applied, shared between the threads
+    submitting the records and the background thread applying them.
+
+    :param commit_interval: Seconds to wait for more records before taking
+        a group off the queue.
+    :type commit_interval: :class:`float`
+    :param commit_size: Maximum number of records in a group.
+    :type commit_size: :class:`int`
+    """
+
+    def __init__(self, commit_interval, commit_size):
+        self.commit_interval = commit_interval
+        self.commit_size = commit_size
+        self.closed = False
+        self._condition = threading.Condition()
+        self._pending = OrderedDict()
+        self._inflight = {}
+        self._flushing = 0
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
+
+    def put(self, key, record):
+        """
+        Queue a record, replacing the pending record with the same key.
+
+        :param key: Key used to coalesce records.
+        :type key: hashable
+        :param record: Mutation record.
+        :type record: :class:`dict`
+        :raises DatabaseException: If the queue has been closed.
+        """
+        with self._condition:
+            if self.closed is True:
+                raise interfaces.DatabaseException(
+                    "Can not submit to a closed writer."
+                )
+            self._pending[key] = record
+            self._condition.notify_all()
+
+    def get(self, key):
+        """
+        Return the queued or in flight record with the given key.
+
+        :param key: Key that the record was queued with.
+        :type key: hashable
+        :returns: The record or :obj:`None` if there is no such record.
+        :rtype: :class:`dict` or :obj:`None`
+        """
+        with self._condition:
+            record = self._pending.get(key)
+            if record is None:
+                record = self._inflight.get(key)
+            return record
+
+    def discard(self, key):
+        """
+        Drop the queued record with the given key if there is one.
+
+        :param key: Key that the record was queued with.
+        :type key: hashable
+        """
+        with self._condition:
+            self._pending.pop(key, None)
+
+    def clear(self):
+        """
+        Drop all the queued records.
+        """
+        with self._condition:
+            self._pending.clear()
+            self._condition.notify_all()
+
+    def take(self):
+        """
+        Wait for and take the next group of records off the queue.
+
+        :returns: Records to commit and apply, or :obj:`None` if the queue
+            has been closed.
+        :rtype: :class:`list` of :class:`dict` or :obj:`None`
+        """
+        with self._condition:
+            while not self._pending and self.closed is False:
+                self._condition.wait()
+            if not self._pending:
+                return None
+
+            if self.commit_interval:
+                deadline = time.time() + self.commit_interval
+                while (len(self._pending) < self.commit_size and
+                       not self._flushing and self.closed is False):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+            group = []
+            while self._pending and len(group) < self.commit_size:
+                key, record = self._pending.popitem(last=False)
+                self._inflight[key] = record
+                group.append(record)
+            return group
+
+    def task_done(self):
+        """
+        Mark the group taken off the queue as done.
+        """
+        with self._condition:
+            self._inflight.clear()
+            self._condition.notify_all()
+
+    def join(self):
+        """
+        Block until the queue is empty and no group is in flight. Any group
+        being gathered is taken straight away instead of waiting for the
+        rest of the commit interval.
+        """
+        with self._condition:
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                while self._pending or self._inflight:
+                    self._condition.wait()
+            finally:
+                self._flushing -= 1
+
+    def close(self):
+        """
+        Stop accepting records, and wake up the background thread.
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class WriteBehindWriter(object):
+    """
+    Write-behind writer which applies queued mutation records on a
+    background thread in the order that they were submitted.
+
+    Records submitted with a key replace a pending record with the same key
+    while keeping its place in the queue, so repeated writes to the same
+    entity are coalesced into a single write.
+
+    With a journal, records are applied in groups. The writer gathers
+    records for up to ``commit_interval`` seconds or until it has
+    ``commit_size`` records, appends the group to the journal with one
+    durable write, and only then applies the records. A record is durable
+    once its group has been committed, and :meth:`flush` returns only once
+    every record submitted before it has been committed and applied. Once a
+    group fails to be committed, or a record of a committed group fails to
+    be applied, the writer stops: the records still queued are dropped, and
+    :meth:`submit` and :meth:`flush` raise until the writer is replaced.
+    Later records are never made durable ahead of the failed ones, and the
+    journal is left as it is, so that the committed records are applied
+    again when the journal is recovered. The journal is checkpointed once
+    it is full, see :meth:`~.Journal.is_full`.
+
+    :param apply: Callable which applies a single record.
+    :type apply: callable
+    :param journal: Journal that groups of records are committed to before
+        they are applied, or :obj:`None` to apply them straight away.
+    :type journal: :class:`~.Journal` or :obj:`None`
+    :param commit_interval: Seconds to wait for more records before
+        committing a group.
+    :type commit_interval: :class:`float`
+    :param commit_size: Maximum number of records in a group.
+    :type commit_size: :class:`int`
+    """
+
+    def __init__(self, apply, journal=None, commit_interval=0, commit_size=1):
+        self.apply = apply
+        self.journal = journal
+        self._queue = _RecordQueue(commit_interval, commit_size)
+        self._lock = threading.Lock()
+        self._error = None
+        self._failed = None
+        self._thread = threading.Thread(
+            target=self._run,
+            name="ruruki-write-behind",
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def submit(self, key, record):
+        """
+        Queue a record to be applied by the background thread.
+
+        :param key: Key used to coalesce records, or :obj:`None` if the
+            record should never be coalesced.
+        :type key: hashable or :obj:`None`
+        :param record: Mutation record.
+        :type record: :class:`dict`
+        :raises DatabaseException: If the writer has been closed, or has
+            stopped because a group of records failed.
+        """
+        self.check()
+        if key is None:
+            key = object()
+        self._queue.put(key, record)
+
+    def check(self):
+        """
+        Check that the writer still accepts records.
+
+        :raises DatabaseException: If the writer has been closed, or has
+            stopped because a group of records failed.
+        """
+        with self._lock:
+            failed = self._failed
+        if failed is not None:
+            raise interfaces.DatabaseException(
+                "Write-behind writer stopped after a failure: "
+                "{0}".format(failed)
+            )
+        if self._queue.closed is True:
+            raise interfaces.DatabaseException(
+                "Can not submit to a closed writer."
+            )
+
+    def pending(self, key):
+        """
+        Return the pending record with the given key.
+
+        :param key: Key that the record was submitted with.
+        :type key: hashable
+        :returns: The pending record or :obj:`None` if there is no pending
+            record with the key. Records which are being committed or
+            applied are still pending.
+        :rtype: :class:`dict` or :obj:`None`
+        """
+        return self._queue.get(key)
+
+    def discard(self, key):
+        """
+        Drop the pending record with the given key if there is one.
+
+        :param key: Key that the record was submitted with.
+        :type key: hashable
+        """
+        self._queue.discard(key)
+
+    def flush(self):
+        """
+        Block until all the queued records have been committed and applied.
+        Any group being gathered is committed straight away instead of
+        waiting for the rest of the commit interval.
+
+        :raises DatabaseException: If a record failed since the last flush,
+            or the writer has stopped because a group of records failed.
+        """
+        self._queue.join()
+        with self._lock:
+            error, self._error = self._error, None
+            if error is None:
+                error = self._failed
+
+        if error is not None:
+            raise interfaces.DatabaseException(
+                "Write-behind operation failed: {0}".format(error)
+            )
+
+    def close(self):
+        """
+        Flush the queued records, checkpoint the journal and stop the
+        background thread. Closing a closed writer does nothing.
+
+        :raises DatabaseException: If a record failed since the last flush,
+            or the writer has stopped because a group of records failed.
+        """
+        if self._queue.closed is True:
+            return
+
+        try:
+            self.flush()
+        finally:
+            self._queue.close()
+            self._thread.join()
+            if self.journal is not None:
+                if self._failed is None:
+                    self.journal.checkpoint()
+                self.journal.close()
+
+    def _fail(self, error, stop=False):
+        """
+        Log and keep the first error to be reported by :meth:`flush`.
+
+        :param error: Error raised by a background operation.
+        :type error: :class:`Exception`
+        :param stop: If True, stop the writer and drop the queued records.
+        :type stop: :class:`bool`
+        """
+        logging.exception("Write-behind operation failed.")
+        with self._lock:
+            if self._error is None:
+                self._error = error
+            if stop is True and self._failed is None:
+                self._failed = error
+        if stop is True:
+            self._queue.clear()
+
+    def _commit(self, group):
+        """
+        Commit a group of records to the journal, apply them and checkpoint
+        the journal if it is full.
+
+        :param group: Records to commit and apply.
+        :type group: :class:`list` of :class:`dict`
+        """
+        with self._lock:
+            if self._failed is not None:
+                # records submitted while the writer was stopping are
+                # dropped with the rest of the queue.
+                return
+
+        if self.journal is not None:
+            try:
+                self.journal.write(group)
+            except Exception as error:  # pylint: disable=broad-except
+                # applying or committing records after a group which is not
+                # in the journal would make changes out of order.
+                self._fail(error, stop=True)
+                return
+
+        for record in group:
+            try:
+                self.apply(record)
+            except Exception as error:  # pylint: disable=broad-except
+                # without a journal the failed record is lost, with one the
+                # rest of the journal has to be applied after it.
+                self._fail(error, stop=self.journal is not None)
+                if self.journal is not None:
+                    return
+
+        if self.journal is not None:
+            try:
+                if self.journal.is_full():
+                    self.journal.checkpoint()
+            except Exception as error:  # pylint: disable=broad-except
+                self._fail(error)
+
+    def _run(self):
+        """
+        Background thread loop committing and applying the queued records.
+        """
+        while True:
+            group = self._queue.take()
+            if group is None:
+                return
+
+            try:
+                self._commit(group)
+            finally:
+                self._queue.task_done()
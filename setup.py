@@ -62,4 +62,7 @@ auto_version_setup(
     install_requires=[
         "Parsley==1.3"
     ],
+    extras_require={
+        "numpy": ["numpy"],
+    },
 )